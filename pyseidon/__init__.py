@@ -22,6 +22,7 @@ from tidegaugeClass import *
 from validationClass import *
 from stationClass import *
 from utilities import *
+from regioner import load_regions
 
 #Permission info for OpenDap server
 #print "OpenDap server connexion info:"
@@ -30,7 +31,7 @@ __version__ = '1.1'
 #__all__ = ["FVCOM", "ADCP", "Drifter", "TideGauge",\
 #          "Validation", "Station", "utilities" ]
 __all__ = ["FVCOM", "ADCP", "TideGauge",\
-          "Validation", "Station", "utilities" ]
+          "Validation", "Station", "utilities", "load_regions" ]
 __authors__ = ['Wesley Bowman, Thomas Roc, Jonathan Smith']
 __licence__ = 'GNU Affero GPL v3.0'
 __copyright__ = 'Copyright (c) 2014 EcoEnergyII'
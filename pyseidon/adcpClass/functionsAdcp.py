@@ -82,7 +82,7 @@ class FunctionsAdcp:
         #Rose diagram
         self._plot.rose_diagram(dirFlow, norm)
         if exceedance:
-            self.exceedance(norm)
+            self.exceedance(norm, time_ind=argtime)
 
         return dirFlow, norm
 
@@ -195,58 +195,52 @@ class FunctionsAdcp:
 
         return floodIndex, ebbIndex, pr_axis, pr_ax_var
 
-    def exceedance(self, var, debug=False):
+    def exceedance(self, var, time_ind=[], bins=30, chunk=[], graph=True,
+                   debug=False):
         """
         This function calculate the excedence curve of a var(time).
 
         Inputs:
         ------
-          - var = given quantity, 1 array of n elements
+          - var = given quantity, 1 array of n elements,
+                  or 2D array (time, n) for n curves at once
 
         Keywords:
         --------
+          - time_ind = time indices of var samples, list of integers.
+                       By default var covers the whole time period
+          - bins = number of amplitude bins, integer, or amplitudes, 1D array
+          - chunk = number of time steps processed at once, integer
           - graph: True->plots curve; False->does not
 
         Outputs:
         -------
-          - Exceedance = list of % of occurences, 1D array
+          - Exceedance = list of % of occurences, 1D array,
+                         or 2D array (nbins, n)
           - Ranges = list of signal amplitude bins, 1D array
 
         Notes:
         -----
           - This method is not suitable for SSE
+          - Time steps can be irregular
         """
         debug = (debug or self._debug)
         if debug:
             print 'Computing exceedance...'
 
-        signal=var
-        
-        Max = max(signal)	
-        dy = (Max/30.0)
-        Ranges = np.arange(0,(Max + dy), dy)
-        Exceedance = np.zeros(Ranges.shape[0])
-        dt = self._var.matlabTime[1] - self._var.matlabTime[0]
-        Period = var.shape[0] * dt
-        time = np.arange(0.0, Period, dt)
-
-        N = len(signal)
-        M = len(Ranges)
-
-        for i in range(M):
-            r = Ranges[i]
-            for j in range(N-1):
-                if signal[j] > r:
-                    Exceedance[i] = Exceedance[i] + (time[j+1] - time[j])
-
-        Exceedance = (Exceedance * 100) / Period
+        time = self._var.matlabTime[:]
+        if not time_ind==[]:
+            time = time[time_ind]
+        Exceedance, Ranges = exceedance_curve(var, time, bins=bins,
+                                              chunk=chunk, debug=debug)
 
         if debug:
             print '...Passed'
        
         #Plot
-        self._plot.plot_xy(Exceedance, Ranges, yLabel='Amplitudes',
-                           xLabel='Exceedance probability in %')
+        if graph and len(Exceedance.shape)==1:
+            self._plot.plot_xy(Exceedance, Ranges, yLabel='Amplitudes',
+                               xLabel='Exceedance probability in %')
 
         return Exceedance, Ranges
 
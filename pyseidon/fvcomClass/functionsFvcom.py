@@ -3,15 +3,22 @@
 
 from __future__ import division
 import numpy as np
+import matplotlib.tri as Tri
 from scipy import linalg as LA
 from scipy.interpolate import interp1d
+from scipy.sparse import csr_matrix
 import sys
+import os
+import hashlib
+import cPickle as pkl
 import numexpr as ne
 from datetime import datetime
 from datetime import timedelta
 from interpolation_utils import *
 from miscellaneous import *
+from miscellaneous import _sample_durations
 from BP_tools import *
+from shortest_element_path import *
 from utide import solve, reconstruct
 import time
 
@@ -69,27 +76,44 @@ class FunctionsFvcom:
         if debug:
             print '...Passed'   
 
-    def hori_velo_norm(self, debug=False):
+    def hori_velo_norm(self, chunk=[], output=[], debug=False):
         """
         This method computes  a new variable: 'horizontal velocity norm' (m/s)
         -> FVCOM.Variables.hori_velo_norm
 
+        Keywords:
+        --------
+          - chunk = number of time steps computed at once, integer.
+                    Bounds memory use, by default all time steps at once
+          - output = path to an output file, string, either *.nc (netcdf)
+                     or *.npy (memory map). The result is written in it,
+                     block by block, instead of being kept in memory
+
         Notes:
         -----
           - Can take time over the full domain
+          - use chunk and output for data larger than the machine memory
         """
         debug = debug or self._debug
         if debug:
             print 'Computing horizontal velocity norm...'
 
         try:
-            u = self._var.ua
-            v = self._var.va
-            vel = ne.evaluate('sqrt(u**2 + v**2)')  
+            ua = self._var.ua
+            va = self._var.va
+            vel = output_array(ua.shape, ('time', 'nele'), output=output,
+                               name='hori_velo_norm', dtype=ua.dtype,
+                               debug=debug)
+            for ts, te in time_blocks(ua.shape[0], chunk):
+                u = ua[ts:te]
+                v = va[ts:te]
+                vel[ts:te] = ne.evaluate('sqrt(u**2 + v**2)')
+            vel = flush_output(vel)
         except MemoryError:
             print '---Data too large for machine memory---'
             print 'Tip: use ax or tx during class initialisation'
             print '---  to use partial data'
+            print '---  or use chunk and output'
             raise
 
         #Custom return    
@@ -102,16 +126,25 @@ class FunctionsFvcom:
         if debug:
             print '...Passed'
 
-    def flow_dir(self, debug=False):
+    def flow_dir(self, chunk=[], output=[], debug=False):
         """"
         This method create new variable 'depth averaged flow directions' (deg.)
         -> FVCOM.Variables.depth_av_flow_dir
 
+        Keywords:
+        --------
+          - chunk = number of time steps computed at once, integer.
+                    Bounds memory use, by default all time steps at once
+          - output = path to an output file, string, either *.nc (netcdf)
+                     or *.npy (memory map). The result is written in it,
+                     block by block, instead of being kept in memory
+
         Notes:
         -----
           - directions between -180 and 180 deg., i.e. 0=East, 90=North,
             +/-180=West, -90=South
           - Can take time over the full domain
+          - use chunk and output for data larger than the machine memory
         """
         if debug or self._debug:
             print 'Computing flow directions...'
@@ -119,12 +152,18 @@ class FunctionsFvcom:
         try:
             u = self._var.ua
             v = self._var.va
-            dirFlow = np.rad2deg(np.arctan2(v,u))
+            dirFlow = output_array(u.shape, ('time', 'nele'), output=output,
+                                   name='depth_av_flow_dir', dtype=u.dtype,
+                                   debug=debug)
+            for ts, te in time_blocks(u.shape[0], chunk):
+                dirFlow[ts:te] = np.rad2deg(np.arctan2(v[ts:te], u[ts:te]))
+            dirFlow = flush_output(dirFlow)
 
         except MemoryError:
             print '---Data too large for machine memory---'
             print 'Tip: use ax or tx during class initialisation'
             print '---  to use partial data'
+            print '---  or use chunk and output'
             raise
 
         #Custom return    
@@ -187,9 +226,7 @@ class FunctionsFvcom:
 
         #Extraction at point
         # Finding closest point
-        index = closest_point([pt_lon], [pt_lat],
-                              self._grid.lonc,
-                              self._grid.latc, debug=debug)[0]
+        index = self.containing_element([pt_lon], [pt_lat], debug=debug)[0]
         if debug:
             print 'Extraction of u and v at point...'
         U = self.interpolation_at_point(u, pt_lon, pt_lat, index=index,
@@ -221,7 +258,7 @@ class FunctionsFvcom:
         #Rose diagram
         self._plot.rose_diagram(dirFlow, norm)
         if exceedance:
-            self.exceedance(norm, debug=debug)
+            self.exceedance(norm, time_ind=argtime, debug=debug)
 
         return dirFlow, norm
 
@@ -412,9 +449,7 @@ class FunctionsFvcom:
 
         #Extraction at point
         # Finding closest point
-        index = closest_point([pt_lon], [pt_lat],
-                              self._grid.lonc,
-                              self._grid.latc, debug=debug)[0]
+        index = self.containing_element([pt_lon], [pt_lat], debug=debug)[0]
         if debug:
             print 'Extraction of u and v at point...'
         U = self.interpolation_at_point(u, pt_lon, pt_lat, index=index,
@@ -515,6 +550,161 @@ class FunctionsFvcom:
             end = time.time()
             print "...processing time: ", (end - start)
 
+    def closest_element(self, pt_lon, pt_lat, k=1, debug=False):
+        """
+        This function finds the closest element centres to any given locations.
+
+        Inputs:
+        ------
+          - pt_lon = longitudes in decimal degrees East to find, list of floats
+          - pt_lat = latitudes in decimal degrees North to find, list of floats
+
+        Outputs:
+        -------
+           - index = closest element indices, 1D array of integers (npoints)
+                     or 2D array (npoints, k)
+
+        Keywords:
+        --------
+          - k = number of closest elements to find per point, integer
+
+        Notes:
+        -----
+          - the KD-tree of the element centres is built on first call
+            and stored in FVCOM.Grid.ele_tree
+        """
+        debug = (debug or self._debug)
+        if not hasattr(self._grid, 'ele_tree'):
+            self._grid.ele_tree = spatial_tree(self._grid.lonc, self._grid.latc,
+                                               debug=debug)
+        return closest_point(pt_lon, pt_lat, self._grid.lonc, self._grid.latc,
+                             tree=self._grid.ele_tree, k=k, debug=debug)
+
+    def closest_node(self, pt_lon, pt_lat, k=1, debug=False):
+        """
+        This function finds the closest nodes to any given locations.
+
+        Inputs:
+        ------
+          - pt_lon = longitudes in decimal degrees East to find, list of floats
+          - pt_lat = latitudes in decimal degrees North to find, list of floats
+
+        Outputs:
+        -------
+           - index = closest node indices, 1D array of integers (npoints)
+                     or 2D array (npoints, k)
+
+        Keywords:
+        --------
+          - k = number of closest nodes to find per point, integer
+
+        Notes:
+        -----
+          - the KD-tree of the nodes is built on first call
+            and stored in FVCOM.Grid.node_tree
+        """
+        debug = (debug or self._debug)
+        if not hasattr(self._grid, 'node_tree'):
+            self._grid.node_tree = spatial_tree(self._grid.lon, self._grid.lat,
+                                                debug=debug)
+        return closest_point(pt_lon, pt_lat, self._grid.lon, self._grid.lat,
+                             tree=self._grid.node_tree, k=k, debug=debug)
+
+    def containing_element(self, pt_lon, pt_lat, debug=False):
+        """
+        This function finds the elements containing any given locations.
+
+        Inputs:
+        ------
+          - pt_lon = longitudes in decimal degrees East to find, list of floats
+          - pt_lat = latitudes in decimal degrees North to find, list of floats
+
+        Outputs:
+        -------
+           - index = containing element indices, 1D array of integers (npoints)
+
+        Notes:
+        -----
+          - the closest element centre is returned for locations
+            outside the mesh
+          - the triangle finder is built on first call and kept
+            in FVCOM.Grid.triangle
+        """
+        debug = (debug or self._debug)
+        if debug:
+            print 'Finding containing elements...'
+        if not hasattr(self._grid, 'triangle'):
+            if debug:
+                print "Computing triangulation..."
+            self._grid.triangle = Tri.Triangulation(self._grid.lon[:],
+                                                    self._grid.lat[:],
+                                                    triangles=self._grid.trinodes[:])
+        trif = self._grid.triangle.get_trifinder()
+        pt_lon = np.ravel(pt_lon)
+        pt_lat = np.ravel(pt_lat)
+        index = trif(pt_lon, pt_lat)
+        #Fall back on closest element outside the mesh
+        outside = np.where(index==-1)[0]
+        if not outside.shape[0]==0:
+            if debug:
+                print str(outside.shape[0]) + ' points outside the mesh'
+            index[outside] = self.closest_element(pt_lon[outside], pt_lat[outside],
+                                                  debug=debug)
+
+        if debug:
+            print '...Passed'
+
+        return index
+
+    def shortest_paths(self, start_pts, end_pts, debug=False):
+        """
+        This function finds the shortest element paths between pairs of
+        locations, along the mesh.
+
+        Inputs:
+        ------
+          - start_pts = starting points, list of [longitude, latitude]
+          - end_pts = ending points, list of [longitude, latitude]
+
+        Outputs:
+        -------
+           - paths = element indices along each path, list of lists of integers
+           - dist = path lengths in decimal degrees, 1D array (npairs)
+
+        Notes:
+        -----
+          - the element adjacency graph is built from the elements sharing
+            an edge (FVCOM.Grid.trinodes, not FVCOM.Grid.triele which is
+            not reliable on subsets, see ax) on first call and stored in
+            FVCOM.Grid.ele_graph
+          - all pairs are solved in one call, one search per distinct
+            starting element
+        """
+        debug = (debug or self._debug)
+        if debug:
+            print 'Computing shortest paths...'
+        start_pts = np.atleast_2d(start_pts)
+        end_pts = np.atleast_2d(end_pts)
+        start = self.containing_element(start_pts[:,0], start_pts[:,1], debug=debug)
+        end = self.containing_element(end_pts[:,0], end_pts[:,1], debug=debug)
+        if not hasattr(self._grid, 'ele_graph'):
+            if debug:
+                print "Computing element graph..."
+            self._grid.ele_graph = element_graph(self._grid.lonc[:],
+                                                 self._grid.latc[:],
+                                                 self._neighbours() + 1)
+        short_path = shortest_element_path(self._grid.lonc, self._grid.latc,
+                                           self._grid.lon, self._grid.lat,
+                                           self._grid.trinodes, self._grid.h,
+                                           graph=self._grid.ele_graph,
+                                           debug=debug)
+        paths, _ = short_path.getTargets(zip(start, end))
+
+        if debug:
+            print '...Passed'
+
+        return paths, short_path.distances
+
     def interpolation_at_point(self, var, pt_lon, pt_lat, index=[], debug=False):
         """
         This function interpolates any given variables at any give location.
@@ -531,27 +721,31 @@ class FunctionsFvcom:
 
         Keywords:
         --------
-          - index = element index, integer. Use only if closest element index
-                    is already known
+          - index = element index, integer. Use only if the element containing
+                    (pt_lon, pt_lat) is already known
 
         Notes:
         -----
-          - use index if closest element already known
+          - use index if containing element already known
+          - without index, the interpolation weights of (pt_lon, pt_lat)
+            are computed once and reused, see interpolation_weights
         """
         debug = (debug or self._debug)
         if debug:
             print 'Interpolaling at point...'
-        lonc = self._grid.lonc[:]
-        latc = self._grid.latc[:]
+        if np.size(index)==0:
+            #Interpolation weights are cached for each location
+            weights = self.interpolation_weights([pt_lon], [pt_lat], debug=debug)
+            varInterp = self.interpolation_at_points(var, weights=weights,
+                                                     debug=debug)
+            return varInterp[...,0].squeeze()
+
         xc = self._grid.xc[:]
         yc = self._grid.yc[:]
         lon = self._grid.lon[:]
         lat = self._grid.lat[:]
         trinodes = self._grid.trinodes[:]
 
-        if index==[]:
-            # Find indices of the closest element
-            index = closest_point([pt_lon], [pt_lat], lonc, latc, debug=debug)[0]
         # Conversion (lon, lat) to (x, y)
         pt_x = interp_at_point(self._grid.x, pt_lon, pt_lat, lon, lat,
                                index=index, trinodes=trinodes, debug=debug)
@@ -573,6 +767,7 @@ class FunctionsFvcom:
                 start = time.time() 
             varInterp = interpE_at_pt(var, pt_x, pt_y, xc, yc, index, triele,
                                       trinodes, self._grid.a1u, self._grid.a2u,
+                                      neighbours=self._neighbours(),
                                       debug=debug)
             if debug:
                 end = time.time()
@@ -580,10 +775,187 @@ class FunctionsFvcom:
 
         return varInterp
 
-    def exceedance(self, var, pt_lon=[], pt_lat=[], debug=False):
+    def interpolation_weights(self, pt_lon, pt_lat, filename=[], debug=False):
+        """
+        This function computes the interpolation weights of any given
+        locations once, so that any variable can then be interpolated
+        at these locations with interpolation_at_points.
+
+        Inputs:
+        ------
+          - pt_lon = longitudes in decimal degrees East, list of floats
+          - pt_lat = latitudes in decimal degrees North, list of floats
+
+        Outputs:
+        -------
+           - weights = interpolation weights, dictionary with keys:
+                       'lon', 'lat' = locations, 1D arrays (npoints)
+                       'fingerprint' = mesh fingerprint, string
+                       'element_index' = containing elements, 1D array (npoints)
+                       'x', 'y' = coordinates in m, 1D arrays (npoints)
+                       'node_stencil' = node indices, 2D array (npoints, 3)
+                       'node_weights' = node weights, 2D array (npoints, 3)
+                       'element_stencil' = element indices, 2D array (npoints, 4)
+                       'element_weights' = element weights, 2D array (npoints, 4)
+
+        Keywords:
+        --------
+          - filename = path to a pickle file (*.p), string. The weights are
+                       loaded from it if they match the mesh and locations,
+                       otherwise they are computed and saved in it
+
+        Notes:
+        -----
+          - weights are cached in FVCOM.Grid for each set of locations
+          - weights saved next to the model outputs can be reused with
+            any later file sharing the same mesh
+        """
+        debug = (debug or self._debug)
+        pt_lon = np.asarray(np.ravel(pt_lon), dtype=np.float64)
+        pt_lat = np.asarray(np.ravel(pt_lat), dtype=np.float64)
+        fingerprint = self._fingerprint()
+        key = hashlib.md5(pt_lon.tostring() + pt_lat.tostring()).hexdigest()
+        #Checking if weights already computed
+        if not hasattr(self._grid, '_interp_weights'):
+            self._grid._interp_weights = {}
+        if key in self._grid._interp_weights:
+            return self._grid._interp_weights[key]
+        if not filename==[] and os.path.exists(filename):
+            if debug:
+                print 'Loading interpolation weights from ' + filename + '...'
+            f = open(filename, "rb")
+            weights = pkl.load(f)
+            f.close()
+            if (weights['fingerprint']==fingerprint and
+                np.array_equal(weights['lon'], pt_lon) and
+                np.array_equal(weights['lat'], pt_lat)):
+                self._grid._interp_weights[key] = weights
+                return weights
+            print "---Weights in " + filename + " do not match, re-computing---"
+
+        if debug:
+            print 'Computing interpolation weights...'
+            start = time.time()
+        index = self.containing_element(pt_lon, pt_lat, debug=debug)
+        # Conversion (lon, lat) to (x, y)
+        nodes, bary = barycentric_weights(pt_lon, pt_lat,
+                                          self._grid.lon, self._grid.lat,
+                                          index, self._grid.trinodes[:],
+                                          debug=debug)
+        pt_x = interp_with_weights(self._grid.x, nodes, bary)
+        pt_y = interp_with_weights(self._grid.y, nodes, bary)
+        #Node and element stencils
+        xc = self._grid.xc[:]
+        yc = self._grid.yc[:]
+        trinodes = self._grid.trinodes[:]
+        nodeS, nodeW = interpN_weights(pt_x, pt_y, xc, yc, index, trinodes,
+                                       self._grid.aw0[:], self._grid.awx[:],
+                                       self._grid.awy[:], debug=debug)
+        eleS, eleW = interpE_weights(pt_x, pt_y, xc, yc, index, trinodes,
+                                     self._grid.a1u[:], self._grid.a2u[:],
+                                     neighbours=self._neighbours(),
+                                     debug=debug)
+        weights = {}
+        weights['lon'] = pt_lon
+        weights['lat'] = pt_lat
+        weights['fingerprint'] = fingerprint
+        weights['element_index'] = index
+        weights['x'] = pt_x
+        weights['y'] = pt_y
+        weights['node_stencil'] = nodeS
+        weights['node_weights'] = nodeW
+        weights['element_stencil'] = eleS
+        weights['element_weights'] = eleW
+        self._grid._interp_weights[key] = weights
+
+        if not filename==[]:
+            if debug:
+                print 'Saving interpolation weights in ' + filename + '...'
+            f = open(filename, "wb")
+            pkl.dump(weights, f, protocol=pkl.HIGHEST_PROTOCOL)
+            f.close()
+
+        if debug:
+            end = time.time()
+            print "Processing time: ", (end - start)
+
+        return weights
+
+    def _neighbours(self):
+        """
+        Returns the surrounding elements of each element, 0-based, -1 if
+        none, computed once from trinodes. FVCOM.Grid.triele is not used
+        as its re-labelling is not reliable on subsets
+        """
+        if not hasattr(self._grid, '_neighbours'):
+            self._grid._neighbours = element_neighbours(self._grid.trinodes[:])
+        return self._grid._neighbours
+
+    def _fingerprint(self):
+        """Returns the fingerprint of the mesh, computed once"""
+        if not hasattr(self._grid, '_fingerprint'):
+            self._grid._fingerprint = mesh_fingerprint(self._grid.lon,
+                                                       self._grid.lat,
+                                                       self._grid.trinodes)
+        return self._grid._fingerprint
+
+    def interpolation_at_points(self, var, pt_lon=[], pt_lat=[], weights=[],
+                                debug=False):
+        """
+        This function interpolates any given variables at many locations
+        at once.
+
+        Inputs:
+        ------
+          - var = any FVCOM grid data or variable, numpy array
+          - pt_lon = longitudes in decimal degrees East, list of floats
+          - pt_lat = latitudes in decimal degrees North, list of floats
+
+        Outputs:
+        -------
+           - varInterp = var interpolated at (pt_lon, pt_lat), numpy array,
+                         dim=(npoints) or (time, npoints) or (time, level, npoints)
+
+        Keywords:
+        --------
+          - weights = interpolation weights, dictionary.
+                      Use only if already computed with interpolation_weights,
+                      in which case pt_lon and pt_lat are not needed.
+                      Weights computed on another mesh are re-computed
+
+        Notes:
+        -----
+          - compute weights once with interpolation_weights and reuse them
+            for every variable to interpolate at the same locations
+        """
+        debug = (debug or self._debug)
+        if debug:
+            print 'Interpolating at points...'
+        if weights==[]:
+            weights = self.interpolation_weights(pt_lon, pt_lat, debug=debug)
+        elif not weights['fingerprint']==self._fingerprint():
+            print "---Weights computed on a different mesh, re-computing---"
+            weights = self.interpolation_weights(weights['lon'], weights['lat'],
+                                                 debug=debug)
+        #change in function of the data you dealing with
+        if var.shape[-1]==self._grid.nnode:
+            varInterp = interp_with_weights(var, weights['node_stencil'],
+                                            weights['node_weights'], debug=debug)
+        else:
+            varInterp = interp_with_weights(var, weights['element_stencil'],
+                                            weights['element_weights'],
+                                            debug=debug)
+
+        if debug:
+            print '...Passed'
+
+        return varInterp
+
+    def exceedance(self, var, pt_lon=[], pt_lat=[], time_ind=[], bins=30,
+                   chunk=[], graph=True, debug=False):
         """
         This function calculates the excedence curve of a var(time)
-        at any given point.
+        at any given point, or at every point of the domain.
 
         Inputs:
         ------
@@ -592,49 +964,47 @@ class FunctionsFvcom:
         Keywords:
         --------
           - pt_lon, pt_lat = coordinates, float numbers.
-                             Necessary if var = 2D (i.e. [time, nnode or nele]
+                             If var = 2D (i.e. [time, nnode or nele]) and no
+                             coordinates are given, curves are computed at
+                             every node or element
+          - time_ind = time indices of var samples, list of integers.
+                       By default var covers the whole time period, or,
+                       if shorter, its samples are equally weighted
+          - bins = number of amplitude bins, integer, or amplitudes, 1D array
+          - chunk = number of time steps processed at once, integer
           - graph: True->plots curve; False->does not
 
         Outputs:
         -------
-          - Exceedance = list of % of occurences, 1D array
+          - Exceedance = list of % of occurences, 1D array,
+                         or 2D array (nbins, nnode or nele) over the domain
           - Ranges = list of signal amplitude bins, 1D array
 
         Notes:
         -----
           - This method is not suitable for SSE
+          - Time steps can be irregular
         """
         debug = (debug or self._debug)
         if debug:
             print 'Computing exceedance...'
 
         #Distinguish between 1D and 2D var
-        if len(var.shape)>1:
-            if pt_lon==[] or pt_lat==[]:
-                print 'Lon, lat coordinates are needed'
-                sys.exit()
+        if len(var.shape)>1 and not (pt_lon==[] or pt_lat==[]):
             signal = self.interpolation_at_point(var, pt_lon, pt_lat, debug=debug)
         else:
             signal=var
-        
-        Max = max(signal)	
-        dy = (Max/30.0)
-        Ranges = np.arange(0,(Max + dy), dy)
-        Exceedance = np.zeros(Ranges.shape[0])
-        dt = self._var.julianTime[1] - self._var.julianTime[0]
-        Period = var.shape[0] * dt
-        time = np.arange(0.0, Period, dt)
-
-        N = len(signal)
-        M = len(Ranges)
 
-        for i in range(M):
-            r = Ranges[i]
-            for j in range(N-1):
-                if signal[j] > r:
-                    Exceedance[i] = Exceedance[i] + (time[j+1] - time[j])
-
-        Exceedance = (Exceedance * 100) / Period
+        time = self._var.julianTime[:]
+        if not time_ind==[]:
+            time = time[time_ind]
+        elif not signal.shape[0]==time.shape[0]:
+            #Samples of unknown times, equally weighted
+            if debug:
+                print 'var does not cover the time period, see time_ind'
+            time = np.arange(signal.shape[0])
+        Exceedance, Ranges = exceedance_curve(signal, time, bins=bins,
+                                              chunk=chunk, debug=debug)
 
         if debug:
             print '...Passed'
@@ -642,65 +1012,50 @@ class FunctionsFvcom:
         #Plot
         #error=np.ones(Exceedance.shape) * np.std(Exceedance)
         #if debug: print "Error: ", str(np.std(Exceedance))
-        self._plot.plot_xy(Exceedance, Ranges, #yerror=error,
-                           yLabel='Amplitudes',
-                           xLabel='Exceedance probability in %')
+        if graph and len(Exceedance.shape)==1:
+            self._plot.plot_xy(Exceedance, Ranges, #yerror=error,
+                               yLabel='Amplitudes',
+                               xLabel='Exceedance probability in %')
 
         return Exceedance, Ranges
 
-    def vorticity(self, debug=False):
+    def vorticity(self, chunk=[], output=[], debug=False):
         """
         This method creates a new variable: 'depth averaged vorticity (1/s)'
         -> FVCOM.Variables.depth_av_vorticity
-     
+
+        Keywords:
+        --------
+          - chunk = number of time steps computed at once, integer.
+                    Bounds memory use, by default all time steps at once
+          - output = path to an output file, string, either *.nc (netcdf)
+                     or *.npy (memory map). The result is written in it,
+                     block by block, instead of being kept in memory
+
         Notes:
         -----
           - Can take time over the full domain
+          - use chunk and output for data larger than the machine memory
         """
         debug = (debug or self._debug)
         if debug:
             print 'Computing vorticity...'
             start = time.time()
 
-        t = arange(self._grid.ntime)  
-
-        #Surrounding elements
-        n1 = self._grid.triele[:,0]
-        n2 = self._grid.triele[:,1]
-        n3 = self._grid.triele[:,2]
-        #TR comment: not quiet sure what this step does
-        n1[np.where(n1==0)[0]] = self._grid.trinodes.shape[1]
-        n2[np.where(n2==0)[0]] = self._grid.trinodes.shape[1]
-        n3[np.where(n3==0)[0]] = self._grid.trinodes.shape[1]
-        #TR quick fix: due to error with pydap.proxy.ArrayProxy
-        #              not able to cop with numpy.int
-        n1 = int(n1)
-        n2 = int(n2)
-        n3 = int(n3)
-
-        if debug:
-            end = time.time()
-            print "Check element=0, computation time in (s): ", (end - start)
-            print "start np.multiply" 
-        
-        dvdx = np.zeros((self._grid.ntime,self._grid.nele))
-        dudy = np.zeros((self._grid.ntime,self._grid.nele))
-
-        j=0
-        for i in t:
-            dvdx[j,:] = np.multiply(self._grid.a1u[0,:], self._var.va[i,:]) \
-                      + np.multiply(self._grid.a1u[1,:], self._var.va[i,n1]) \
-                      + np.multiply(self._grid.a1u[2,:], self._var.va[i,n2]) \
-                      + np.multiply(self._grid.a1u[3,:], self._var.va[i,n3])
-            dudy[j,:] = np.multiply(self._grid.a2u[0,:], self._var.ua[i,:]) \
-                      + np.multiply(self._grid.a2u[1,:], self._var.ua[i,n1]) \
-                      + np.multiply(self._grid.a2u[2,:], self._var.ua[i,n2]) \
-                      + np.multiply(self._grid.a2u[3,:], self._var.ua[i,n3])
-            j+=1
-        if debug:
-            print "loop number ", i
-
-        vort = dvdx - dudy
+        try:
+            ntime = self._var.ua.shape[0]
+            vort = output_array((ntime, self._grid.nele), ('time', 'nele'),
+                                output=output, name='depth_av_vorticity',
+                                debug=debug)
+            for ts, te in time_blocks(ntime, chunk):
+                vort[ts:te] = self._vorticity_block(np.arange(ts, te))
+            vort = flush_output(vort)
+        except MemoryError:
+            print '---Data too large for machine memory---'
+            print 'Tip: use ax or tx during class initialisation'
+            print '---  to use partial data'
+            print '---  or use chunk and output'
+            raise
 
         # Add metadata entry
         self._var.depth_av_vorticity = vort
@@ -711,7 +1066,62 @@ class FunctionsFvcom:
             end = time.time()
             print "Computation time in (s): ", (end - start) 
 
-    def vorticity_over_period(self, time_ind=[], t_start=[], t_end=[], debug=False):
+    def _vorticity_block(self, t):
+        """
+        Computes the depth averaged vorticity (1/s), dv/dx - du/dy,
+        at time indices t, 2D array (len(t), nele)
+        """
+        A1, A2 = self._gradient_operators()
+        ua = np.asarray(self._time_take(self._var.ua, t), dtype=A1.dtype)
+        va = np.asarray(self._time_take(self._var.va, t), dtype=A1.dtype)
+
+        return (A1.dot(va.T) - A2.dot(ua.T)).T
+
+    def _time_take(self, var, t, index=slice(None)):
+        """Reads var at time indices t, i.e. var[t, index, ...]"""
+        t = np.asarray(t)
+        if not (isinstance(index, slice) or isinstance(var, np.ndarray)):
+            #pydap proxies do not cope with index arrays
+            return np.take(self._time_take(var, t), index, axis=1)
+        if np.all(np.diff(t)==1):
+            #Reading in one go, i.e. memory map or OpenDap friendly
+            return np.asarray(var[t[0]:(t[-1]+1), index])
+        elif isinstance(var, np.ndarray):
+            return np.take(var, t, axis=0)[:, index]
+        else:
+            block = np.asarray(var[t.min():(t.max()+1), index])
+            return np.take(block, t - t.min(), axis=0)
+
+    def _gradient_operators(self):
+        """
+        Returns the x and y derivative operators at elements, i.e. the
+        a1u and a2u stencils over each element and its neighbours,
+        sparse matrices (nele, nele) cached in FVCOM.Grid.
+
+        Notes:
+        -----
+          - dvar/dx = A1.dot(var.T).T, for var of dim (time, nele)
+          - missing neighbours do not contribute
+        """
+        if not hasattr(self._grid, '_gradient_ops'):
+            n = self._neighbours()
+            nele = n.shape[0]
+            rows = np.repeat(np.arange(nele), 4)
+            cols = np.column_stack((np.arange(nele), np.maximum(n, 0))).ravel()
+            valid = np.column_stack((np.ones(nele, bool), n >= 0)).ravel()
+            #native byte order, sparse products do not swap bytes efficiently
+            dtype = np.dtype(self._grid.a1u.dtype).newbyteorder('=')
+            ops = []
+            for coef in [self._grid.a1u, self._grid.a2u]:
+                data = np.asarray(coef[:], dtype=dtype).T.ravel()
+                ops.append(csr_matrix((data[valid], (rows[valid], cols[valid])),
+                                      shape=(nele, nele)))
+            self._grid._gradient_ops = tuple(ops)
+
+        return self._grid._gradient_ops
+
+    def vorticity_over_period(self, time_ind=[], t_start=[], t_end=[],
+                              chunk=[], debug=False):
         """
         This function computes the depth averaged vorticity for a time period.
      
@@ -726,6 +1136,8 @@ class FunctionsFvcom:
                      or time index as an integer
           - t_end = end time, as a string ('yyyy-mm-ddThh:mm:ss'),
                     or time index as an integer
+          - chunk = number of time steps computed at once, integer.
+                    Bounds memory use, by default all time steps at once
         Notes:
         -----
           - Can take time over the full domain
@@ -738,57 +1150,23 @@ class FunctionsFvcom:
         # Find time interval to work in
         t = []
         if not time_ind==[]:
-            t = time_ind
+            t = np.asarray(time_ind)
         elif not t_start==[]:
             if type(t_start)==str:
                 t = time_to_index(t_start, t_end, self._var.matlabTime, debug=debug)
             else:
-                t = arange(t_start, t_end)
+                t = np.arange(t_start, t_end)
         else:
-            t = arange(self._grid.ntime)
-            self.vorticity() 
+            t = np.arange(self._grid.ntime)
+            self.vorticity(chunk=chunk, debug=debug)
 
         #Checking if vorticity already computed
         if not hasattr(self._var, 'depth_av_vorticity'): 
-            #Surrounding elements
-            n1 = self._grid.triele[:,0]
-            n2 = self._grid.triele[:,1]
-            n3 = self._grid.triele[:,2]
-            #TR comment: not quiet sure what this step does
-            n1[np.where(n1==0)[0]] = self._grid.trinodes.shape[1]
-            n2[np.where(n2==0)[0]] = self._grid.trinodes.shape[1]
-            n3[np.where(n3==0)[0]] = self._grid.trinodes.shape[1]
-            #TR quick fix: due to error with pydap.proxy.ArrayProxy
-            #              not able to cop with numpy.int
-            n1 = int(n1)
-            n2 = int(n2)
-            n3 = int(n3)
-
-            if debug:
-                end = time.time()
-                print "Check element=0, computation time in (s): ", (end - start)
-                print "start np.multiply" 
-        
-            dvdx = np.zeros((t.shape[0],self._grid.nele))
-            dudy = np.zeros((t.shape[0],self._grid.nele))
-
-            j=0
-            for i in t:
-                dvdx[j,:] = np.multiply(self._grid.a1u[0,:], self._var.va[i,:]) \
-                          + np.multiply(self._grid.a1u[1,:], self._var.va[i,n1]) \
-                          + np.multiply(self._grid.a1u[2,:], self._var.va[i,n2]) \
-                          + np.multiply(self._grid.a1u[3,:], self._var.va[i,n3])
-                dudy[j,:] = np.multiply(self._grid.a2u[0,:], self._var.ua[i,:]) \
-                          + np.multiply(self._grid.a2u[1,:], self._var.ua[i,n1]) \
-                          + np.multiply(self._grid.a2u[2,:], self._var.ua[i,n2]) \
-                          + np.multiply(self._grid.a2u[3,:], self._var.ua[i,n3])
-                j+=1
-            if debug:
-                print "loop number ", i
-
-            vort = dvdx - dudy
+            vort = np.zeros((t.shape[0], self._grid.nele))
+            for ts, te in time_blocks(t.shape[0], chunk):
+                vort[ts:te,:] = self._vorticity_block(t[ts:te])
         else:
-            vort = self._var.depth_av_vorticity[t[:], :]
+            vort = self._time_take(self._var.depth_av_vorticity, t)
 
         if debug:
             end = time.time()
@@ -868,9 +1246,7 @@ class FunctionsFvcom:
 
         #Finding index
         if index==[]:      
-            index = closest_point([pt_lon], [pt_lat],
-                                  self._grid.lonc,
-                                  self._grid.latc, debug=debug)[0]
+            index = self.containing_element([pt_lon], [pt_lat], debug=debug)[0]
 
         if not hasattr(self._grid, 'depth2D'):
             #Compute depth
@@ -889,7 +1265,7 @@ class FunctionsFvcom:
 
         return dep
 
-    def depth_averaged_power_density(self, debug=False):
+    def depth_averaged_power_density(self, chunk=[], output=[], debug=False):
         """
         This method creates a new variable: 'depth averaged power density' (W/m2)
         -> FVCOM.Variables.depth_av_power_density
@@ -898,32 +1274,75 @@ class FunctionsFvcom:
         -----------
         The power density (pd) is then calculated as follows:
             pd = 0.5*1025*(u**3)
-    
+
+        Keywords:
+        --------
+          - chunk = number of time steps computed at once, integer.
+                    Bounds memory use, by default all time steps at once
+          - output = path to an output file, string, either *.nc (netcdf)
+                     or *.npy (memory map). The result is written in it,
+                     block by block, instead of being kept in memory
+
         Notes:
         -----
           - This may take some time to compute depending on the size
             of the data set
+          - use chunk and output for data larger than the machine memory
+          - FVCOM.Variables.hori_velo_norm is only computed, and kept, when
+            neither chunk nor output are given
         """
         debug = (debug or self._debug)
         if debug: print "Computing depth averaged power density..."
     
-        if not hasattr(self._var, 'hori_velo_norm'):
+        #By blocks or out of core, the velocity norm is not kept
+        if not hasattr(self._var, 'hori_velo_norm') and output==[] \
+           and chunk==[]:
             self.hori_velo_norm(debug=debug)
         if debug: print "Computing powers of hori velo norm..."
         #u = self._var.hori_velo_norm
         #pd = ne.evaluate('0.5*1025.0*(u**3)')
-        pd = 0.5*1025.0*np.power(self._var.hori_velo_norm,3.0)
+        ua = self._var.ua
+        va = self._var.va
+        try:
+            pd = output_array(ua.shape, ('time', 'nele'), output=output,
+                              name='depth_av_power_density', dtype=ua.dtype,
+                              debug=debug)
+            for ts, te in time_blocks(ua.shape[0], chunk):
+                vel = self._velo_norm_block(ts, te)
+                pd[ts:te] = 0.5*1025.0*np.power(vel,3.0)
+            pd = flush_output(pd)
+        except MemoryError:
+            print '---Data too large for machine memory---'
+            print 'Tip: use ax or tx during class initialisation'
+            print '---  to use partial data'
+            print '---  or use chunk and output'
+            raise
     
         # Add metadata entry
         self._var.depth_av_power_density = pd
         self._History.append('depth averaged power density computed')
         print '-Depth averaged power density to FVCOM.Variables.-' 
 
+    def _velo_norm_block(self, ts, te):
+        """
+        Depth averaged velocity norm (m/s) between time indices ts and te,
+        from FVCOM.Variables.hori_velo_norm when already computed
+        """
+        if hasattr(self._var, 'hori_velo_norm'):
+            return np.asarray(self._var.hori_velo_norm[ts:te])
+        u = np.asarray(self._var.ua[ts:te])
+        v = np.asarray(self._var.va[ts:te])
+        return ne.evaluate('sqrt(u**2 + v**2)')
+
     def depth_averaged_power_assessment(self, power_mat,  
-                                        cut_in=1.0, cut_out=4.5, debug=False):
+                                        cut_in=1.0, cut_out=4.5, chunk=[],
+                                        output=[], series=True, debug=False):
         """
-        This method creates a new variable: 'depth averaged power assessment' (W/m2)
+        This method creates new variables: 'depth averaged power assessment' (W/m2)
         -> FVCOM.Variables.depth_av_power_assessment
+        and its time average (W/m2) and capacity factor
+        -> FVCOM.Variables.depth_av_mean_power
+        -> FVCOM.Variables.depth_av_capacity_factor
 
         Description:
         -----------
@@ -938,57 +1357,160 @@ class FunctionsFvcom:
         Inputs:
         ------
           - power_mat = power matrix (u,Ct(u)), 2D array (2,n),
-                        u being power_mat[0,:] and Ct(u) being power_mat[1,:]
+                        u being power_mat[0,:] and Ct(u) being power_mat[1,:].
+                        Or list of power matrices, for several turbines at once
 
         Keywords:
         --------
-          - cut_in = cut-in speed in m/s, float number
-          - cut_out = cut-out speed in m/s, float number
+          - cut_in = cut-in speed in m/s, float number, or list (one per
+                     power matrix)
+          - cut_out = cut-out speed in m/s, float number, or list (one per
+                      power matrix)
+          - chunk = number of time steps computed at once, integer.
+                    Bounds memory use, by default all time steps at once
+          - output = path to an output file, string, either *.nc (netcdf)
+                     or *.npy (memory map). The result is written in it,
+                     block by block, instead of being kept in memory
+          - series = False->only the time average and capacity factor are
+                     kept, not the power assessment time series
 
         Notes:
         -----
-          - This may take some time to compute depending on the size
-            of the data set
+          - power assessment is 2D (time, nele) for one power matrix,
+            3D (time, ncurve, nele) for several
+          - mean power and capacity factor are 1D (nele) for one power
+            matrix, 2D (ncurve, nele) for several
+          - capacity factor = mean power / maximum power of the power curve
+            between cut-in and cut-out speeds
+          - time steps are weighted by their duration, as in
+            depth_averaged_resource_assessment
+          - use chunk and output, or series=False, for data larger than
+            the machine memory
         """
         debug = (debug or self._debug)
-        if debug: print "Computing depth averaged power density..."
-
-        if not hasattr(self._var, 'depth_av_power_density'):
-            if debug: print "Computing power density..."
-            self.depth_averaged_power_density(debug=debug)
+        if debug: print "Computing depth averaged power assessment..."
 
         if debug: print "Initialising power curve..."
-        Cp = interp1d(power_mat[0,:],power_mat[1,:])
-
-        u = self._var.hori_velo_norm
-        pd = self._var.depth_av_power_density
-
-        pa = Cp(u)*pd
-
-        if debug: print "finding cut-in and out..."
-        #TR comment huge bottleneck here
-        #ind = np.where(pd<pdin)[0]
-        #if not ind.shape[0]==0:
-        #    pd[ind] = 0.0
-        for i in range(pa.shape[0]):
-            for j in range(pa.shape[1]):
-                if u[i,j] < cut_in:
-                   pa[i,j] = 0.0 
-
-        paout = Cp(cut_out)*0.5*1025.0*(cut_out**3.0)
-        #TR comment huge bottleneck here
-        #ind = np.where(pd>pdout)[0]
-        #if not ind.shape[0]==0:
-        #    pd[ind] = pdout
-        for i in range(pa.shape[0]):
-            for j in range(pa.shape[1]):
-                if u[i,j] > cut_out:
-                   pa[i,j] = paout     
+        curves = power_curves(power_mat, cut_in=cut_in, cut_out=cut_out)
+        ncurve = len(curves)
+
+        ntime, nele = self._var.ua.shape
+        if ncurve==1:
+            shape, dims = (ntime, nele), ('time', 'nele')
+        else:
+            shape, dims = (ntime, ncurve, nele), ('time', 'curve', 'nele')
+        try:
+            if series:
+                pa = output_array(shape, dims, output=output,
+                                  name='depth_av_power_assessment',
+                                  dtype=self._var.ua.dtype, debug=debug)
+            #Time weighted, as resource_statistics
+            dt = _sample_durations(self._var.julianTime[:])
+            total = np.zeros(shape[1:])
+            for ts, te in time_blocks(ntime, chunk):
+                block = power_assessment(self._velo_norm_block(ts, te), curves)
+                w = dt[ts:te].reshape((te - ts,) + (1,) * (block.ndim - 1))
+                total += (block * w).sum(axis=0)
+                if series:
+                    pa[ts:te] = block
+            if series:
+                pa = flush_output(pa)
+        except MemoryError:
+            print '---Data too large for machine memory---'
+            print 'Tip: use ax or tx during class initialisation'
+            print '---  to use partial data'
+            print '---  or use chunk and output, or series=False'
+            raise
+
+        mean = total / dt.sum()
+        rated = rated_power(curves)
+        if ncurve > 1:
+            rated = rated[:,np.newaxis]
+        else:
+            rated = rated[0]
 
         # Add metadata entry
-        self._var.depth_av_power_assessment = pd
-        self._History.append('depth averaged power assessment computed')
-        print '-Depth averaged power assessment to FVCOM.Variables.-'   
+        if series:
+            self._var.depth_av_power_assessment = pa
+            self._History.append('depth averaged power assessment computed')
+            print '-Depth averaged power assessment to FVCOM.Variables.-'   
+        self._var.depth_av_mean_power = mean
+        self._var.depth_av_capacity_factor = mean / rated
+        self._History.append('depth averaged mean power and capacity factor computed')
+        print '-Depth averaged mean power and capacity factor to FVCOM.Variables.-'
+
+    def depth_averaged_resource_assessment(self, power_mat=[], cut_in=1.0,
+                                           cut_out=4.5,
+                                           percentiles=[10, 50, 90],
+                                           thresholds=[1.0, 1.5, 2.0, 2.5],
+                                           bins=np.arange(0.0, 5.05, 0.05),
+                                           chunk=[], debug=False):
+        """
+        This method creates a new variable: 'depth averaged resource
+        statistics', dictionary of per element statistics
+        -> FVCOM.Variables.depth_av_resource
+
+        Description:
+        -----------
+        Single pass, by blocks of time steps, over the depth averaged flow
+        speed (u) giving, for each element, the time averaged speed and
+        power density (pd = (1/2)*1025*(u**3)), their percentiles, the % of
+        time u is above given thresholds and, with a power matrix, the time
+        averaged power assessment and capacity factor
+        (see depth_averaged_power_assessment)
+
+        Keywords:
+        --------
+          - power_mat = power matrix (u,Ct(u)), 2D array (2,n),
+                        or list of power matrices. Optional
+          - cut_in = cut-in speed in m/s, float number, or list (one per
+                     power matrix)
+          - cut_out = cut-out speed in m/s, float number, or list (one per
+                      power matrix)
+          - percentiles = percentiles to compute, list of floats in [0, 100]
+          - thresholds = flow speeds in m/s for the exceedance, list of floats
+          - bins = flow speeds in m/s on which the speed distribution is
+                   tallied, 1D array. Sets the resolution of the percentiles
+          - chunk = number of time steps computed at once, integer.
+                    Bounds memory use, by default all time steps at once
+
+        Notes:
+        -----
+          - keys: 'mean_speed', 'mean_power_density', 'speed_percentiles',
+            'power_density_percentiles', 'exceedance', 'percentiles',
+            'thresholds' and, with power_mat, 'mean_power' and
+            'capacity_factor'
+          - memory use is bounded by chunk and the number of bins, no
+            (time, nele) field is kept
+        """
+        debug = (debug or self._debug)
+        if debug:
+            print "Computing depth averaged resource statistics..."
+            start = time.time()
+
+        try:
+            stats = resource_statistics(self._velo_norm_block,
+                                        self._var.julianTime[:],
+                                        power_mat=power_mat, cut_in=cut_in,
+                                        cut_out=cut_out,
+                                        percentiles=percentiles,
+                                        thresholds=thresholds, bins=bins,
+                                        chunk=chunk, debug=debug)
+        except MemoryError:
+            print '---Data too large for machine memory---'
+            print 'Tip: use ax or tx during class initialisation'
+            print '---  to use partial data'
+            print '---  or use chunk'
+            raise
+
+        # Add metadata entry
+        self._var.depth_av_resource = stats
+        self._History.append('depth averaged resource statistics computed')
+        print '-Depth averaged resource statistics to FVCOM.Variables.-'
+
+        if debug:
+            end = time.time()
+            print "Computation time in (s): ", (end - start) 
 
     def Harmonic_analysis_at_point(self, pt_lon, pt_lat,
                                    time_ind=[], t_start=[], t_end=[],
@@ -1037,9 +1559,7 @@ class FunctionsFvcom:
         '''
         debug = (debug or self._debug)
         #TR_comments: Add debug flag in Utide: debug=self._debug
-        index = closest_point([pt_lon], [pt_lat],
-                              self._grid.lonc,
-                              self._grid.latc, debug=debug)[0]
+        index = self.containing_element([pt_lon], [pt_lat], debug=debug)[0]
         argtime = []
         if not time_ind==[]:
             argtime = time_ind
@@ -32,6 +32,8 @@ class FunctionsFvcomThreeD:
         self._History = History
         self._util = util
         self.interpolation_at_point = self._util.interpolation_at_point
+        self.closest_element = self._util.closest_element
+        self.containing_element = self._util.containing_element
         self.hori_velo_norm = self._util.hori_velo_norm
 
         #Create pointer to FVCOM class
@@ -39,42 +41,46 @@ class FunctionsFvcomThreeD:
         grid = self._grid
         History = self._History
 
-    def depth(self, debug=False):
+    def depth(self, chunk=[], output=[], dtype=np.float64, debug=False):
         """
         This method computes new grid variable: 'depth' (m)
         -> FVCOM.Grid.depth
 
+        Keywords:
+        --------
+          - chunk = number of time steps computed at once, integer.
+                    Bounds memory use, by default all time steps at once
+          - output = path to an output file, string, either *.nc (netcdf)
+                     or *.npy (memory map). The result is written in it,
+                     block by block, instead of being kept in memory
+          - dtype = data type, i.e. np.float32 to halve memory use
+
         Notes:
         -----
           - depth convention: 0 = free surface
           - Can take time over the full domain
+          - interp_at_depth and verti_shear compute depth time block by time
+            block when FVCOM.Grid.depth does not exist, calling this method
+            is only needed to keep it
         """
         debug = debug or self._debug
         if debug:
             start = time.time()
 
         print "Computing depth..."
-        #Compute depth      
-        size = self._grid.nele
-        size1 = self._grid.ntime
-        size2 = self._grid.nlevel
-        elc = np.zeros((size1, size))
-        hc = np.zeros((size))
-        siglay = np.zeros((size2, size))
-
         try:
-            for ind, value in enumerate(self._grid.trinodes):
-                elc[:, ind] = np.mean(self._var.el[:, value], axis=1)
-                hc[ind] = np.mean(self._grid.h[value])
-                siglay[:,ind] = np.mean(self._grid.siglay[:,value],1)
-
-            #zeta = self._var.el[:,:] + self._grid.h[None,:]
-            zeta = elc[:,:] + hc[None,:]
-            dep = zeta[:,None,:]*siglay[None,:,:]
+            ntime = self._var.el.shape[0]
+            dep = output_array((ntime, self._grid.nlevel, self._grid.nele),
+                               ('time', 'siglay', 'nele'), output=output,
+                               name='depth', dtype=dtype, debug=debug)
+            for ts, te in time_blocks(ntime, chunk):
+                dep[ts:te] = self._element_depth(ts, te, dtype=dtype)
+            dep = flush_output(dep)
         except MemoryError:
             print '---Data too large for machine memory---'
             print 'Tip: use ax or tx during class initialisation'
             print '---  to use partial data'
+            print '---  or use chunk and output'
             raise
 
         if debug:
@@ -86,6 +92,46 @@ class FunctionsFvcomThreeD:
         self._History.append('depth computed')
         print '-Depth added to FVCOM.Variables.-'
 
+    def _element_depth(self, ts, te, dtype=np.float64):
+        """
+        Computes depth (m) at elements between time indices ts and te,
+        3D array (te-ts, nlevel, nele)
+        """
+        zeta = self._water_column(ts, te).astype(dtype)
+
+        return zeta[:,None,:] * self._grid._siglayc[None,:,:].astype(dtype)
+
+    def _water_column(self, ts, te):
+        """
+        Water column height (m), el + h, at elements between time indices
+        ts and te, 2D array (te-ts, nele)
+        """
+        hc, siglayc = self._element_statics()
+        elc = node_to_element(self._var.el[ts:te], self._grid.trinodes[:])
+
+        return elc + hc
+
+    def _element_statics(self):
+        """
+        Bathymetry h (nele) and sigma levels siglay (nlevel, nele) at
+        elements, cached in FVCOM.Grid
+        """
+        if not hasattr(self._grid, '_siglayc'):
+            trinodes = self._grid.trinodes[:]
+            self._grid._hc = node_to_element(self._grid.h[:], trinodes)
+            self._grid._siglayc = node_to_element(self._grid.siglay[:], trinodes)
+
+        return self._grid._hc, self._grid._siglayc
+
+    def _depth_block(self, ts, te):
+        """
+        Depth (m) at elements between time indices ts and te, from
+        FVCOM.Grid.depth when computed, 3D array (te-ts, nlevel, nele)
+        """
+        if hasattr(self._grid, 'depth'):
+            return np.asarray(self._grid.depth[ts:te])
+        return self._element_depth(ts, te)
+
     def depth_at_point(self, pt_lon, pt_lat, index=[], debug=False):
         """
         This function computes depth at any given point.
@@ -117,9 +163,7 @@ class FunctionsFvcomThreeD:
 
         #Finding index
         if index==[]:      
-            index = closest_point([pt_lon], [pt_lat],
-                                  self._grid.lonc,
-                                  self._grid.latc, debug=debug)[0]
+            index = self.containing_element([pt_lon], [pt_lat], debug=debug)[0]
 
         if not hasattr(self._grid, 'depth'):
             #Compute depth
@@ -141,7 +185,7 @@ class FunctionsFvcomThreeD:
 
         return dep
 
-    def interp_at_depth(self, var, depth, ind=[], debug=False):
+    def interp_at_depth(self, var, depth, ind=[], chunk=[], debug=False):
         """
         This function interpolates any given FVCOM.Variables field
         onto a specified depth plan
@@ -150,97 +194,215 @@ class FunctionsFvcomThreeD:
         ------
           - var = 3 dimensional (time, sigma level, element) variable, array
           - depth = interpolation depth (float in meters), negative from
-                    water column top downwards
+                    water column top downwards, or list of depths
         Keywords:
         --------
-          - ind = array of closest indexes to depth, 2D array (ntime, nele)
+          - ind = array of closest indexes to depth, 2D array (ntime, nele),
+                  or 3D array (ntime, ndepth, nele) for a list of depths,
+                  as returned by a previous call for the same depth(s)
+          - chunk = number of time steps computed at once, integer.
+                    Bounds memory use, by default all time steps at once
 
         Output:
         ------
-          - interpVar = 2 dimensional (time, element) variable, masked array
-          - ind = array of closest indexes to depth, 2D array (ntime, nele)
+          - interpVar = 2 dimensional (time, element) variable, masked array,
+                        or 3D (time, depth, element) for a list of depths
+          - ind = array of closest indexes to depth, 2D array (ntime, nele),
+                  or 3D array (ntime, ndepth, nele) for a list of depths
+
+        Notes:
+        -----
+          - linear interpolation between the sigma levels right above and
+            right below depth. Depths above the first or below the last
+            sigma level are masked (nan index)
         """
         debug = debug or self._debug
         if debug: print 'Interpolating at '+str(depth)+' meter depth...'
 
-        #checking if depth field already calculated
-        if not hasattr(self._grid, 'depth'):
-            self.depth()
-        dep = self._grid.depth - depth
-        #Finding closest values to specified depth
-        if ind==[]:
-            if debug: print 'Finding closest indexes to depth...'
-            ind = np.zeros((dep.shape[0],dep.shape[2]))
-            for i in range(dep.shape[0]):
-                for k in range(dep.shape[2]):
-                    test = dep[i,:,k]
-                    if not test[test>0.0].shape==test.shape:
-                        ind[i,k] = test[test>0.0].argmin()
-                    else:
-                        ind[i,k] = np.nan
-                    
-        inddown = ind + 1
-
-        if debug: print 'Computing weights...'
-        #weight matrix & interp
-        interpVar = np.ones((var.shape[0], var.shape[2]))*np.nan
-        for i in range(ind.shape[0]):
-            for j in range(ind.shape[1]):
-                iU = ind[i,j]
-                iD = inddown[i,j]
-                if not np.isnan(iU):       
-                    length = np.abs(self._grid.depth[i,iU,j]\
-                                  - self._grid.depth[i,iD,j])
-                    wU = np.abs(depth - self._grid.depth[i,iU,j])/length
-                    wD = np.abs(depth - self._grid.depth[i,iD,j])/length
-                    interpVar[i,j] = (wU * var[i,iU,j]) + (wD * var[i,iD,j])
-                else:
-                    interpVar[i,j] = np.nan
+        depths = np.atleast_1d(np.asarray(depth, dtype=np.float64))
+        ntime, nlevel, nele = var.shape
+        ndepth = depths.shape[0]
+        newInd = (np.size(ind)==0)
+        if newInd:
+            ind = np.empty((ntime, ndepth, nele))
+        else:
+            ind = np.asarray(ind, dtype=np.float64).reshape(ntime, ndepth, nele)
+        interpVar = np.empty((ntime, ndepth, nele))
+
+        for ts, te in time_blocks(ntime, chunk):
+            dep = self._depth_block(ts, te)
+            if newInd:
+                if debug: print 'Finding closest indexes to depth...'
+                ind[ts:te] = self._levels_above(dep, depths[None,:,None])
+            if debug: print 'Computing weights...'
+            weights = self._level_weights(dep, depths[None,:,None], ind[ts:te])
+            interpVar[ts:te] = self._take_levels(var[ts:te], weights)
 
         if debug: print 'Computing nan mask...'
         interpVar = np.ma.masked_array(interpVar,np.isnan(interpVar))
+        if np.ndim(depth)==0:
+            interpVar = interpVar[:,0,:]
+            ind = ind[:,0,:]
 
         if debug: print '...Passed'
 
         return interpVar, ind
 
-    def verti_shear(self, debug=False):
+    def _levels_above(self, dep, depths):
+        """
+        Index of the sigma level right above given depths, nan above the
+        first or below the last sigma level
+
+        Inputs:
+        ------
+          - dep = depth, 3D array (time, nlevel, nele)
+          - depths = target depths, array broadcastable to (time, ndepth, nele)
+        """
+        nlevel = dep.shape[1]
+        above = np.zeros(np.broadcast(dep[:,0,None,:], depths).shape,
+                         dtype=np.int16)
+        for k in range(nlevel):
+            above += dep[:,k,None,:] > depths
+
+        return np.where((above > 0) & (above < nlevel), above - 1, np.nan)
+
+    def _level_weights(self, dep, depths, ind):
+        """
+        Linear interpolation weights at given depths between the sigma
+        levels ind and ind + 1, see _levels_above.
+        Returns flat indexes of the upper and lower levels in a
+        (time, nlevel, nele) array, lower level weight and mask of the
+        depths within the water column
+        """
+        ntime, nlevel, nele = dep.shape
+        valid = ~np.isnan(ind)
+        iU = np.where(valid, ind, 0).astype(np.intp)
+        #Flat indexes, faster to gather than (time, level, element) triplets
+        iU = iU * nele + (np.arange(ntime)[:,None,None] * (nlevel * nele)
+                          + np.arange(nele)[None,None,:])
+        iD = iU + np.where(iU % (nlevel * nele) < (nlevel - 1) * nele, nele, 0)
+        dep = np.ravel(dep)
+        dU = np.take(dep, iU)
+        dD = np.take(dep, iD)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            wD = (dU - depths) / (dU - dD)
+
+        return iU, iD, wD, valid
+
+    def _take_levels(self, var, weights):
+        """
+        Interpolates var, 3D array (time, nlevel, nele), with weights from
+        _level_weights, 3D array (time, ndepth, nele)
+        """
+        iU, iD, wD, valid = weights
+        block = np.ravel(np.asarray(var))
+        vU = np.take(block, iU)
+        vD = np.take(block, iD)
+
+        return np.where(valid, vU + wD * (vD - vU), np.nan)
+
+    def horizontal_slices(self, var, depths, reference='surface', chunk=[],
+                          debug=False):
+        """
+        This function interpolates 3D variables at several depths at once,
+        from the free surface or from the seabed, e.g. turbine hub heights
+
+        Inputs:
+        ------
+          - var = list of 3D variables, names in FVCOM.Variables
+                  (e.g. ['u', 'v']) or 3D arrays (time, sigma level, element)
+          - depths = distances in meters from the reference, positive,
+                     list of floats
+
+        Keywords:
+        --------
+          - reference = 'surface' (depth below the free surface) or 'bed'
+                        (height above the seabed), string, or list of strings
+                        (one per depth)
+          - chunk = number of time steps computed at once, integer.
+                    Bounds memory use, by default all time steps at once
+
+        Output:
+        ------
+          - slices = list of masked arrays (time, ndepth, element),
+                     one per var
+
+        Notes:
+        -----
+          - interpolation weights are computed once per time block and
+            shared between variables
+          - depths outside the sigma levels, i.e. too close to the free
+            surface or to the seabed, are masked
+        """
+        debug = debug or self._debug
+        if debug: print 'Computing horizontal slices...'
+
+        var = [getattr(self._var, x) if type(x)==str else x for x in var]
+        depths = np.atleast_1d(np.asarray(depths, dtype=np.float64))
+        ndepth = depths.shape[0]
+        bed = np.broadcast_to(np.asarray(reference)=='bed', (ndepth,))
+        ntime, nlevel, nele = var[0].shape
+        try:
+            slices = [np.empty((ntime, ndepth, nele)) for x in var]
+            for ts, te in time_blocks(ntime, chunk):
+                if debug: print 'Time steps ' + str(ts) + ' to ' + str(te) + '...'
+                dep = self._depth_block(ts, te)
+                #Depths from the free surface, i.e. 0 = surface
+                target = np.where(bed[None,:,None],
+                                  depths[None,:,None] - self._water_column(ts, te)[:,None,:],
+                                  -depths[None,:,None])
+                ind = self._levels_above(dep, target)
+                weights = self._level_weights(dep, target, ind)
+                for x, out in zip(var, slices):
+                    out[ts:te] = self._take_levels(x[ts:te], weights)
+        except MemoryError:
+            print '---Data too large for machine memory---'
+            print 'Tip: use ax or tx during class initialisation'
+            print '---  to use partial data'
+            print '---  or use chunk'
+            raise
+
+        if debug: print '...Passed'
+
+        return [np.ma.masked_invalid(x) for x in slices]
+
+    def verti_shear(self, chunk=[], output=[], debug=False):
         """
         This method computes a new variable: 'vertical shear' (1/s)
         -> FVCOM.Variables.verti_shear
 
+        Keywords:
+        --------
+          - chunk = number of time steps computed at once, integer.
+                    Bounds memory use, by default all time steps at once
+          - output = path to an output file, string, either *.nc (netcdf)
+                     or *.npy (memory map). The result is written in it,
+                     block by block, instead of being kept in memory
+
         Notes:
         -----
-          - Can take time over the full doma
+          - Can take time over the full domain
+          - shear of the horizontal velocity norm between consecutive
+            sigma levels, 3D array (time, nlevel - 1, nele)
+          - use chunk and output for data larger than the machine memory
         """
         debug = debug or self._debug
         if debug:
             print 'Computing vertical shear...'
-              
-        #Compute depth if necessary
-        if not hasattr(self._grid, 'depth'):        
-           depth = self.depth(debug=debug)
-        depth = self._grid.depth
-
-        # Checking if horizontal velocity norm already exists
-        if not hasattr(self._var, 'hori_velo_norm'):
-            self.hori_velo_norm()
-        vel = self._var.hori_velo_norm
 
         try:
-            #Sigma levels to consider
-            top_lvl = self._grid.nlevel - 1
-            bot_lvl = 0
-            sLvl = range(bot_lvl, top_lvl+1)
-
-            # Compute shear
-            dz = depth[:,sLvl[1:],:] - depth[:,sLvl[:-1],:]
-            dvel = vel[:,sLvl[1:],:] - vel[:,sLvl[:-1],:]           
-            dveldz = dvel / dz
+            ntime, nlevel, nele = self._var.u.shape
+            dveldz = output_array((ntime, nlevel - 1, nele),
+                                  ('time', 'nshear', 'nele'), output=output,
+                                  name='verti_shear', debug=debug)
+            for ts, te in time_blocks(ntime, chunk):
+                dveldz[ts:te] = self._shear_block(ts, te)
+            dveldz = flush_output(dveldz)
         except MemoryError:
             print '---Data too large for machine memory---'
             print 'Tip: use ax or tx during class initialisation'
             print '---  to use partial data'
+            print '---  or use chunk and output'
             raise
 
         #Custom return
@@ -253,8 +415,89 @@ class FunctionsFvcomThreeD:
         if debug:
             print '...Passed'
 
+    def _shear_block(self, ts, te, sLvl=[]):
+        """
+        Vertical shear (1/s) between consecutive sigma levels sLvl, between
+        time indices ts and te, 3D array (te-ts, len(sLvl) - 1, nele),
+        from FVCOM.Variables.verti_shear when computed
+        """
+        if sLvl==[]:
+            sLvl = range(self._grid.nlevel)
+        if hasattr(self._var, 'verti_shear'):
+            return np.asarray(self._var.verti_shear[ts:te, sLvl[0]:sLvl[-1], :])
+
+        lvl = slice(sLvl[0], sLvl[-1] + 1)
+        depth = self._depth_block(ts, te)[:, lvl, :]
+        u = np.asarray(self._var.u[ts:te, lvl, :])
+        v = np.asarray(self._var.v[ts:te, lvl, :])
+        vel = ne.evaluate('sqrt(u**2 + v**2)')
+
+        # Compute shear
+        dz = depth[:,1:,:] - depth[:,:-1,:]
+        dvel = vel[:,1:,:] - vel[:,:-1,:]
+
+        return dvel / dz
+
+    def verti_shear_stats(self, bot_lvl=[], top_lvl=[], percentiles=[95],
+                          bins=np.append(0.0, np.logspace(-4, 1, 501)),
+                          chunk=[], debug=False):
+        """
+        This method computes a new variable: 'vertical shear statistics',
+        dictionary of per element statistics of the vertical shear magnitude
+        (1/s) over time and sigma levels
+        -> FVCOM.Variables.verti_shear_stats
+
+        Keywords:
+        --------
+          - bot_lvl = index of the bottom level to consider, integer
+          - top_lvl = index of the top level to consider, integer
+          - percentiles = percentiles to compute, list of floats in [0, 100]
+          - bins = shear magnitudes (1/s) on which the distribution is
+                   tallied, 1D array. Sets the resolution of the percentiles
+          - chunk = number of time steps computed at once, integer.
+                    Bounds memory use, by default all time steps at once
+
+        Notes:
+        -----
+          - keys: 'mean', 'max', 'percentile_values' (npercentile, nele)
+            and 'percentiles'
+          - no (time, nlevel, nele) field is kept, unless
+            FVCOM.Variables.verti_shear exists, in which case it is used
+        """
+        debug = debug or self._debug
+        if debug:
+            print 'Computing vertical shear statistics...'
+
+        #Sigma levels to consider
+        if top_lvl==[]:
+            top_lvl = self._grid.nlevel - 1
+        if bot_lvl==[]:
+            bot_lvl = 0
+        sLvl = range(bot_lvl, top_lvl+1)
+
+        try:
+            stats = streaming_statistics(
+                        lambda ts, te: np.abs(self._shear_block(ts, te, sLvl)),
+                        self._var.julianTime[:], percentiles=percentiles,
+                        bins=bins, chunk=chunk, debug=debug)
+        except MemoryError:
+            print '---Data too large for machine memory---'
+            print 'Tip: use ax or tx during class initialisation'
+            print '---  to use partial data'
+            print '---  or use chunk'
+            raise
+
+        # Add metadata entry
+        self._var.verti_shear_stats = stats
+        self._History.append('vertical shear statistics computed')
+        print '-Vertical shear statistics added to FVCOM.Variables.-'
+
+        if debug:
+            print '...Passed'
+
     def verti_shear_at_point(self, pt_lon, pt_lat, t_start=[], t_end=[],  time_ind=[],
-                             bot_lvl=[], top_lvl=[], graph=True, debug=False):
+                             bot_lvl=[], top_lvl=[], reference='surface',
+                             graph=True, debug=False):
         """
         This function computes vertical shear at any given point.
 
@@ -276,6 +519,9 @@ class FunctionsFvcomThreeD:
           - time_ind = time indices to work in, list of integers
           - bot_lvl = index of the bottom level to consider, integer
           - top_lvl = index of the top level to consider, integer
+          - reference = vertical axis of the plotted profile, 'surface'
+                        (depth below the free surface) or 'bed' (height
+                        above the seabed), string
           - graph = plots graph if True
 
         Notes:
@@ -297,11 +543,17 @@ class FunctionsFvcomThreeD:
                 argtime = np.arange(t_start, t_end) 
 
         # Finding closest point
-        index = closest_point([pt_lon], [pt_lat],
-                              self._grid.lonc,
-                              self._grid.latc, debug=debug)[0]
+        index = self.containing_element([pt_lon], [pt_lat], debug=debug)[0]
         #Compute depth
         depth = self.depth_at_point(pt_lon, pt_lat, index=index, debug=debug)       
+        yLabel = 'Depth (m) '
+        if reference=='bed':
+            h = self.interpolation_at_point(self._grid.h, pt_lon, pt_lat,
+                                            index=index, debug=debug)
+            el = self.interpolation_at_point(self._var.el, pt_lon, pt_lat,
+                                             index=index, debug=debug)
+            depth = depth + (el + h)[:,None]
+            yLabel = 'Height above bed (m) '
 
         #Sigma levels to consider
         if top_lvl==[]:
@@ -330,9 +582,10 @@ class FunctionsFvcomThreeD:
             dvel = norm[:,sLvl[1:]] - norm[:,sLvl[:-1]]           
             dveldz = dvel / dz
         else:
-            dveldz = interpolation_at_point(self._var.verti_shear,
-                                            pt_lon, pt_lat,
-                                            index=index, debug=debug)
+            dveldz = self.interpolation_at_point(self._var.verti_shear,
+                                                 pt_lon, pt_lat,
+                                                 index=index, debug=debug)
+            dveldz = dveldz[:,sLvl[:-1]]
 
         if debug:
             print '...Passed'
@@ -349,7 +602,7 @@ class FunctionsFvcomThreeD:
             error = np.std(dveldz,axis=0)
             self._plot.plot_xy(mean_dveldz, mean_depth, xerror=error[:],
                                title='Shear profile ',
-                               xLabel='Shear (1/s) ', yLabel='Depth (m) ')
+                               xLabel='Shear (1/s) ', yLabel=yLabel)
 
         return dveldz             
 
@@ -455,9 +708,7 @@ class FunctionsFvcomThreeD:
 
 
         # Finding closest point
-        index = closest_point([pt_lon], [pt_lat],
-                              self._grid.lonc,
-                              self._grid.latc, debug=debug)[0]
+        index = self.containing_element([pt_lon], [pt_lat], debug=debug)[0]
 
         #Computing horizontal velocity norm
         if debug:
@@ -521,9 +772,7 @@ class FunctionsFvcomThreeD:
             print 'Computing flow directions at point...'
 
         # Finding closest point
-        index = closest_point([pt_lon], [pt_lat],
-                              self._grid.lonc,
-                              self._grid.latc, debug=debug)[0]
+        index = self.containing_element([pt_lon], [pt_lat], debug=debug)[0]
 
         # Find time interval to work in
         argtime = []
@@ -605,56 +854,42 @@ class FunctionsFvcomThreeD:
         if debug or self._debug:
             print '...Passed'
 
-    def vorticity(self, debug=False):
+    def vorticity(self, chunk=[], output=[], debug=False):
         """
-        This method creates a new variable: 'depth averaged vorticity' (1/s)
+        This method creates a new variable: 'vorticity' (1/s)
         -> FVCOM.Variables.vorticity
-     
+
+        Keywords:
+        --------
+          - chunk = number of time steps computed at once, integer.
+                    Bounds memory use, by default all time steps at once
+          - output = path to an output file, string, either *.nc (netcdf)
+                     or *.npy (memory map). The result is written in it,
+                     block by block, instead of being kept in memory
+
         Notes:
         -----
           - Can take time over the full domain
+          - use chunk and output for data larger than the machine memory
         """
         debug = (debug or self._debug)
         if debug:
             print 'Computing vorticity...'
             start = time.time()
 
-        t = arange(self._grid.ntime)  
-
-        #Surrounding elements
-        n1 = self._grid.triele[:,0]
-        n2 = self._grid.triele[:,1]
-        n3 = self._grid.triele[:,2]
-        #TR comment: not quiet sure what this step does
-        n1[np.where(n1==0)[0]] = self._grid.trinodes.shape[1]
-        n2[np.where(n2==0)[0]] = self._grid.trinodes.shape[1]
-        n3[np.where(n3==0)[0]] = self._grid.trinodes.shape[1]
-        if debug:
-            end = time.time()
-            print "Check element=0, computation time in (s): ", (end - start)
-            print "start np.multiply" 
-
-        x0 = self._grid.xc
-        y0 = self._grid.yc
-        
-        dvdx = np.zeros((self._grid.ntime,self._grid.nlevel,self._grid.nele))
-        dudy = np.zeros((self._grid.ntime,self._grid.nlevel,self._grid.nele))
-
-        j=0
-        for i in t:
-            dvdx[j,:,:] = np.multiply(self._grid.a1u[0,:], self._var.v[i,:,:]) \
-                        + np.multiply(self._grid.a1u[1,:], self._var.v[i,:,n1]) \
-                        + np.multiply(self._grid.a1u[2,:], self._var.v[i,:,n2]) \
-                        + np.multiply(self._grid.a1u[3,:], self._var.v[i,:,n3])
-            dudy[j,:,:] = np.multiply(self._grid.a2u[0,:], self._var.u[i,:,:]) \
-                        + np.multiply(self._grid.a2u[1,:], self._var.u[i,:,n1]) \
-                        + np.multiply(self._grid.a2u[2,:], self._var.u[i,:,n2]) \
-                        + np.multiply(self._grid.a2u[3,:], self._var.u[i,:,n3])
-            j+=1
-        if debug:
-            print "loop number ", i
-
-        vort = dvdx - dudy
+        try:
+            ntime, nlevel, nele = self._var.u.shape
+            vort = output_array((ntime, nlevel, nele), ('time', 'siglay', 'nele'),
+                                output=output, name='vorticity', debug=debug)
+            for ts, te in time_blocks(ntime, chunk):
+                vort[ts:te] = self._vorticity_block(np.arange(ts, te))
+            vort = flush_output(vort)
+        except MemoryError:
+            print '---Data too large for machine memory---'
+            print 'Tip: use ax or tx during class initialisation'
+            print '---  to use partial data'
+            print '---  or use chunk and output'
+            raise
 
         # Add metadata entry
         self._var.vorticity = vort
@@ -665,13 +900,29 @@ class FunctionsFvcomThreeD:
             end = time.time()
             print "Computation time in (s): ", (end - start) 
 
-    def vorticity_over_period(self, time_ind=[], t_start=[], t_end=[], debug=False):
+    def _vorticity_block(self, t, level=slice(None)):
+        """
+        Computes the vorticity (1/s), dv/dx - du/dy, at time indices t
+        and sigma levels level, 3D array (len(t), nlevel, nele)
+        """
+        A1, A2 = self._util._gradient_operators()
+        u = np.asarray(self._util._time_take(self._var.u, t, level), dtype=A1.dtype)
+        v = np.asarray(self._util._time_take(self._var.v, t, level), dtype=A1.dtype)
+        #time and level flattened together, same stencil for all
+        shape = u.shape
+        u = u.reshape(-1, shape[-1])
+        v = v.reshape(-1, shape[-1])
+
+        return (A1.dot(v.T) - A2.dot(u.T)).T.reshape(shape)
+
+    def vorticity_over_period(self, time_ind=[], t_start=[], t_end=[],
+                              level=[], chunk=[], debug=False):
         """
         This function computes the vorticity for a time period.
      
         Outputs:
         -------
-          - vort = horizontal vorticity (1/s), 2D array (time, nele)
+          - vort = horizontal vorticity (1/s), 3D array (time, level, nele)
 
         Keywords:
         -------
@@ -680,6 +931,10 @@ class FunctionsFvcomThreeD:
                       or time index as an integer
           - t_end = end time, as a string ('yyyy-mm-ddThh:mm:ss'),
                     or time index as an integer
+          - level = sigma level(s) to work in, integer or list of integers.
+                    By default all levels
+          - chunk = number of time steps computed at once, integer.
+                    Bounds memory use, by default all time steps at once
         Notes:
         -----
           - Can take time over the full domain
@@ -692,53 +947,31 @@ class FunctionsFvcomThreeD:
         # Find time interval to work in
         t = []
         if not time_ind==[]:
-            t = time_ind
+            t = np.asarray(time_ind)
         elif not t_start==[]:
             if type(t_start)==str:
                 t = time_to_index(t_start, t_end, self._var.matlabTime, debug=debug)
             else:
-                t = arange(t_start, t_end)
+                t = np.arange(t_start, t_end)
+        else:
+            t = np.arange(self._grid.ntime)
+
+        # Sigma levels to work in, as a slice when contiguous
+        if np.size(level)==0:
+            level = slice(None)
         else:
-            t = arange(self._grid.ntime)  
+            level = np.atleast_1d(level)
+            if np.all(np.diff(level)==1):
+                level = slice(level[0], level[-1] + 1)
 
         #Checking if vorticity already computed
         if not hasattr(self._var, 'vorticity'): 
-            #Surrounding elements
-            n1 = self._grid.triele[:,0]
-            n2 = self._grid.triele[:,1]
-            n3 = self._grid.triele[:,2]
-            #TR comment: not quiet sure what this step does
-            n1[np.where(n1==0)[0]] = self._grid.trinodes.shape[1]
-            n2[np.where(n2==0)[0]] = self._grid.trinodes.shape[1]
-            n3[np.where(n3==0)[0]] = self._grid.trinodes.shape[1]
-            if debug:
-                end = time.time()
-                print "Check element=0, computation time in (s): ", (end - start)
-                print "start np.multiply" 
-
-            x0 = self._grid.xc
-            y0 = self._grid.yc
-        
-            dvdx = np.zeros((t.shape[0],self._grid.nlevel,self._grid.nele))
-            dudy = np.zeros((t.shape[0],self._grid.nlevel,self._grid.nele))
-
-            j=0
-            for i in t:
-                dvdx[j,:,:] = np.multiply(self._grid.a1u[0,:], self._var.v[i,:,:]) \
-                          + np.multiply(self._grid.a1u[1,:], self._var.v[i,:,n1]) \
-                          + np.multiply(self._grid.a1u[2,:], self._var.v[i,:,n2]) \
-                          + np.multiply(self._grid.a1u[3,:], self._var.v[i,:,n3])
-                dudy[j,:,:] = np.multiply(self._grid.a2u[0,:], self._var.u[i,:,:]) \
-                          + np.multiply(self._grid.a2u[1,:], self._var.u[i,:,n1]) \
-                          + np.multiply(self._grid.a2u[2,:], self._var.u[i,:,n2]) \
-                          + np.multiply(self._grid.a2u[3,:], self._var.u[i,:,n3])
-                j+=1
-            if debug:
-                print "loop number ", i
-
-            vort = dvdx - dudy
+            nlevel = len(np.arange(self._grid.nlevel)[level])
+            vort = np.zeros((t.shape[0], nlevel, self._grid.nele))
+            for ts, te in time_blocks(t.shape[0], chunk):
+                vort[ts:te] = self._vorticity_block(t[ts:te], level)
         else:
-            vort = self._var.vorticity[t[:],:,:]
+            vort = self._util._time_take(self._var.vorticity, t, level)
 
         if debug:
             end = time.time()
@@ -773,8 +1006,32 @@ class FunctionsFvcomThreeD:
         self._History.append('power density computed')
         print '-Power density to FVCOM.Variables.-' 
 
+    def _velo_norm_at_depth(self, ts, te, depth):
+        """
+        Velocity norm (m/s) at given depth between time indices ts and te,
+        2D array (te-ts, nele), nan above the first or below the last
+        sigma level. See interp_at_depth and velo_norm
+        """
+        if hasattr(self._var, 'velo_norm'):
+            vel = np.asarray(self._var.velo_norm[ts:te])
+        else:
+            u = np.asarray(self._var.u[ts:te])
+            v = np.asarray(self._var.v[ts:te])
+            try:
+                w = np.asarray(self._var.w[ts:te])
+                vel = ne.evaluate('sqrt(u**2 + v**2 + w**2)')
+            except AttributeError:
+                vel = ne.evaluate('sqrt(u**2 + v**2)')
+        depths = np.array([[[depth]]], dtype=np.float64)
+        dep = self._depth_block(ts, te)
+        ind = self._levels_above(dep, depths)
+        weights = self._level_weights(dep, depths, ind)
+
+        return self._take_levels(vel, weights)[:,0,:]
+
     def power_assessment_at_depth(self, power_mat, depth, 
-                                        cut_in=1.0, cut_out=4.5, debug=False):
+                                        cut_in=1.0, cut_out=4.5, chunk=[],
+                                        debug=False):
         """
         This function computes power assessment (W/m2) at given depth.
 
@@ -791,181 +1048,287 @@ class FunctionsFvcomThreeD:
         Inputs:
         ------
           - power_mat = power matrix (u,Ct(u)), 2D array (2,n),
-                        u being power_mat[0,:] and Ct(u) being power_mat[1,:]
+                        u being power_mat[0,:] and Ct(u) being power_mat[1,:].
+                        Or list of power matrices, for several turbines at once
           - depth = given depth from the surface, float
 
         Output:
         ------
-          - pa = power assessment in (W/m2), 2D masked array (ntime, nele)
+          - pa = power assessment in (W/m2), 2D masked array (ntime, nele),
+                 3D masked array (ntime, ncurve, nele) for several
+                 power matrices
 
         Keywords:
         --------
-          - cut_in = cut-in speed in m/s, float number
-          - cut_out = cut-out speed in m/s, float number
+          - cut_in = cut-in speed in m/s, float number, or list (one per
+                     power matrix)
+          - cut_out = cut-out speed in m/s, float number, or list (one per
+                      power matrix)
+          - chunk = number of time steps computed at once, integer.
+                    Bounds memory use, by default all time steps at once
 
         Notes:
         -----
           - This may take some time to compute depending on the size
             of the data set
+          - the velocity norm is computed at depth time block by time
+            block, FVCOM.Variables.velo_norm is used when it exists
         """
         debug = (debug or self._debug)
-        if debug: print "Computing depth averaged power density..."
-
-        if not hasattr(self._var, 'power_density'):
-            self.power_density(debug=debug)
+        if debug: print "Computing power assessment at depth..."
 
         if debug: print "Initialising power curve..."
-        Cp = interp1d(power_mat[0,:],power_mat[1,:])
-
-        u, ind = self.interp_at_depth(self._var.velo_norm, depth, debug=debug)
-        pd, ind2 = self.interp_at_depth(self._var.power_density, depth,
-                                                   ind=ind, debug=debug)
-
-        pa = Cp(u)*pd
-
-        if debug: print "finding cut-in..."
-        #TR comment huge bottleneck here
-        #ind = np.where(pd<pdin)[0]
-        #if not ind.shape[0]==0:
-        #    pd[ind] = 0.0
-        for i in range(pa.shape[0]):
-            for j in range(pa.shape[1]):
-                if u[i,j] < cut_in:
-                   pa[i,j] = 0.0 
-
-        if debug: print "finding cut-out..."
-        paout = Cp(cut_out)*0.5*1025.0*(cut_out**3.0)
-        #TR comment huge bottleneck here
-        #ind = np.where(pd>pdout)[0]
-        #if not ind.shape[0]==0:
-        #    pd[ind] = pdout
-        for i in range(pa.shape[0]):
-            for j in range(pa.shape[1]):
-                if u[i,j] > cut_out:
-                   pa[i,j] = paout     
-
-        return pa 
+        curves = power_curves(power_mat, cut_in=cut_in, cut_out=cut_out)
 
-    def _vertical_slice(self, var, start_pt, end_pt,
-                        time_ind=[], t_start=[], t_end=[],
-                        title='Title', cmax=[], cmin=[], debug=False):
+        try:
+            ntime = self._var.u.shape[0]
+            pa = None
+            for ts, te in time_blocks(ntime, chunk):
+                if debug:
+                    print 'Time steps ' + str(ts) + ' to ' + str(te) + '...'
+                block = power_assessment(self._velo_norm_at_depth(ts, te, depth),
+                                         curves)
+                if pa is None:
+                    pa = np.empty((ntime,) + block.shape[1:])
+                pa[ts:te] = block
+        except MemoryError:
+            print '---Data too large for machine memory---'
+            print 'Tip: use ax or tx during class initialisation'
+            print '---  to use partial data'
+            raise
+
+        return np.ma.masked_invalid(pa)
+
+    def resource_assessment_at_depth(self, depth, power_mat=[], cut_in=1.0,
+                                     cut_out=4.5, percentiles=[10, 50, 90],
+                                     thresholds=[1.0, 1.5, 2.0, 2.5],
+                                     bins=np.arange(0.0, 5.05, 0.05),
+                                     chunk=[], debug=False):
         """
-        Draw vertical slice in var along the shortest path between
-        start_point, end_pt.
- 
+        This function computes per element tidal energy resource
+        statistics at given depth.
+
         Inputs:
         ------
-          - var = 2D dimensional (sigma level, element) variable, array
-          - start_pt = starting point, [longitude, latitude]
-          - end_pt = ending point, [longitude, latitude]
+          - depth = given depth from the surface, float
+
+        Output:
+        ------
+          - stats = dictionary with keys 'mean_speed', 'mean_power_density',
+                    'speed_percentiles', 'power_density_percentiles',
+                    'exceedance', 'percentiles', 'thresholds' and, with
+                    power_mat, 'mean_power' and 'capacity_factor'.
+                    See Util2D.depth_averaged_resource_assessment
 
         Keywords:
         --------
-          - time_ind = reference time indices for surface elevation, list of integer
+          - power_mat = power matrix (u,Ct(u)), 2D array (2,n),
+                        or list of power matrices. Optional
+          - cut_in = cut-in speed in m/s, float number, or list (one per
+                     power matrix)
+          - cut_out = cut-out speed in m/s, float number, or list (one per
+                      power matrix)
+          - percentiles = percentiles to compute, list of floats in [0, 100]
+          - thresholds = flow speeds in m/s for the exceedance, list of floats
+          - bins = flow speeds in m/s on which the speed distribution is
+                   tallied, 1D array. Sets the resolution of the percentiles
+          - chunk = number of time steps computed at once, integer.
+                    Bounds memory use, by default all time steps at once
+
+        Notes:
+        -----
+          - the velocity norm is computed at depth time block by time
+            block, FVCOM.Variables.velo_norm is used when it exists
+        """
+        debug = (debug or self._debug)
+        if debug: print "Computing resource statistics at depth..."
+
+        read_speed = lambda ts, te: self._velo_norm_at_depth(ts, te, depth)
+
+        return resource_statistics(read_speed,
+                                   self._var.julianTime[:],
+                                   power_mat=power_mat, cut_in=cut_in,
+                                   cut_out=cut_out, percentiles=percentiles,
+                                   thresholds=thresholds, bins=bins,
+                                   chunk=chunk, debug=debug)
+
+    def transect(self, var, pt_lon, pt_lat, npts=100, time_ind=[],
+                 t_start=[], t_end=[], chunk=[], graph=False,
+                 title='Title', cmax=[], cmin=[], debug=False):
+        """
+        This function extracts any 3D variable along a straight line
+        or a polyline, i.e. vertical section through the mesh.
+
+        Inputs:
+        ------
+          - var = 3D variable, name in FVCOM.Variables (e.g. 'u') or
+                  3D array (time, sigma level, element), or 2D array
+                  (sigma level, element)
+          - pt_lon = longitudes of the line vertices in decimal degrees East,
+                     list of floats (at least 2)
+          - pt_lat = latitudes of the line vertices in decimal degrees North,
+                     list of floats (at least 2)
+
+        Outputs:
+        -------
+          - dist = distance along line (m), 1D array (npts)
+          - depth = depth (m) along line, masked array
+                    (time, sigma level, npts)
+          - values = var along line, masked array (time, sigma level, npts),
+                     or (sigma level, npts) for 2D var
+
+        Keywords:
+        --------
+          - npts = number of points sampled along the line, integer
+          - time_ind = time indices to work in, list of integers
           - t_start = start time, as a string ('yyyy-mm-ddThh:mm:ss'),
                       or time index as an integer
           - t_end = end time, as a string ('yyyy-mm-ddThh:mm:ss'),
                     or time index as an integer
+          - chunk = number of time steps read at once, integer
+          - graph = plots the time averaged section, boolean
 
         Keywords for plot:
         -----------------
           - title = plot title, string
           - cmin = minimum limit colorbar
           - cmax = maximum limit colorbar
+
+        Notes:
+        -----
+          - points are sampled at regular intervals along the line and
+            take the value of their containing element
+          - points outside the mesh are masked
+          - the triangle finder is kept in FVCOM.Grid.triangle, see
+            containing_element
         """
         debug = debug or self._debug
-        if not self._var._3D:
-            print "Error: Only available for 3D runs."
-            raise
-        else: 
-            lons = [start_pt[0], end_pt[0]]
-            lats = [start_pt[1], end_pt[1]]
-            #Finding the closest elements to start and end points
-            ind = closest_point(lons, lats, self._grid.lonc, self._grid.latc, debug)
-
-            #Finding the shortest path between start and end points
-            if debug : print "Computing shortest path..."
-            short_path = shortest_element_path(self._grid.lonc[:],
-                                               self._grid.latc[:],
-                                               self._grid.lon[:],
-                                               self._grid.lat[:],
-                                               self._grid.trinodes[:],
-                                               self._grid.h[:], debug=debug)
-            el, _ = short_path.getTargets([ind])           
-            # Plot shortest path
-            short_path.graphGrid(plot=True)
-
-            # Find time interval to work in
-            argtime = []
-            if not time_ind==[]:
-                argtime = time_ind
-            elif not t_start==[]:
-                if type(t_start)==str:
-                    argtime = time_to_index(t_start, t_end,
-                                            self._var.matlabTime, debug=debug)
-                else:
-                    argtime = arange(t_start, t_end)
- 
-            #Extract along line
-            ele=np.asarray(el[:])[0,:]
-            varP = var[:,ele]
-            # Depth along line
-            if debug : print "Computing depth..."
-            depth = np.zeros((self._grid.ntime, self._grid.nlevel, ele.shape[0]))
-            I=0
-            for ind in ele:
-                value = self._grid.trinodes[ind]
-                h = np.mean(self._grid.h[value])
-                zeta = np.mean(self._var.el[:,value],1) + h
-                siglay = np.mean(self._grid.siglay[:,value],1)
-                depth[:,:,I] =  zeta[:,None]*siglay[None,:]
-                I+=1
-            # Average depth over time
-            if not argtime==[]:
-                depth = np.mean(depth[argtime,:,:], 0)
+        if debug:
+            print 'Computing transect...'
+            start = time.time()
+
+        # Find time interval to work in
+        if not time_ind==[]:
+            t = np.asarray(time_ind)
+        elif not t_start==[]:
+            if type(t_start)==str:
+                t = time_to_index(t_start, t_end, self._var.matlabTime, debug=debug)
             else:
-                depth = np.mean(depth, 0)
-              
-            # Compute distance along line
-            x = self._grid.xc[ele]
-            y = self._grid.yc[ele]
-            # Pythagore + cumulative path 
-            line = np.zeros(depth.shape)
-            dl = np.sqrt(np.square(x[1:]-x[:-1]) + np.square(y[1:]-y[:-1]))
-            for i in range(1,dl.shape[0]):
-                dl[i] = dl[i] + dl[i-1]
-            line[:,1:] = dl[:]
-           
-            #turn into gridded
-            #print 'Compute gridded data'
-            #nx, ny = 100, 100
-            #xi = np.linspace(x.min(), x.max(), nx)
-            #yi = np.linspace(y.min(), y.max(), ny)
-
-            #Plot features
+                t = np.arange(t_start, t_end)
+        else:
+            t = np.arange(self._grid.ntime)
+
+        # Sampling along line, distances in local plane approximation
+        pt_lon = np.asarray(pt_lon, dtype=np.float64)
+        pt_lat = np.asarray(pt_lat, dtype=np.float64)
+        R = 6371000.0
+        x = np.radians(pt_lon) * R * np.cos(np.radians(np.mean(pt_lat)))
+        y = np.radians(pt_lat) * R
+        vertices = np.append(0.0, np.cumsum(np.hypot(np.diff(x), np.diff(y))))
+        dist = np.linspace(0.0, vertices[-1], npts)
+        lon = np.interp(dist, vertices, pt_lon)
+        lat = np.interp(dist, vertices, pt_lat)
+
+        # Elements along line, each read once
+        index = self.containing_element(lon, lat, debug=debug)
+        outside = self._grid.triangle.get_trifinder()(lon, lat) == -1
+        ele, inv = np.unique(index, return_inverse=True)
+
+        if type(var)==str:
+            var = getattr(self._var, var)
+        static = (np.ndim(var)==2)
+        hc, siglayc = self._element_statics()
+        trinodes = self._grid.trinodes[:][ele]
+        try:
+            depth = np.empty((t.shape[0], self._grid.nlevel, npts))
+            if static:
+                values = np.asarray(var)[:, ele][:, inv]
+            else:
+                values = np.empty((t.shape[0], var.shape[1], npts))
+            for ts, te in time_blocks(t.shape[0], chunk):
+                if debug: print 'Time steps ' + str(ts) + ' to ' + str(te) + '...'
+                if hasattr(self._grid, 'depth'):
+                    dep = np.take(self._util._time_take(self._grid.depth, t[ts:te]),
+                                  ele, axis=2)
+                else:
+                    elc = node_to_element(self._util._time_take(self._var.el, t[ts:te]),
+                                          trinodes)
+                    dep = (elc + hc[ele])[:,None,:] * siglayc[None,:,ele]
+                depth[ts:te] = dep[:,:,inv]
+                if not static:
+                    block = self._util._time_take(var, t[ts:te])
+                    values[ts:te] = np.take(block, ele, axis=2)[:,:,inv]
+        except MemoryError:
+            print '---Data too large for machine memory---'
+            print 'Tip: use ax or tx during class initialisation'
+            print '---  to use partial data'
+            print '---  or use chunk'
+            raise
+
+        mask = np.broadcast_to(outside, depth.shape)
+        depth = np.ma.masked_array(depth, mask=mask)
+        values = np.ma.masked_array(values, mask=np.broadcast_to(outside, values.shape))
+
+        if debug:
+            end = time.time()
+            print "Computation time in (s): ", (end - start)
+
+        if graph:
+            varP = values if static else values.mean(axis=0)
+            depP = depth.mean(axis=0)
+            line = np.broadcast_to(dist, depP.shape)
             #setting limits and levels of colormap
             if cmax==[]:
-                cmax = varP[:].max()
+                cmax = varP.max()
             if cmin==[]:
-                cmin = varP[:].min()
+                cmin = varP.min()
             step = (cmax-cmin) / 20.0
             levels=np.arange(cmin, (cmax+step), step)
-            #plt.clf()
             fig = plt.figure(figsize=(18,10))
             plt.rc('font',size='22')
-            fig.add_subplot(111) #,aspect=(1.0/np.cos(np.mean(lat)*np.pi/180.0)))
-            #levels = np.linspace(0,3.3,34)
-            #cs = ax.contourf(line,depth,varP,levels=levels, cmap=plt.cm.jet)
-            cs = plt.contourf(line,depth,varP,levels=levels, vmax=cmax,vmin=cmin,
+            fig.add_subplot(111)
+            cs = plt.contourf(line,depP,varP,levels=levels, vmax=cmax,vmin=cmin,
                               cmap=plt.get_cmap('jet'))
             cbar = fig.colorbar(cs)
-            #cbar.set_label(title, rotation=-90,labelpad=30)
-            plt.contour(line,depth,varP,cs.levels) #, linewidths=0.5,colors='k')
-            #ax.set_title()
+            plt.contour(line,depP,varP,cs.levels)
             plt.title(title)
-            #scale = 1
-            #ticks = ticker.FuncFormatter(lambda lon, pos: '{0:g}'.format(lon/scale))
-            #ax.xaxis.set_major_formatter(ticks)
-            #ax.yaxis.set_major_formatter(ticks)
             plt.xlabel('Distance along line (m)')
             plt.ylabel('Depth (m)')
+            plt.show()
+
+        return dist, depth, values
+
+    def _vertical_slice(self, var, start_pt, end_pt,
+                        time_ind=[], t_start=[], t_end=[],
+                        title='Title', cmax=[], cmin=[], debug=False):
+        """
+        Draw vertical slice in var along the straight line between
+        start_point, end_pt.
+ 
+        Inputs:
+        ------
+          - var = 2D dimensional (sigma level, element) variable, array
+          - start_pt = starting point, [longitude, latitude]
+          - end_pt = ending point, [longitude, latitude]
+
+        Keywords:
+        --------
+          - time_ind = reference time indices for surface elevation, list of integer
+          - t_start = start time, as a string ('yyyy-mm-ddThh:mm:ss'),
+                      or time index as an integer
+          - t_end = end time, as a string ('yyyy-mm-ddThh:mm:ss'),
+                    or time index as an integer
+
+        Keywords for plot:
+        -----------------
+          - title = plot title, string
+          - cmin = minimum limit colorbar
+          - cmax = maximum limit colorbar
+
+        Notes:
+        -----
+          - see transect to get the section data
+        """
+        self.transect(var, [start_pt[0], end_pt[0]], [start_pt[1], end_pt[1]],
+                      time_ind=time_ind, t_start=t_start, t_end=t_end,
+                      graph=True, title=title, cmax=cmax, cmin=cmin, debug=debug)
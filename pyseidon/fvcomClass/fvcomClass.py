@@ -11,7 +11,6 @@ from utide import solve, reconstruct
 from scipy.io import netcdf
 from scipy.io import savemat
 from scipy.io import loadmat
-from pydap.client import open_url
 import cPickle as pkl
 import copy
 
@@ -21,6 +20,7 @@ sys.path.append('../utilities/')
 #Utility import
 from shortest_element_path import shortest_element_path
 from object_from_dict import ObjectFromDict
+from opendap_utils import open_url_cached
 
 #Local import
 from variablesFvcom import _load_var, _load_grid
@@ -56,8 +56,17 @@ Options:
   - ax = defines for a specific spatial region to work with, as such:
              ax = [minimun longitude, maximun longitude,
                  minimun latitude, maximum latitude]
+         or a list of such boxes, or a polygon, as such:
+             ax = [[lon 1, lat 1], [lon 2, lat 2], [lon 3, lat 3], ...]
          or use one of the following pre-defined region:
-             ax = 'GP', 'PP', 'DG' or 'MP'
+             ax = 'GP', 'PP' or 'DG'
+         Note that pre-defined regions are read from
+         pyseidon/utilities/regions.cfg and that other ones can be added
+         with load_regions('path_to_file/filename.cfg').
+         Note that, for all kinds of regions, the elements with at least
+         one node within the region are kept.
+         Note that, with cache=True, re-indexed regions are cached in
+         ~/.pyseidon/regions and re-used for any file sharing the same mesh.
          Note that this option permits to extract partial data from the overall file
          and therefore reduce memory and cpu use.
 
@@ -67,6 +76,29 @@ Options:
          Note that this option permits to extract partial data from the overall file
          and therefore reduce memory and cpu use.
 
+  - chunk = number of time steps read at once from a local netcdf file
+            when ax or tx are used, integer.
+            Note that this option permits to bound the memory used during
+            loading, by default the whole time window is read at once.
+
+  - lazy = if True, FVCOM.Variables (el, ua, va, u, v, w, gls, tke) are only
+           read from the file or the OpenDap server, within ax and tx,
+           the first time they are accessed.
+           Note that this option permits to reduce memory and cpu use when
+           only a few variables are needed.
+
+  - nthreads = maximum number of concurrent requests to the OpenDap server,
+               integer. All variables are fetched at once and failed
+               requests are retried. Use nthreads=1 for sequential requests.
+               Note that the number of requests issued and of bytes received
+               are kept in FVCOM.Variables._opendap_stats, and printed in
+               debug mode.
+
+  - cache = if True, re-indexed regions (see ax) and the slices read from
+            an OpenDap server are kept on disk, in ~/.pyseidon (see
+            utilities/opendap_utils.py), so that re-opening the same file
+            or url is served from disk. Off by default.
+
 Notes:
 -----
   Throughout the package, the following conventions apply:
@@ -77,7 +109,8 @@ Notes:
   - Depth = 0m is the free surface and depth is negative
     '''
 
-    def __init__(self, filename, ax=[], tx=[], debug=False):
+    def __init__(self, filename, ax=[], tx=[], chunk=[], lazy=False,
+                 nthreads=4, cache=False, debug=False):
         ''' Initialize FVCOM class.'''
         self._debug = debug
         if debug:
@@ -96,7 +129,7 @@ Notes:
                 if self._origin_file.startswith('http'):
                     #Look for file through OpenDAP server
                     print "Retrieving data through OpenDap server..."
-                    self.Data = open_url(data['Origin'])
+                    self.Data = open_url_cached(data['Origin'], cache=cache)
                     #Create fake attribut to be consistent with the rest of the code
                     self.Data.variables = self.Data
                 else:
@@ -114,7 +147,7 @@ Notes:
             if filename.startswith('http'):
                 #Look for file through OpenDAP server
                 print "Retrieving data through OpenDap server..."
-                self.Data = open_url(filename)
+                self.Data = open_url_cached(filename, cache=cache)
                 #Create fake attribut to be consistent with the rest of the code
                 self.Data.variables = self.Data
             else:
@@ -136,11 +169,15 @@ Notes:
                 self.Grid = _load_grid(self.Data,
                                        ax,
                                        self.History,
+                                       cache=cache,
                                        debug=self._debug)
                 self.Variables = _load_var(self.Data,
                                            self.Grid,
                                            tx,
                                            self.History,
+                                           chunk=chunk,
+                                           lazy=lazy,
+                                           nthreads=nthreads,
                                            debug=self._debug)
             except MemoryError:
                 print '---Data too large for machine memory---'
@@ -266,6 +303,11 @@ Notes:
         debug = debug or self._debug
         if debug:
             print 'Saving file...'
+        #Force loading of lazy variables
+        for key in self.Variables.__dict__.get('_lazy', {}).keys():
+            if debug:
+                print "Force loading for " + key
+            getattr(self.Variables, key)
         #Define bounding box
         if debug:
             print "Computing bounding box..."
@@ -286,18 +328,20 @@ Notes:
             #TR: Force caching Variables otherwise error during loading
             #    with 'netcdf4.Variable' type (see above)
             for key in data['Variables']:
-                listkeys=['Variable', 'ArrayProxy', 'BaseType'] 
-                if any([type(data['Variables'][key]).__name__==x for x in listkeys]):
+                if hasattr(data['Variables'][key], '__array__') and \
+                   not isinstance(data['Variables'][key], np.ndarray):
                     if debug:
                         print "Force caching for " + key
                     data['Variables'][key] = data['Variables'][key][:]
             #Unpickleable objects
             data['Grid'].pop("triangle", None)
+            data['Grid'].pop("ele_tree", None)
+            data['Grid'].pop("node_tree", None)
             #TR: Force caching Variables otherwise error during loading
             #    with 'netcdf4.Variable' type (see above)
             for key in data['Grid']:
-                listkeys=['Variable', 'ArrayProxy', 'BaseType'] 
-                if any([type(data['Grid'][key]).__name__==x for x in listkeys]):
+                if hasattr(data['Grid'][key], '__array__') and \
+                   not isinstance(data['Grid'][key], np.ndarray):
                     if debug:
                         print "Force caching for " + key
                     data['Grid'][key] = data['Grid'][key][:]
@@ -331,8 +375,8 @@ Notes:
             #TR: Force caching Variables otherwise error during loading
             #    with 'netcdf4.Variable' type (see above)
             for key in Var:
-                listkeys=['Variable', 'ArrayProxy', 'BaseType'] 
-                if any([type(Var[key]).__name__==x for x in listkeys]):
+                if hasattr(Var[key], '__array__') and \
+                   not isinstance(Var[key], np.ndarray):
                     if debug:
                         print "Force caching for " + key
                     Var[key] = Var[key][:]
@@ -341,9 +385,11 @@ Notes:
                 data[key] = Var[key]
             #Unpickleable objects
             Grd.pop("triangle", None)
+            Grd.pop("ele_tree", None)
+            Grd.pop("node_tree", None)
             for key in Grd:
-                listkeys=['Variable', 'ArrayProxy', 'BaseType'] 
-                if any([type(Grd[key]).__name__==x for x in listkeys]):
+                if hasattr(Grd[key], '__array__') and \
+                   not isinstance(Grd[key], np.ndarray):
                     if debug:
                         print "Force caching for " + key
                     Grd[key] = Grd[key][:]
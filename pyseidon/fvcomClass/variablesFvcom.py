@@ -3,14 +3,82 @@
 
 from __future__ import division
 #from jdcal import gcal2jd
+import sys
 import numpy as np
 import matplotlib.tri as Tri
-from itertools import groupby
-from operator import itemgetter
 #Local import
 from regioner import *
 from miscellaneous import time_to_index
 from miscellaneous import mattime_to_datetime
+from opendap_utils import opendap_take, opendap_take_many, NTHREADS
+
+def _bulk_load(var, ts, te, index=slice(None), chunk=[], debug=False):
+    """
+    Reads a contiguous time window of a netcdf variable in bulk,
+    i.e. var[ts:te, ..., index], instead of looping on time indices.
+
+    Inputs:
+    ------
+      - var = netcdf variable data, numpy array or memory map,
+              dim=(time, node or nele) or (time, level, node or nele)
+      - ts = first time index, integer
+      - te = last time index + 1, integer
+
+    Keywords:
+    --------
+      - index = node or element indices to extract, 1D array of integers
+      - chunk = number of time steps read per slicing operation, integer.
+                Bounds the size of the temporary arrays, default reads
+                the whole window at once
+
+    Outputs:
+    -------
+      - out = var[ts:te, ..., index], numpy array
+    """
+    if type(index)==slice:
+        nspace = np.arange(var.shape[-1])[index].shape[0]
+    else:
+        nspace = len(index)
+    out = np.zeros((te - ts,) + var.shape[1:-1] + (nspace,))
+    if chunk==[] or chunk<1:
+        chunk = max(te - ts, 1)
+    for i in range(ts, te, chunk):
+        j = min(i + chunk, te)
+        if debug: print 'Time bound: ' + str(i) + '-' + str(j)
+        if type(index)==slice:
+            out[(i-ts):(j-ts),...] = var[i:j,...,index]
+        else:
+            #np.take is much faster than fancy indexing on memory mapped arrays
+            out[(i-ts):(j-ts),...] = np.take(var[i:j], index, axis=-1)
+
+    return out
+
+def _opendap_load(var, ts, te, index, nthreads=NTHREADS, stats=None,
+                  debug=False):
+    """
+    Reads var[ts:te, ..., index] from an OpenDap variable, grouping index
+    into a few ranges requested concurrently, see opendap_take.
+
+    Inputs:
+    ------
+      - var = OpenDap variable data, array proxy
+      - ts = first time index, integer
+      - te = last time index + 1, integer
+      - index = node or element indices to extract, 1D array of integers
+
+    Keywords:
+    --------
+      - nthreads = maximum number of concurrent requests, integer
+      - stats = request counters, dictionary, see opendap_take_many
+
+    Outputs:
+    -------
+      - out = var[ts:te, ..., index], numpy array
+    """
+    #TR comment: data.variables['ww'].data[:,:,region_n] doesn't
+    #            work with non consecutive indices
+    return opendap_take(var, index, lead=(slice(ts, te),), nthreads=nthreads,
+                        stats=stats, debug=debug)
 
 class _load_var:
     """
@@ -41,18 +109,24 @@ Some others shall be generated as methods are being called, ex:
                   |               3D array (ntime, nlevel, nele)
                   |_vorticity...            
     """
-    def __init__(self, data, grid, tx, History, debug=False):
+    def __init__(self, data, grid, tx, History, chunk=[], lazy=False,
+                 nthreads=NTHREADS, debug=False):
         self._debug = debug
         #Pointer to History
         self._History = History
         History = self._History
+        #Variables to be loaded on first access, see __getattr__
+        self._lazy = {}
+        #OpenDap requests issued and bytes received, see opendap_take_many
+        self._nthreads = nthreads
+        self._opendap_stats = {'requests': 0, 'bytes': 0}
 
         #List of keywords
         kwl2D = ['ua', 'va', 'zeta']
         kwl3D = ['ww', 'u', 'v', 'gls', 'tke']
         #List of aliaSes
         al2D = ['ua', 'va', 'el']
-        al3D = ['u', 'u', 'v', 'gls', 'tke'] 
+        al3D = ['w', 'u', 'v', 'gls', 'tke'] 
 
         #Check if time period defined
         self.julianTime = data.variables['time']      
@@ -73,38 +147,17 @@ Some others shall be generated as methods are being called, ex:
             if debug: print "ntime: ", grid.ntime
             if debug: print "region_t shape: ", region_t.shape
 
+            if lazy:
+                self._lazy_link(data, grid, ts, te, kwl2D, al2D, kwl3D, al3D,
+                                chunk=chunk, debug=debug)
             #Check if bounding box has been defined
-            if grid._ax==[]:
+            elif grid._ax==[]:
                 if debug:
                     print 'Loading variables...'
                 #Check if OpenDap variables or not
                 if type(data.variables).__name__=='DatasetType':
-                    #loading hori data
-                    keyCount = 0
-                    for key, aliaS in zip(kwl2D, al2D):
-                        try:
-                            setattr(self, aliaS, data.variables[key].data[ts:te,:])
-                            keyCount +=1
-                        except KeyError:
-                            if debug: print key, " is missing !"
-                            continue
-                    if keyCount==0:
-                        print "---Horizontal variables are missing---"
-                    self._3D = False 
-                    
-                    #loading verti data
-                    keyCount = 0
-                    for key, aliaS in zip(kwl3D, al3D):
-                        try:
-                            setattr(self, aliaS, data.variables[key].data[ts:te,:,:])
-                            keyCount +=1
-                        except KeyError:
-                            if debug: print key, " is missing !"
-                            continue
-                    if keyCount==0:
-                        print "---Vertical variables are missing---"
-                    else:
-                        self._3D = True
+                    self._opendap_fetch(data, ts, te, kwl2D, al2D, kwl3D, al3D,
+                                        debug=debug)
 
                 #Not OpenDap
                 else:
@@ -112,19 +165,9 @@ Some others shall be generated as methods are being called, ex:
                     keyCount = 0
                     for key, aliaS in zip(kwl2D, al2D):
                         try:
-                            if key=='zeta':
-                                setattr(self, aliaS, np.zeros((grid.ntime, grid.nnode)))
-                            else:
-                                setattr(self, aliaS, np.zeros((grid.ntime, grid.nele)))
-                            I = 0
-                            for i in region_t:
-                                #TR comment: looping on time indices is a trick from
-                                #            Mitchell to improve loading time
-                                #TR comment: no idea why I have to transpose here but
-                                #            I do !!
-                                getattr(self, aliaS)[I,:] =\
-                                        np.transpose(data.variables[key].data[i,:])
-                                I += 1
+                            setattr(self, aliaS,
+                                    _bulk_load(data.variables[key].data, ts, te,
+                                               chunk=chunk, debug=debug))
                             keyCount +=1
                         except KeyError:
                             if debug: print key, " is missing !"
@@ -137,19 +180,9 @@ Some others shall be generated as methods are being called, ex:
                     keyCount = 0
                     for key, aliaS in zip(kwl3D, al3D):
                         try:
-                            testKey = data.variables[key]
-                            del testKey
                             setattr(self, aliaS,
-                                    np.zeros((grid.ntime,grid.nlevel, grid.nele)))
-                            I = 0
-                            for i in region_t:
-                                #TR comment: looping on time indices is a trick from
-                                #            Mitchell to improve loading time
-                                #TR comment: no idea why I have to transpose here but
-                                #            I do !!
-                                getattr(self, aliaS)[I,:,:] =\
-                                        np.transpose(data.variables[key].data[i,:,:])
-                                I += 1
+                                    _bulk_load(data.variables[key].data, ts, te,
+                                               chunk=chunk, debug=debug))
                             keyCount +=1
                         except KeyError:
                             if debug: print key, " is missing !"
@@ -170,72 +203,9 @@ Some others shall be generated as methods are being called, ex:
                 #Redefine variables in bounding box & time period
                 #Check if OpenDap variables or not
                 if type(data.variables).__name__=='DatasetType':
-                    #Special loading for zeta
-                    H = 0 #local counter
-                    key = kwl2D.pop(2)
-                    aliaS = al2D.pop(2)
-                    for k, g in groupby(enumerate(region_n), lambda (i,x):i-x):
-                        ID = map(itemgetter(1), g)
-                        if debug: print 'Index bound: ' +\
-                            str(ID[0]) + '-' + str(ID[-1]+1)
-                        if H==0:
-                            setattr(self, aliaS,
-                                    data.variables[key].data[ts:te,ID[0]:(ID[-1]+1)])
-                            H=1
-                        else:
-                            setattr(self, aliaS,
-                            np.hstack((getattr(self, aliaS),
-                            data.variables[key].data[ts:te,ID[0]:(ID[-1]+1)])))
-                    #loading hori data
-                    keyCount = 0
-                    for key, aliaS in zip(kwl2D, al2D):
-                        try:
-                            H = 0 #local counter
-                            for k, g in groupby(enumerate(region_e), lambda (i,x):i-x):
-                                ID = map(itemgetter(1), g)
-                                if debug: print 'Index bound: ' +\
-                                          str(ID[0]) + '-' + str(ID[-1]+1)
-                                if H==0:
-                                    setattr(self, aliaS,
-                                    data.variables[key].data[ts:te,ID[0]:(ID[-1]+1)])
-                                    H=1
-                                else:
-                                    setattr(self, aliaS,
-                                    np.hstack((getattr(self, aliaS),
-                                    data.variables[key].data[ts:te,ID[0]:(ID[-1]+1)])))
-                            keyCount +=1
-                        except KeyError:
-                            if debug: print key, " is missing !"
-                            continue
-                    if keyCount==0:
-                        print "---Horizontal variables are missing---"
-                    self._3D = False 
-                    
-                    #loading verti data
-                    keyCount = 0
-                    for key, aliaS in zip(kwl3D, al3D):
-                        try:
-                            H = 0 #local counter
-                            for k, g in groupby(enumerate(region_e), lambda (i,x):i-x):
-                                ID = map(itemgetter(1), g)
-                                if debug: print 'Index bound: ' +\
-                                          str(ID[0]) + '-' + str(ID[-1]+1)
-                                if H==0:
-                                    setattr(self, aliaS, data.variables[key].data\
-                                                       [ts:te,:,ID[0]:(ID[-1]+1)])
-                                    H=1
-                                else:
-                                    setattr(self, aliaS,
-                                    np.dstack((getattr(self, aliaS),
-                                    data.variables[key].data[ts:te,:,ID[0]:(ID[-1]+1)])))
-                            keyCount +=1
-                        except KeyError:
-                            if debug: print key, " is missing !"
-                            continue
-                    if keyCount==0:
-                        print "---Vertical variables are missing---"
-                    else:
-                         self._3D = True
+                    self._opendap_fetch(data, ts, te, kwl2D, al2D, kwl3D, al3D,
+                                        region_n=region_n, region_e=region_e,
+                                        debug=debug)
 
                 #Not OpenDap
                 else:
@@ -244,27 +214,13 @@ Some others shall be generated as methods are being called, ex:
                     for key, aliaS in zip(kwl2D, al2D):
                         try:
                             if key=='zeta':
-                                setattr(self, aliaS, np.zeros((grid.ntime, grid.nnode)))
-                                I = 0
-                                for i in region_t:
-                                    #TR comment: looping on time indices is a trick from
-                                    #            Mitchell to improve loading time
-                                    #TR comment: no idea why I have to transpose here but
-                                    #            I do !!
-                                    getattr(self, aliaS)[I,:] =\
-                                    np.transpose(data.variables[key].data[i,region_n])
-                                    I += 1
+                                index = region_n
                             else:
-                                setattr(self, aliaS, np.zeros((grid.ntime, grid.nele)))
-                                I = 0
-                                for i in region_t:
-                                    #TR comment: looping on time indices is a trick from
-                                    #            Mitchell to improve loading time
-                                    #TR comment: no idea why I have to transpose here but
-                                    #            I do !!
-                                    getattr(self, aliaS)[I,:] =\
-                                    np.transpose(data.variables[key].data[i,region_e])
-                                    I += 1
+                                index = region_e
+                            setattr(self, aliaS,
+                                    _bulk_load(data.variables[key].data, ts, te,
+                                               index=index, chunk=chunk,
+                                               debug=debug))
                             keyCount +=1
                         except KeyError:
                             if debug: print key, " is missing !"
@@ -275,21 +231,12 @@ Some others shall be generated as methods are being called, ex:
                     
                     #loading verti data
                     keyCount = 0
-                    for key in zip(kwl3D, al3D):
+                    for key, aliaS in zip(kwl3D, al3D):
                         try:
-                            testKey = data.variables[key]
-                            del testKey
-                            setattr(self, alias,
-                            np.zeros((grid.ntime,grid.nlevel, grid.nele)))
-                            I=0
-                            for i in region_t:
-                                #TR comment: looping on time indices is a trick from
-                                #            Mitchell to improve loading time
-                                #TR comment: no idea why I have to transpose here but
-                                #            I do !!
-                                getattr(self, aliaS)[I,:,:] =\
-                                np.transpose(data.variables[key].data[i,:,region_e])
-                                I += 1
+                            setattr(self, aliaS,
+                                    _bulk_load(data.variables[key].data, ts, te,
+                                               index=region_e, chunk=chunk,
+                                               debug=debug))
                             keyCount +=1
                         except KeyError:
                             if debug: print key, " is missing !"
@@ -313,8 +260,13 @@ Some others shall be generated as methods are being called, ex:
             #Add time dimension to grid variables
             grid.ntime = self.julianTime.shape[0]
 
+            #No loading needed when linking variables
+            if lazy and not grid._ax==[]:
+                self._lazy_link(data, grid, 0, grid.ntime,
+                                kwl2D, al2D, kwl3D, al3D,
+                                chunk=chunk, debug=debug)
             #Check if bounding box has been defined
-            if grid._ax==[]:
+            elif grid._ax==[]:
                 if debug:
                     print 'Linking variables...'
 
@@ -356,72 +308,9 @@ Some others shall be generated as methods are being called, ex:
                 #Redefine variables in bounding box
                 #Check if OpenDap variables or not
                 if type(data.variables).__name__=='DatasetType':
-                    #loading hori data
-                    keyCount = 0
-                    for key, aliaS in zip(kwl2D, al2D):
-                        #Special loading for zeta
-                        H = 0 #local counter
-                        if key == 'zeta':
-                            for k, g in groupby(enumerate(region_n), lambda (i,x):i-x):
-                                ID = map(itemgetter(1), g)
-                                if debug: print 'Index bound: ' +\
-                                    str(ID[0]) + '-' + str(ID[-1]+1)
-                                if H==0:
-                                    setattr(self, aliaS,
-                                    data.variables[key].data[:,ID[0]:(ID[-1]+1)])
-                                    H=1
-                                else:
-                                    setattr(self, aliaS,
-                                    np.hstack((getattr(self, aliaS),
-                                    data.variables[key].data[:,ID[0]:(ID[-1]+1)])))
-                        else:
-                            try:                        
-                                for k, g in groupby(enumerate(region_e), lambda (i,x):i-x):
-                                    ID = map(itemgetter(1), g)
-                                    if debug: print 'Index bound: ' +\
-                                              str(ID[0]) + '-' + str(ID[-1]+1)
-                                    if H==0:
-                                        setattr(self, aliaS,
-                                                data.variables[key].\
-                                                data[:,ID[0]:(ID[-1]+1)])
-                                        H=1
-                                    else:
-                                        setattr(self, aliaS,
-                                        np.hstack((getattr(self, aliaS),
-                                        data.variables[key].data[:,ID[0]:(ID[-1]+1)])))
-                                    keyCount +=1
-                            except KeyError:
-                                if debug: print key, " is missing !"
-                                continue
-                    if keyCount==0:
-                        print "---Horizontal variables are missing---"
-                    self._3D = False 
-                    
-                    #loading verti data
-                    keyCount = 0
-                    for key, aliaS in zip(kwl3D, al3D):
-                        try:
-                            H = 0 #local counter
-                            for k, g in groupby(enumerate(region_e), lambda (i,x):i-x):
-                                ID = map(itemgetter(1), g)
-                                if debug: print 'Index bound: ' +\
-                                          str(ID[0]) + '-' + str(ID[-1]+1)
-                                if H==0:
-                                    setattr(self, aliaS,
-                                    data.variables[key].data[:,:,ID[0]:(ID[-1]+1)])
-                                    H=1
-                                else:
-                                    setattr(self, aliaS,
-                                    np.dstack((getattr(self, aliaS),
-                                    data.variables[key].data[:,:,ID[0]:(ID[-1]+1)])))
-                            keyCount +=1
-                        except KeyError:
-                            if debug: print key, " is missing !"
-                            continue
-                    if keyCount==0:
-                        print "---Vertical variables are missing---"
-                    else:
-                        self._3D = True
+                    self._opendap_fetch(data, 0, grid.ntime, kwl2D, al2D, kwl3D, al3D,
+                                        region_n=region_n, region_e=region_e,
+                                        debug=debug)
 
                 #Not OpenDap
                 else:
@@ -430,23 +319,13 @@ Some others shall be generated as methods are being called, ex:
                     for key, aliaS in zip(kwl2D, al2D):
                         try:
                             if key=='zeta':
-                                setattr(self, aliaS, np.zeros((grid.ntime, grid.nnode)))
-                                for i in range(grid.ntime):
-                                    #TR comment: looping on time indices is a trick from
-                                    #            Mitchell to improve loading time
-                                    #TR comment: no idea why I have to transpose here but
-                                    #            I do !!
-                                    getattr(self, aliaS)[i,:] =\
-                                    np.transpose(data.variables[key].data[i,region_n])
+                                index = region_n
                             else:
-                                setattr(self, aliaS, np.zeros((grid.ntime, grid.nele)))
-                                for i in range(grid.ntime):
-                                    #TR comment: looping on time indices is a trick from
-                                    #            Mitchell to improve loading time
-                                    #TR comment: no idea why I have to transpose here but
-                                    #            I do !!
-                                    getattr(self, aliaS)[i,:] =\
-                                    np.transpose(data.variables[key].data[i,region_e])
+                                index = region_e
+                            setattr(self, aliaS,
+                                    _bulk_load(data.variables[key].data,
+                                               0, grid.ntime, index=index,
+                                               chunk=chunk, debug=debug))
                             keyCount +=1
                         except KeyError:
                             if debug: print key, " is missing !"
@@ -459,17 +338,10 @@ Some others shall be generated as methods are being called, ex:
                     keyCount = 0
                     for key, aliaS in zip(kwl3D, al3D):
                         try:
-                            testKey = data.variables[key]
-                            del testKey
                             setattr(self, aliaS,
-                            np.zeros((grid.ntime,grid.nlevel, grid.nele)))
-                            for i in range(grid.ntime):
-                                #TR comment: looping on time indices is a trick from
-                                #            Mitchell to improve loading time
-                                #TR comment: no idea why I have to transpose here but
-                                #            I do !!
-                                getattr(self, aliaS)[i,:,:] =\
-                                np.transpose(data.variables[key].data[i,:,region_e])
+                                    _bulk_load(data.variables[key].data,
+                                               0, grid.ntime, index=region_e,
+                                               chunk=chunk, debug=debug))
                             keyCount +=1
                         except KeyError:
                             if debug: print key, " is missing !"
@@ -481,6 +353,108 @@ Some others shall be generated as methods are being called, ex:
         if debug:
             print '...Passed'
 
+    def __getattr__(self, name):
+        '''Loads variables registered by _lazy_link on first access'''
+        if name.startswith('_') or not name in self.__dict__.get('_lazy', {}):
+            raise AttributeError(name)
+        var, ts, te, index, chunk = self._lazy.pop(name)
+        if self._debug:
+            print 'Loading ' + name + '...'
+        #Check if OpenDap variables or not
+        if isinstance(var, np.ndarray):
+            value = _bulk_load(var, ts, te, index=index, chunk=chunk,
+                               debug=self._debug)
+        elif type(index)==slice:
+            value = var[(slice(ts, te),) + (slice(None),)*(len(var.shape)-1)]
+        else:
+            value = _opendap_load(var, ts, te, index, nthreads=self._nthreads,
+                                  stats=self._opendap_stats, debug=self._debug)
+        setattr(self, name, value)
+
+        return value
+
+    def _opendap_fetch(self, data, ts, te, kwl2D, al2D, kwl3D, al3D,
+                       region_n=slice(None), region_e=slice(None),
+                       debug=False):
+        '''Fetches OpenDap variables concurrently within ts:te and region'''
+        debug = debug or self._debug
+        requests = {}
+        for key, aliaS in zip(kwl2D, al2D) + zip(kwl3D, al3D):
+            try:
+                var = data.variables[key].data
+            except KeyError:
+                if debug: print key, " is missing !"
+                continue
+            if key=='zeta':
+                index = region_n
+            else:
+                index = region_e
+            if type(index)==slice:
+                index = np.arange(var.shape[-1])[index]
+            requests[aliaS] = (var, index, (slice(ts, te),))
+        out = opendap_take_many(requests, nthreads=self._nthreads,
+                                stats=self._opendap_stats, debug=debug)
+        for aliaS in out.keys():
+            setattr(self, aliaS, out[aliaS])
+
+        if not any(aliaS in out for aliaS in al2D):
+            print "---Horizontal variables are missing---"
+        if not any(aliaS in out for aliaS in al3D):
+            print "---Vertical variables are missing---"
+            self._3D = False
+        else:
+            self._3D = True
+        if debug:
+            print '-OpenDap: ' + str(self._opendap_stats['requests']) +\
+                  ' requests, ' + str(self._opendap_stats['bytes']) + ' bytes-'
+
+    def _lazy_link(self, data, grid, ts, te, kwl2D, al2D, kwl3D, al3D,
+                   chunk=[], debug=False):
+        '''Registers variables to be loaded on first access'''
+        debug = debug or self._debug
+        if debug:
+            print 'Linking variables...'
+        #Bounding box
+        if grid._ax==[]:
+            region_e = slice(None)
+            region_n = slice(None)
+        else:
+            region_e = grid._element_index
+            region_n = grid._node_index
+
+        #linking hori data
+        keyCount = 0
+        for key, aliaS in zip(kwl2D, al2D):
+            try:
+                if key=='zeta':
+                    index = region_n
+                else:
+                    index = region_e
+                self._lazy[aliaS] = (data.variables[key].data, ts, te,
+                                     index, chunk)
+                keyCount +=1
+            except KeyError:
+                if debug: print key, " is missing !"
+                continue
+        if keyCount==0:
+            print "---Horizontal variables are missing---"
+        self._3D = False
+
+        #linking verti data
+        keyCount = 0
+        for key, aliaS in zip(kwl3D, al3D):
+            try:
+                self._lazy[aliaS] = (data.variables[key].data, ts, te,
+                                     region_e, chunk)
+                keyCount +=1
+            except KeyError:
+                if debug: print key, " is missing !"
+                continue
+        if keyCount==0:
+            print "---Vertical variables are missing---"
+        else:
+            self._3D = True
+
     def _t_region(self, tx, debug=False):
         '''Return time indices included in time period, aka tx'''
         debug = debug or self._debug      
@@ -526,8 +500,10 @@ Some grid data are directly passed on from FVCOM output:
 Some others shall be generated as methods are being called, ex:
              ...
              |_triangle = triangulation object for plotting purposes    
+             |_ele_tree = KD-tree of the element centres for point searches
+             |_node_tree = KD-tree of the nodes for point searches
     '''
-    def __init__(self, data, ax, History, debug=False):
+    def __init__(self, data, ax, History, cache=False, debug=False):
         self._debug = debug   
         if debug:
             print 'Loading grid...'
@@ -569,17 +545,15 @@ Some others shall be generated as methods are being called, ex:
                 self.nnode = data.lon.shape[0]
         else:
             #Checking for pre-defined regions
-            if ax=='GP':
-                ax=[-66.36, -66.31, 44.24, 44.3]
-            elif ax=='PP':
-                ax=[-66.23, -66.19, 44.37, 44.41]
-            elif ax=='DG':
-                ax=[-65.84, -65.73, 44.64, 44.72]
-            #elif ax=='MP':
-            #    ax=[
-           
+            if type(ax)==str:
+                if not ax in REGIONS:
+                    print "---Region " + ax + " is not defined, see load_regions---"
+                    sys.exit()
+                ax = REGIONS[ax]
+            ax = np.asarray(ax).tolist()
+
             print 'Re-indexing may take some time...'   
-            Data = regioner(self, ax, debug=debug)
+            Data = regioner(self, ax, cache=cache, debug=debug)
             self.lon = Data['lon'][:]
             self.lat = Data['lat'][:]
             self.lonc = Data['lonc'][:]
@@ -602,26 +576,14 @@ Some others shall be generated as methods are being called, ex:
 
             #different loading technique if using OpenDap server
             if type(data.variables).__name__=='DatasetType':
-                #Split into consecutive integers to optimise loading
                 #TR comment: data.variables['ww'].data[:,:,region_n] doesn't
                 #            work with non consecutive indices
-                H=0
-                for k, g in groupby(enumerate(self._node_index), lambda (i,x):i-x):
-                    ID = map(itemgetter(1), g)
-                    if debug: print 'Index bound: ' +\
-                        str(ID[0]) + '-' + str(ID[-1]+1)
-                    if H==0:
-                        self.h = data.variables['h'].data[ID[0]:(ID[-1]+1)]
-                        self.siglay = data.variables['siglay'].data[:,ID[0]:(ID[-1]+1)]
-                        self.siglev = data.variables['siglev'].data[:,ID[0]:(ID[-1]+1)]
-                    else:
-                        self.h = np.hstack((self.h,
-                        data.variables['h'].data[ID[0]:(ID[-1]+1)]))
-                        self.siglay = np.hstack((self.siglay,
-                        data.variables['siglay'].data[:,ID[0]:(ID[-1]+1)]))
-                        self.siglev = np.hstack((self.siglev,
-                        data.variables['siglev'].data[:,ID[0]:(ID[-1]+1)]))
-                    H=1
+                self.h = opendap_take(data.variables['h'].data,
+                                      self._node_index, debug=debug)
+                self.siglay = opendap_take(data.variables['siglay'].data,
+                                           self._node_index, debug=debug)
+                self.siglev = opendap_take(data.variables['siglev'].data,
+                                           self._node_index, debug=debug)
             else:
                 self.h = data.variables['h'].data[self._node_index]
                 self.siglay = data.variables['siglay'].data[:,self._node_index]
@@ -633,9 +595,14 @@ Some others shall be generated as methods are being called, ex:
 
             del Data
             #Define bounding box
-            self._ax = ax
+            self._ax = region_bounds(ax)
             # Add metadata entry
-            text = 'Bounding box =' + str(ax)
+            if region_type(ax)=='box':
+                text = 'Bounding box =' + str(ax)
+            else:
+                #Polygon or list of boxes
+                self._region = ax
+                text = 'Region =' + str(ax)
             self._History.append(text)
             print '-Now working in bounding box-'
     
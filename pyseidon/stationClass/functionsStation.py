@@ -114,7 +114,7 @@ class FunctionsStation:
         #Rose diagram
         self._plot.rose_diagram(dirFlow, norm)
         if exceedance:
-            self.exceedance(norm)
+            self.exceedance(norm, time_ind=argtime)
 
         return dirFlow, norm
 
@@ -235,7 +235,8 @@ class FunctionsStation:
 
         return floodIndex, ebbIndex, pr_axis, pr_ax_var
 
-    def exceedance(self, var, station=[], debug=False):
+    def exceedance(self, var, station=[], time_ind=[], bins=30, chunk=[],
+                   graph=True, debug=False):
         """
         This function calculate the excedence curve of a var(time).
 
@@ -246,60 +247,52 @@ class FunctionsStation:
         Keywords:
         --------
           - station = either station index (interger) or name (string)
-                      Necessary if var = 2D (i.e. [time, nnode or nele]
+                      If var = 2D (i.e. [time, nnode or nele]) and no
+                      station is given, curves are computed at every station
+          - time_ind = time indices of var samples, list of integers.
+                       By default var covers the whole time period
+          - bins = number of amplitude bins, integer, or amplitudes, 1D array
+          - chunk = number of time steps processed at once, integer
           - graph: True->plots curve; False->does not
 
         Outputs:
         -------
-          - Exceedance = list of % of occurences, 1D array
+          - Exceedance = list of % of occurences, 1D array,
+                         or 2D array (nbins, nstation) for every station
           - Ranges = list of signal amplitude bins, 1D array
 
         Notes:
         -----
           - This method is not suitable for SSE
+          - Time steps can be irregular
         """
         debug = (debug or self._debug)
         if debug:
             print 'Computing exceedance...'
 
         #Distinguish between 1D and 2D var
-        if len(var.shape)>1:
-            if station==[]:
-                print 'Lon, lat coordinates are needed'
-                sys.exit()
+        if len(var.shape)>1 and not station==[]:
             #Search for the station
             index = self.search_index(station)
             signal = var[:,index] 
         else:
             signal=var
-        
-        Max = max(signal)	
-        dy = (Max/30.0)
-        Ranges = np.arange(0,(Max + dy), dy)
-        Exceedance = np.zeros(Ranges.shape[0])
-        dt = self._var.julianTime[1] - self._var.julianTime[0]
-        if dt==0:
-            dt = self._var.secondTime[1] - self._var.secondTime[0]
-        Period = var.shape[0] * dt
-        time = np.arange(0.0, Period, dt)
-
-        N = len(signal)
-        M = len(Ranges)
-
-        for i in range(M):
-            r = Ranges[i]
-            for j in range(N-1):
-                if signal[j] > r:
-                    Exceedance[i] = Exceedance[i] + (time[j+1] - time[j])
-
-        Exceedance = (Exceedance * 100) / Period
+
+        time = self._var.julianTime[:]
+        if time[1] - time[0]==0:
+            time = self._var.secondTime[:]
+        if not time_ind==[]:
+            time = time[time_ind]
+        Exceedance, Ranges = exceedance_curve(signal, time, bins=bins,
+                                              chunk=chunk, debug=debug)
 
         if debug:
             print '...Passed'
        
         #Plot
-        self._plot.plot_xy(Exceedance, Ranges, yLabel='Amplitudes',
-                           xLabel='Exceedance probability in %')
+        if graph and len(Exceedance.shape)==1:
+            self._plot.plot_xy(Exceedance, Ranges, yLabel='Amplitudes',
+                               xLabel='Exceedance probability in %')
 
         return Exceedance, Ranges
 
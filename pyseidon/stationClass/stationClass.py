@@ -10,7 +10,6 @@ from utide import solve, reconstruct
 from scipy.io import netcdf
 from scipy.io import savemat
 from scipy.io import loadmat
-from pydap.client import open_url
 import cPickle as pkl
 import copy
 # Need to add closest point
@@ -22,6 +21,7 @@ sys.path.append('../utilities/')
 from shortest_element_path import shortest_element_path
 from object_from_dict import ObjectFromDict
 from miscellaneous import findFiles, _load_nc
+from opendap_utils import open_url_cached
 
 #Local import
 from variablesStation import _load_var, _load_grid
@@ -59,6 +59,9 @@ Inputs:
 Options:
 -------
   - elements = indices to extract, list of integers
+  - cache = if True, the slices read from an OpenDap server are kept on
+            disk, in ~/.pyseidon/opendap (see utilities/opendap_utils.py).
+            Off by default.
    
 
 Notes:
@@ -70,9 +73,11 @@ Notes:
                  +/-180=West, -90=South
   - Depth = 0m is the free surface and depth is negative
     '''
-    def __init__(self, filename, elements=slice(None), debug=False):
+    def __init__(self, filename, elements=slice(None), cache=False,
+                 debug=False):
         #Class attributs
         self._debug = debug
+        self._cache = cache
         self._isMulti(filename)
         if not self._multi:
             self._load(filename, elements)
@@ -115,7 +120,7 @@ Notes:
                 #Define new 
                 text = 'Created from ' + entry
                 tmp = {}
-                tmp['Data'] = _load_nc(entry)
+                tmp['Data'] = _load_nc(entry, cache=cache)
                 tmp['History'] = [text]
                 tmp['Grid'] = _load_grid(tmp['Data'], elements, [], debug=self._debug)
                 tmp['Variables'] = _load_var(tmp['Data'], elements, tmp['Grid'], [],
@@ -146,7 +151,7 @@ Notes:
                 if self._origin_file.startswith('http'):
                     #Look for file through OpenDAP server
                     print "Retrieving data through OpenDap server..."
-                    self.Data = open_url(data['Origin'])
+                    self.Data = open_url_cached(data['Origin'], cache=self._cache)
                     #Create fake attribut to be consistent with the rest of the code
                     self.Data.variables = self.Data
                 else:
@@ -164,7 +169,7 @@ Notes:
             if filename.startswith('http'):
                 #Look for file through OpenDAP server
                 print "Retrieving data through OpenDap server..."
-                self.Data = open_url(filename)
+                self.Data = open_url_cached(filename, cache=self._cache)
                 #Create fake attribut to be consistent with the rest of the code
                 self.Data.variables = self.Data
             else:
@@ -342,8 +347,8 @@ Notes:
             #TR: Force caching Variables otherwise error during loading
             #    with 'netcdf4.Variable' type (see above)
             for key in data['Variables']:
-                listkeys=['Variable', 'ArrayProxy', 'BaseType'] 
-                if any([type(data['Variables'][key]).__name__==x for x in listkeys]):
+                if hasattr(data['Variables'][key], '__array__') and \
+                   not isinstance(data['Variables'][key], np.ndarray):
                     if debug:
                         print "Force caching for " + key
                     data['Variables'][key] = data['Variables'][key][:]
@@ -352,8 +357,8 @@ Notes:
             #TR: Force caching Variables otherwise error during loading
             #    with 'netcdf4.Variable' type (see above)
             for key in data['Grid']:
-                listkeys=['Variable', 'ArrayProxy', 'BaseType'] 
-                if any([type(data['Grid'][key]).__name__==x for x in listkeys]):
+                if hasattr(data['Grid'][key], '__array__') and \
+                   not isinstance(data['Grid'][key], np.ndarray):
                     if debug:
                         print "Force caching for " + key
                     data['Grid'][key] = data['Grid'][key][:]
@@ -383,8 +388,8 @@ Notes:
             #TR: Force caching Variables otherwise error during loading
             #    with 'netcdf4.Variable' type (see above)
             for key in Var:
-                listkeys=['Variable', 'ArrayProxy', 'BaseType'] 
-                if any([type(Var[key]).__name__==x for x in listkeys]):
+                if hasattr(Var[key], '__array__') and \
+                   not isinstance(Var[key], np.ndarray):
                     if debug:
                         print "Force caching for " + key
                     Var[key] = Var[key][:]
@@ -394,8 +399,8 @@ Notes:
             #Unpickleable objects
             Grd.pop("triangle", None)
             for key in Grd:
-                listkeys=['Variable', 'ArrayProxy', 'BaseType'] 
-                if any([type(Grd[key]).__name__==x for x in listkeys]):
+                if hasattr(Grd[key], '__array__') and \
+                   not isinstance(Grd[key], np.ndarray):
                     if debug:
                         print "Force caching for " + key
                     Grd[key] = Grd[key][:]
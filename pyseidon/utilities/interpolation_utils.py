@@ -7,9 +7,10 @@ import matplotlib.pyplot as plt
 import matplotlib.tri as Tri
 import matplotlib.ticker as ticker
 from matplotlib.path import Path
-from scipy.spatial import KDTree
+from scipy.spatial import cKDTree
+from miscellaneous import element_neighbours
 
-def closest_point( pt_lon, pt_lat, lon, lat, debug=False):
+def closest_point( pt_lon, pt_lat, lon, lat, tree=[], k=1, debug=False):
     '''
     Finds the closest exact lon, lat centre indexes of an FVCOM class
     to given lon, lat coordinates.
@@ -19,41 +20,22 @@ def closest_point( pt_lon, pt_lat, lon, lat, debug=False):
       - pt_lat = list of latitudes in degrees to find
       - lon = list of longitudes in degrees to search in
       - lat = list of latitudes in degrees to search in
+    Keywords:
+      - tree = KD-tree built on (lon, lat), see spatial_tree.
+               Use only if already computed
+      - k = number of closest indexes to return per point, integer
     Outputs:
-      - closest_point_indexes = numpy array of grid indexes
+      - closest_point_indexes = numpy array of grid indexes,
+                                dim=(n points) or (n points, k)
     '''
     if debug:
         print 'Computing closest_point_indexes...'
 
-    lonc=lon[:]
-    latc=lat[:]
-    points = np.array([pt_lon, pt_lat]).T
-    point_list = np.array([lonc, latc]).T
+    points = np.array([np.ravel(pt_lon), np.ravel(pt_lat)]).T
+    if tree==[]:
+        tree = spatial_tree(lon, lat, debug=debug)
+    closest_dist, closest_point_indexes = tree.query(points, k=k)
 
-    #closest_dist = (np.square((point_list[:, 0] - points[:, 0, None])) +
-    #                np.square((point_list[:, 1] - points[:, 1, None])))
-
-    #closest_point_indexes = np.argmin(closest_dist, axis=1)
-    
-    #Wesley's optimized version of this bottleneck
-    point_list0 = point_list[:, 0]
-    points0 = points[:, 0, None]
-    point_list1 = point_list[:, 1]
-    points1 = points[:, 1, None]
-    
-    closest_dist = ((point_list0 - points0) *
-                    (point_list0 - points0) +
-                    (point_list1 - points1) *
-                    (point_list1 - points1)
-                    )
-    closest_point_indexes = np.argmin(closest_dist, axis=1)
-
-    #Thomas' optimized version of this bottleneck    
-    #closest_point_indexes = np.zeros(points.shape[0])
-    #for i in range(points.shape[0]):
-    #    dist=((point_list-points[i,:])**2).sum(axis=1)    
-    #    ndx = d.argsort()
-    #    closest_point_indexes[i] = ndx[0]
     if debug:
         print 'Closest dist: ', closest_dist
 
@@ -64,6 +46,22 @@ def closest_point( pt_lon, pt_lat, lon, lat, debug=False):
 
     return closest_point_indexes
 
+def spatial_tree(lon, lat, debug=False):
+    '''
+    Builds a KD-tree on lon, lat coordinates for fast closest point searches.
+
+    Inputs:
+      - lon = list of longitudes in degrees, numpy array, dim=(nele or node)
+      - lat = list of latitudes in degrees, numpy array, dim=(nele or node)
+    Outputs:
+      - tree = KD-tree, scipy.spatial.cKDTree
+    '''
+    if debug:
+        print 'Building KD-tree...'
+    point_list = np.array([lon[:], lat[:]]).T
+
+    return cKDTree(point_list)
+
 def interpN_at_pt(var, pt_x, pt_y, xc, yc, index, trinodes,
                   aw0, awx, awy, debug=False):
     """
@@ -131,7 +129,7 @@ def interpN_at_pt(var, pt_x, pt_y, xc, yc, index, trinodes,
     return varPt.squeeze()
     
 def interpE_at_pt(var, pt_x, pt_y, xc, yc, index, triele, trinodes,
-                  a1u, a2u, debug=False):
+                  a1u, a2u, neighbours=[], debug=False):
     """
     Interpol node variable any given variables at any give location.
     Inputs:
@@ -144,59 +142,33 @@ def interpE_at_pt(var, pt_x, pt_y, xc, yc, index, triele, trinodes,
       - trinodes = FVCOM trinodes, numpy array, dim=(3,nele)
       - index = index of the nearest element
       - a1u, a2u = grid parameters
+    Keywords:
+      - neighbours = surrounding element indices, see interpE_weights
     Outputs:
       - varInterp = var interpolate at (pt_lon, pt_lat)
+
+    Notes:
+    -----
+      - triele is no longer used and kept for backward compatibility,
+        the surrounding elements come from trinodes
     """
     if debug:
         print 'Interpolating at element...'
 
-    n1 = int(triele[index,0])
-    n2 = int(triele[index,1])
-    n3 = int(triele[index,2])
-    #TR comment: not quiet sure what this step does
-    if n1==0: n1 = trinodes.shape[1]
-    if n2==0: n2 = trinodes.shape[1]
-    if n3==0: n3 = trinodes.shape[1]
-
     #TR quick fix: due to error with pydap.proxy.ArrayProxy
     #              not able to cop with numpy.int
-    n1 = int(n1)
-    n2 = int(n2)
-    n3 = int(n3)
-
+    index = int(index)
+    if np.size(neighbours)==0:
+        neighbours = element_neighbours(trinodes)
+    n = np.asarray(neighbours)[index,:]
+    #Missing neighbours point at the element itself with a zero weight
+    elements = np.append(index, np.where(n < 0, index, n))[None,:]
     x0 = pt_x - xc[index]
     y0 = pt_y - yc[index]
-
-    if len(var.shape)==1:
-        dvardx = (a1u[0,index] * var[index]) \
-               + (a1u[1,index] * var[n1]) \
-               + (a1u[2,index] * var[n2]) \
-               + (a1u[3,index] * var[n3])
-        dvardy = (a2u[0,index] * var[index]) \
-               + (a2u[1,index] * var[n1]) \
-               + (a2u[2,index] * var[n2]) \
-               + (a2u[3,index] * var[n3])
-        varPt = var[index] + (dvardx * x0) + (dvardy * y0)
-    elif len(var.shape)==2:
-        dvardx = (a1u[0,index] * var[:,index]) \
-               + (a1u[1,index] * var[:,n1]) \
-               + (a1u[2,index] * var[:,n2]) \
-               + (a1u[3,index] * var[:,n3])
-        dvardy = (a2u[0,index] * var[:,index]) \
-               + (a2u[1,index] * var[:,n1]) \
-               + (a2u[2,index] * var[:,n2]) \
-               + (a2u[3,index] * var[:,n3])
-        varPt = var[:,index] + (dvardx * x0) + (dvardy * y0)
-    else:
-        dvardx = (a1u[0,index] * var[:,:,index]) \
-               + (a1u[1,index] * var[:,:,n1]) \
-               + (a1u[2,index] * var[:,:,n2]) \
-               + (a1u[3,index] * var[:,:,n3])
-        dvardy = (a2u[0,index] * var[:,:,index]) \
-               + (a2u[1,index] * var[:,:,n1]) \
-               + (a2u[2,index] * var[:,:,n2]) \
-               + (a2u[3,index] * var[:,:,n3])
-        varPt = var[:,:,index] + (dvardx * x0) + (dvardy * y0)
+    weights = (np.asarray(a1u[:,index]) * x0) + (np.asarray(a2u[:,index]) * y0)
+    weights[1:][n < 0] = 0.0
+    weights[0] = weights[0] + 1.0
+    varPt = interp_with_weights(var, elements, weights[None,:], debug=debug)
 
     if debug:
         if len(var.shape)==1:
@@ -213,62 +185,169 @@ def interp_at_point(var, pt_lon, pt_lat, lon, lat,
 
     Inputs:
     ------
-      - var = variable, numpy array, dim=(time, nele or node)
+      - var = variable, numpy array, dim=(node), (time, node)
+              or (time, level, node)
       - pt_lon = longitude in degrees to find
       - pt_lat = latitude in degrees to find
-      - lon = list of longitudes of var, numpy array, dim=(nele or node)
-      - lat = list of latitudes of var, numpy array, dim=(nele or node)
-      - trinodes = FVCOM trinodes, numpy array, dim=(3,nele)
+      - lon = list of longitudes of var, numpy array, dim=(node)
+      - lat = list of latitudes of var, numpy array, dim=(node)
+      - index = index of the element containing (pt_lon, pt_lat), integer
+      - trinodes = FVCOM trinodes, numpy array, dim=(nele,3)
     Outputs:
       - varInterp = var interpolate at (pt_lon, pt_lat)
+
+    Notes:
+    -----
+      - tri is no longer used and kept for backward compatibility
+      - the barycentric weights are computed once and applied
+        to all time steps and levels at once
     """
     if debug:
         print 'Interpolating at point...'
-    #Finding the right indexes
+    #Barycentric weights of the point within its element
+    nodes, weights = barycentric_weights([pt_lon], [pt_lat], lon, lat,
+                                         [index], trinodes, debug=debug)
+    varInterp = interp_with_weights(var, nodes, weights, debug=debug)
+
+    if debug:
+        print '...Passed'
+
+    #TR comment: squeeze seems to resolve my problem with pydap
+    return varInterp.squeeze()
 
-    #Triangulation
-    #if debug:
-    #    print triIndex, lon[triIndex], lat[triIndex]
-    triIndex = trinodes[index]
-    if tri==[]:
-        tri = Tri.Triangulation(lon[triIndex], lat[triIndex], np.array([[0,1,2]]))
+def barycentric_weights(pt_lon, pt_lat, lon, lat, index, trinodes, debug=False):
+    """
+    Computes the barycentric coordinates of any given locations
+    within given elements.
 
-    trif = tri.get_trifinder()
-    trif.__call__(pt_lon, pt_lat)
+    Inputs:
+      - pt_lon = longitudes in degrees, numpy array, dim=(npoints)
+      - pt_lat = latitudes in degrees, numpy array, dim=(npoints)
+      - lon = longitudes of the nodes, numpy array, dim=(node)
+      - lat = latitudes of the nodes, numpy array, dim=(node)
+      - index = indices of the elements containing the points,
+                numpy array, dim=(npoints)
+      - trinodes = FVCOM trinodes, numpy array, dim=(nele,3)
+    Outputs:
+      - nodes = surrounding node indices, numpy array, dim=(npoints,3)
+      - weights = barycentric weights, numpy array, dim=(npoints,3)
+    """
     if debug:
-        if len(var.shape)==1:
-            averEl = var[triIndex]
-            print 'Var', averEl
-            inter = Tri.LinearTriInterpolator(tri, averEl)
-            zi = inter(pt_lon, pt_lat)
-            print 'zi', zi
+        print 'Computing barycentric weights...'
+    nodes = trinodes[index,:]
+    x = np.asarray(lon[:], dtype=np.float64)[nodes]
+    y = np.asarray(lat[:], dtype=np.float64)[nodes]
+    px = np.asarray(pt_lon, dtype=np.float64)
+    py = np.asarray(pt_lat, dtype=np.float64)
 
-    #Choose the right interpolation depending on the variable
-    if len(var.shape)==1:
-        triVar = np.zeros(triIndex.shape)
-        triVar = var[triIndex]
-        inter = Tri.LinearTriInterpolator(tri, triVar[:])
-        varInterp = inter(pt_lon, pt_lat)      
-    elif len(var.shape)==2:
-        triVar = np.zeros((var.shape[0], triIndex.shape[0]))
-        triVar = var[:, triIndex]
-        varInterp = np.ones(triVar.shape[0])
-        for i in range(triVar.shape[0]):
-            inter = Tri.LinearTriInterpolator(tri, triVar[i,:])
-            varInterp[i] = inter(pt_lon, pt_lat)       
-    else:
-        triVar = np.zeros((var.shape[0], var.shape[1], triIndex.shape[0]))
-        triVar = var[:, :, triIndex]
-        varInterp = np.ones(triVar.shape[:-1])
-        for i in range(triVar.shape[0]):
-           for j in range(triVar.shape[1]):
-               inter = Tri.LinearTriInterpolator(tri, triVar[i,j,:])
-               varInterp[i,j] = inter(pt_lon, pt_lat)
+    det = (y[:,1] - y[:,2]) * (x[:,0] - x[:,2]) \
+        + (x[:,2] - x[:,1]) * (y[:,0] - y[:,2])
+    weights = np.zeros(nodes.shape)
+    weights[:,0] = ((y[:,1] - y[:,2]) * (px - x[:,2]) \
+                 + (x[:,2] - x[:,1]) * (py - y[:,2])) / det
+    weights[:,1] = ((y[:,2] - y[:,0]) * (px - x[:,2]) \
+                 + (x[:,0] - x[:,2]) * (py - y[:,2])) / det
+    weights[:,2] = 1.0 - weights[:,0] - weights[:,1]
 
     if debug:
         print '...Passed'
 
-    #TR comment: squeeze seems to resolve my problem with pydap
-    return varInterp.squeeze()
+    return nodes, weights
+
+def interpN_weights(pt_x, pt_y, xc, yc, index, trinodes,
+                    aw0, awx, awy, debug=False):
+    """
+    Computes the node stencils and weights used by interpN_at_pt
+    for several locations at once.
+
+    Inputs:
+      - pt_x = x coordinates in m, numpy array, dim=(npoints)
+      - pt_y = y coordinates in m, numpy array, dim=(npoints)
+      - xc = list of x coordinates of elements, numpy array, dim= nele
+      - yc = list of y coordinates of elements, numpy array, dim= nele
+      - index = indices of the elements containing the points,
+                numpy array, dim=(npoints)
+      - trinodes = FVCOM trinodes, numpy array, dim=(nele,3)
+      - aw0, awx, awy = grid parameters
+    Outputs:
+      - nodes = surrounding node indices, numpy array, dim=(npoints,3)
+      - weights = interpolation weights, numpy array, dim=(npoints,3)
+    """
+    if debug:
+        print 'Computing node weights...'
+    nodes = trinodes[index,:]
+    x0 = pt_x - xc[index]
+    y0 = pt_y - yc[index]
+    weights = aw0[:,index].T \
+            + (awx[:,index].T * x0[:,None]) \
+            + (awy[:,index].T * y0[:,None])
+
+    return nodes, weights
+
+def interpE_weights(pt_x, pt_y, xc, yc, index, trinodes, a1u, a2u,
+                    neighbours=[], debug=False):
+    """
+    Computes the element stencils and weights used by interpE_at_pt
+    for several locations at once.
 
+    Inputs:
+      - pt_x = x coordinates in m, numpy array, dim=(npoints)
+      - pt_y = y coordinates in m, numpy array, dim=(npoints)
+      - xc = list of x coordinates of elements, numpy array, dim= nele
+      - yc = list of y coordinates of elements, numpy array, dim= nele
+      - index = indices of the elements containing the points,
+                numpy array, dim=(npoints)
+      - trinodes = FVCOM trinodes, numpy array, dim=(nele,3)
+      - a1u, a2u = grid parameters
+    Keywords:
+      - neighbours = surrounding element indices, 0-based, -1 if none,
+                     numpy array, dim=(nele,3), see element_neighbours.
+                     Computed from trinodes if not given
+    Outputs:
+      - elements = element and surrounding element indices,
+                   numpy array, dim=(npoints,4)
+      - weights = interpolation weights, numpy array, dim=(npoints,4)
+    """
+    if debug:
+        print 'Computing element weights...'
+    if np.size(neighbours)==0:
+        neighbours = element_neighbours(trinodes)
+    index = np.asarray(index, dtype=int)
+    n = np.asarray(neighbours)[index,:]
+    #Missing neighbours point at the element itself with a zero weight
+    missing = (n < 0)
+    elements = np.column_stack((index, np.where(missing, index[:,None], n)))
+    x0 = pt_x - xc[index]
+    y0 = pt_y - yc[index]
+    weights = (a1u[:,index].T * x0[:,None]) + (a2u[:,index].T * y0[:,None])
+    weights[:,1:][missing] = 0.0
+    weights[:,0] = weights[:,0] + 1.0
+
+    return elements, weights
+
+def interp_with_weights(var, stencil, weights, debug=False):
+    """
+    Applies precomputed interpolation stencils and weights to any given
+    variable in a single gather and multiply.
+
+    Inputs:
+      - var = variable, numpy array, dim=(node or nele) or
+              (time, node or nele) or (time, level, node or nele)
+      - stencil = node or element indices, numpy array, dim=(npoints, n)
+      - weights = interpolation weights, numpy array, dim=(npoints, n)
+    Outputs:
+      - varInterp = interpolated var, numpy array, dim=(npoints) or
+                    (time, npoints) or (time, level, npoints)
+    """
+    if debug:
+        print 'Applying interpolation weights...'
+    if isinstance(var, np.ndarray):
+        triVar = np.take(var, stencil.ravel(), axis=-1)
+    else:
+        #pydap proxies do not support index arrays, gather column by column
+        dims = (slice(None),) * (len(var.shape) - 1)
+        triVar = np.concatenate([np.asarray(var[dims + (slice(i, i+1),)])
+                                 for i in stencil.ravel()], axis=-1)
+    triVar = triVar.reshape(triVar.shape[:-1] + stencil.shape)
 
+    return (triVar * weights).sum(axis=-1)
@@ -6,10 +6,12 @@ import numpy as np
 from datetime import datetime
 from datetime import timedelta
 import fnmatch
+import hashlib
 import os
 import sys
 from scipy.io import netcdf
-from pydap.client import open_url
+#Local import
+from opendap_utils import open_url_cached
 
 def date2py(matlab_datenum):
     python_datetime = datetime.fromordinal(int(matlab_datenum)) + \
@@ -100,6 +102,59 @@ def depth_at_FVCOM_element(ind, trinodes, time_ind):
 
     return dep
 
+def node_to_element(var, trinodes):
+    """
+    Averages a variable at nodes over the three nodes of each element.
+
+    Inputs:
+      - var = variable at nodes, array (..., nnode)
+      - trinodes = grid trinodes, 2D array (nele, 3)
+    Output: variable at elements, array (..., nele)
+    """
+    return np.take(np.asarray(var), trinodes, axis=-1).sum(axis=-1) / 3.0
+
+def mesh_fingerprint(lon, lat, trinodes):
+    """
+    Computes a fingerprint identifying an FVCOM mesh.
+
+    Inputs:
+      - lon = longitudes at nodes, 1D array
+      - lat = latitudes at nodes, 1D array
+      - trinodes = surrounding node indices, 2D array (nele, 3)
+    Output: md5 hexadecimal digest, string
+    """
+    fp = hashlib.md5()
+    fp.update(np.ascontiguousarray(lon[:], dtype=np.float64).tostring())
+    fp.update(np.ascontiguousarray(lat[:], dtype=np.float64).tostring())
+    fp.update(np.ascontiguousarray(trinodes[:], dtype=np.int64).tostring())
+
+    return fp.hexdigest()
+
+def element_neighbours(trinodes):
+    """
+    Finds the elements surrounding each element, as FVCOM nbe, i.e. the
+    k-th neighbour shares the edge opposite to the k-th node.
+
+    Inputs:
+      - trinodes = surrounding node indices, 2D array (nele, 3)
+    Output: 0-based element indices, 2D array (nele, 3), -1 if none
+    """
+    trinodes = np.asarray(trinodes, dtype=np.int64)
+    nele = trinodes.shape[0]
+    #Edge opposite to each node
+    a = trinodes[:, [1, 2, 0]].ravel()
+    b = trinodes[:, [2, 0, 1]].ravel()
+    key = np.minimum(a, b) * (trinodes.max() + 1) + np.maximum(a, b)
+    order = np.argsort(key, kind='mergesort')
+    shared = np.where(key[order][1:] == key[order][:-1])[0]
+    i = order[shared]
+    j = order[shared + 1]
+    nbe = -np.ones(3 * nele, dtype=int)
+    nbe[i] = j // 3
+    nbe[j] = i // 3
+
+    return nbe.reshape(nele, 3)
+
 def time_to_index(t_start, t_end, time, debug=False):
     """Convert datetime64[us] string in FVCOM index"""
     # Find simulation time contains in [t_start, t_end]
@@ -124,6 +179,461 @@ def time_to_index(t_start, t_end, time, debug=False):
         sys.exit()
     return argtime
 
+def time_blocks(ntime, chunk=[]):
+    """
+    Splits a time dimension in blocks of 'chunk' time steps.
+
+    Inputs:
+      - ntime = time dimension, integer
+      - chunk = number of time steps per block, integer.
+                By default, a single block
+    Output: list of (first index, last index + 1)
+    """
+    if chunk==[] or chunk < 1:
+        chunk = max(ntime, 1)
+    return [(ts, min(ts + chunk, ntime)) for ts in range(0, ntime, chunk)]
+
+def output_array(shape, dimensions, output=[], name='var', dtype=np.float64,
+                 debug=False):
+    """
+    Allocates the output of a computation done by blocks of time.
+
+    Inputs:
+      - shape = output shape, tuple of integers
+      - dimensions = output dimension names, tuple of strings,
+                     ex: ('time', 'nele')
+    Keywords:
+      - output = path to an output file, string. Either *.nc, netcdf
+                 variable 'name' created (or overwritten) in the file, or
+                 any other extension, numpy memory map (*.npy format).
+                 By default, numpy array in memory
+      - name = variable name, string
+      - dtype = data type
+    Output: array like, to be flushed with flush_output
+
+    Notes:
+    -----
+      - an existing netcdf variable is overwritten only if it has the same
+        shape and data type, ValueError otherwise
+    """
+    dtype = np.dtype(dtype).newbyteorder('=')
+    if output==[]:
+        return np.empty(shape, dtype=dtype)
+    if debug:
+        print 'Writing ' + name + ' in ' + output + '...'
+    if output.endswith('.nc'):
+        #netCDF4 permits to write the file block by block
+        import netCDF4
+        if os.path.exists(output):
+            f = netCDF4.Dataset(output, 'a')
+        else:
+            #Classic format, also readable with scipy.io.netcdf
+            f = netCDF4.Dataset(output, 'w', format='NETCDF3_64BIT_OFFSET')
+        try:
+            for dim, size in zip(dimensions, shape):
+                if not dim in f.dimensions:
+                    f.createDimension(dim, size)
+                elif not len(f.dimensions[dim])==size:
+                    raise ValueError('Dimension ' + dim + ' of ' + output +
+                                     ' has size ' +
+                                     str(len(f.dimensions[dim])) +
+                                     ', not ' + str(size))
+            if name in f.variables:
+                var = f.variables[name]
+                if not (var.shape==tuple(shape) and var.dtype==dtype):
+                    raise ValueError('Variable ' + name + ' of ' + output +
+                                     ' is ' + str(var.dtype) + ' ' +
+                                     str(var.shape) + ', not ' + str(dtype) +
+                                     ' ' + str(tuple(shape)))
+                return var
+            return f.createVariable(name, dtype, dimensions)
+        except:
+            f.close()
+            raise
+    else:
+        return np.lib.format.open_memmap(output, mode='w+', dtype=dtype,
+                                         shape=shape)
+
+def flush_output(out):
+    """
+    Writes on disk what remains of an output, see output_array.
+
+    Output: array like to keep instead of out. The netcdf file written is
+            closed, see OutputVariable
+    """
+    if hasattr(out, 'flush'):
+        out.flush()
+    elif hasattr(out, 'group'):
+        f = out.group()
+        filename = f.filepath()
+        name = out.name
+        f.close()
+        out = OutputVariable(filename, name)
+
+    return out
+
+class OutputVariable(object):
+    """
+    Read-only netcdf variable written by output_array. The file is only
+    opened while a slice is read, so that no file is left open and later
+    outputs can be added to the same file.
+    """
+    def __init__(self, filename, name):
+        self.filename = filename
+        self.name = name
+        f = self._open()
+        try:
+            var = f.variables[name]
+            self.shape = var.shape
+            self.dtype = var.dtype
+        finally:
+            f.close()
+        self.ndim = len(self.shape)
+
+    def _open(self):
+        import netCDF4
+        return netCDF4.Dataset(self.filename, 'r')
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self):
+        return self[...]
+
+    def __getitem__(self, index):
+        f = self._open()
+        try:
+            var = f.variables[self.name]
+            var.set_auto_mask(False)
+            return var[index]
+        finally:
+            f.close()
+
+def _sample_durations(time):
+    """
+    Duration of each sample, the last one lasting as long as the previous,
+    a single sample lasting 1
+    """
+    time = np.atleast_1d(np.asarray(time, dtype=np.float64))
+    if time.shape[0] < 2:
+        return np.ones(time.shape[0])
+    dt = np.diff(time)
+    return np.append(dt, dt[-1])
+
+def _duration_histogram(block, Ranges, dt):
+    """
+    Time spent above exactly k of the sorted amplitudes Ranges,
+    k = 0...len(Ranges), 2D array (len(Ranges) + 1, n), for a block
+    of signal (time, n) of sample durations dt. NaNs are left out
+    """
+    nbins = Ranges.shape[0]
+    n = block.shape[1]
+    k = np.searchsorted(Ranges, block, side='left') + np.arange(n) * (nbins + 1)
+    weights = np.where(np.isnan(block), 0.0, dt[:, np.newaxis])
+    duration = np.bincount(k.ravel(), weights=weights.ravel(),
+                           minlength=n * (nbins + 1))
+    return duration.reshape(n, nbins + 1).T
+
+def _histogram_percentiles(cdf, Ranges, percentiles):
+    """
+    Percentiles, 2D array (npercentile, n), from the cumulated fraction of
+    samples at or below the sorted amplitudes Ranges, 2D array
+    (len(Ranges), n). Linear interpolation between amplitudes, capped at
+    the last one
+    """
+    n = cdf.shape[1]
+    col = np.arange(n)
+    values = np.zeros((len(percentiles), n))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for i, p in enumerate(np.asarray(percentiles) / 100.0):
+            j = np.minimum((cdf < p).sum(axis=0), Ranges.shape[0] - 1)
+            jm = np.maximum(j - 1, 0)
+            frac = (p - cdf[jm, col]) / (cdf[j, col] - cdf[jm, col])
+            frac = np.where(j > 0, np.clip(np.nan_to_num(frac), 0.0, 1.0), 0.0)
+            values[i] = Ranges[jm] + frac * (Ranges[j] - Ranges[jm])
+    return values
+
+def exceedance_curve(signal, time, bins=30, chunk=[], debug=False):
+    """
+    Computes exceedance curves, i.e. the percentage of time a signal is
+    above given amplitudes, for one or many points at once.
+
+    Inputs:
+      - signal = given quantity, 1 or 2D array, (time) or (time, n)
+      - time = sampling times, 1D array (time), can be irregular
+    Keywords:
+      - bins = number of amplitude bins between 0 and the signal maximum,
+               integer, or amplitudes, 1D array
+      - chunk = number of time steps processed at once, integer.
+                By default all time steps at once
+    Outputs:
+      - Exceedance = % of occurrences, 1D array (nbins)
+                     or 2D array (nbins, n)
+      - Ranges = signal amplitude bins, 1D array (nbins)
+    Notes:
+      - each sample lasts until the next one, the last one as long
+        as the previous one. NaNs are left out
+      - ValueError if signal and time do not have the same length
+    """
+    if debug:
+        print 'Computing exceedance curves...'
+    ntime = signal.shape[0]
+    if not np.size(time)==ntime:
+        raise ValueError('signal has ' + str(ntime) + ' samples but time has ' +
+                         str(np.size(time)))
+    blocks = time_blocks(ntime, chunk)
+    if np.ndim(bins)==0:
+        Max = max([np.nanmax(signal[ts:te]) for ts, te in blocks])
+        Ranges = np.linspace(0.0, Max, int(bins) + 1)
+    else:
+        Ranges = np.sort(np.asarray(bins, dtype=np.float64))
+    nbins = Ranges.shape[0]
+
+    dt = _sample_durations(time)
+
+    #Time spent above exactly k amplitudes, k = 0...nbins, per point
+    shape = signal.shape[1:]
+    n = int(np.prod(shape))
+    duration = np.zeros((nbins + 1, n))
+    for ts, te in blocks:
+        block = np.asarray(signal[ts:te], dtype=np.float64).reshape(te - ts, n)
+        duration += _duration_histogram(block, Ranges, dt[ts:te])
+
+    #Time above Ranges[i] = time above more than i amplitudes
+    above = np.cumsum(duration[::-1], axis=0)[::-1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        Exceedance = (above[1:] * 100.0) / above[0]
+
+    return Exceedance.reshape((nbins,) + shape), Ranges
+
+def power_curves(power_mat, cut_in=1.0, cut_out=4.5):
+    """
+    Sorts out one or several turbine power curves.
+
+    Inputs:
+      - power_mat = power matrix (u,Ct(u)), 2D array (2,n), or list of
+                    power matrices for several turbines
+    Keywords:
+      - cut_in = cut-in speed in m/s, float number or list (one per curve)
+      - cut_out = cut-out speed in m/s, float number or list (one per curve)
+    Output: list of (u, Ct(u), cut-in, cut-out) per curve
+    """
+    if not isinstance(power_mat, (list, tuple)):
+        power_mat = np.asarray(power_mat)
+        power_mat = [power_mat] if power_mat.ndim==2 else list(power_mat)
+    elif np.ndim(power_mat[0])==1:
+        power_mat = [power_mat]
+    ncurve = len(power_mat)
+    cut_in = np.broadcast_to(np.asarray(cut_in, dtype=np.float64), (ncurve,))
+    cut_out = np.broadcast_to(np.asarray(cut_out, dtype=np.float64), (ncurve,))
+    curves = []
+    for mat, cin, cout in zip(power_mat, cut_in, cut_out):
+        mat = np.asarray(mat, dtype=np.float64)
+        order = np.argsort(mat[0,:])
+        curves.append((mat[0,order], mat[1,order], cin, cout))
+    return curves
+
+def power_assessment(u, curves):
+    """
+    Tidal turbine power assessment (W/m2), Cp(u)*(1/2)*1025*(u**3), with
+    no power below cut-in speed and the cut-out power above cut-out speed.
+
+    Inputs:
+      - u = flow speed in m/s, array (time, ...)
+      - curves = power curves, see power_curves
+    Output: power assessment, array as u for a single curve,
+            (time, ncurve, ...) otherwise
+    """
+    u = np.asarray(u)
+    pa = []
+    for speed, cp, cin, cout in curves:
+        uc = np.minimum(u, cout)
+        p = np.interp(uc, speed, cp) * 0.5*1025.0*(uc**3.0)
+        p[u < cin] = 0.0
+        pa.append(p)
+    if len(pa)==1:
+        return pa[0]
+    return np.concatenate([p[:,np.newaxis] for p in pa], axis=1)
+
+def rated_power(curves):
+    """
+    Maximum power (W/m2) of each power curve between cut-in and
+    cut-out speeds, 1D array (ncurve)
+    """
+    rated = []
+    for speed, cp, cin, cout in curves:
+        u = np.append(speed[(speed >= cin) & (speed <= cout)], [cin, cout])
+        rated.append((np.interp(u, speed, cp) * 0.5*1025.0*(u**3.0)).max())
+    return np.array(rated)
+
+def resource_statistics(read_speed, time, power_mat=[], cut_in=1.0,
+                        cut_out=4.5, percentiles=[10, 50, 90],
+                        thresholds=[1.0, 1.5, 2.0, 2.5],
+                        bins=np.arange(0.0, 5.05, 0.05), chunk=[],
+                        debug=False):
+    """
+    Tidal energy resource statistics, per point, in a single pass over
+    blocks of time steps.
+
+    Inputs:
+      - read_speed = function returning the flow speed (m/s) between
+                     time indices ts and te, read_speed(ts, te),
+                     2D array (te-ts, n)
+      - time = sampling times, 1D array (time), can be irregular
+    Keywords:
+      - power_mat = power matrix (u,Ct(u)), 2D array (2,n), or list of
+                    power matrices, see power_curves. Optional
+      - cut_in, cut_out = cut-in and cut-out speeds in m/s, float numbers
+                          or lists (one per power matrix)
+      - percentiles = percentiles to compute, list of floats in [0, 100]
+      - thresholds = speeds (m/s) for the exceedance, list of floats
+      - bins = speeds (m/s) on which the speed distribution is tallied,
+               1D array. Sets the resolution of the percentiles
+      - chunk = number of time steps processed at once, integer.
+                By default all time steps at once
+    Output: dictionary of
+      - 'mean_speed' = time averaged speed (m/s), 1D array (n)
+      - 'mean_power_density' = time averaged power density (W/m2),
+                               1D array (n)
+      - 'percentiles', 'thresholds' = as given, 1D arrays
+      - 'speed_percentiles' = speed percentiles (m/s),
+                              2D array (npercentile, n)
+      - 'power_density_percentiles' = power density percentiles (W/m2),
+                                      2D array (npercentile, n)
+      - 'exceedance' = % of time the speed is above thresholds,
+                       2D array (nthreshold, n)
+      - 'mean_power', 'capacity_factor' = time averaged power assessment
+                                          (W/m2) and capacity factor,
+                                          1D array (n) or (ncurve, n),
+                                          with power_mat only
+    Notes:
+      - memory use scales with chunk and the number of bins, not with
+        the number of time steps
+      - percentiles are linearly interpolated between bins and capped at
+        the last bin
+      - samples are weighted by their duration, NaNs are left out
+    """
+    thresholds = np.atleast_1d(np.asarray(thresholds, dtype=np.float64))
+    percentiles = np.atleast_1d(np.asarray(percentiles, dtype=np.float64))
+    Ranges = np.unique(np.concatenate((np.asarray(bins, dtype=np.float64),
+                                       thresholds)))
+    if len(power_mat)==0:
+        curves = []
+    else:
+        curves = power_curves(power_mat, cut_in=cut_in, cut_out=cut_out)
+    dt = _sample_durations(time)
+
+    #Time weighted sums, duration histogram
+    sums = {}
+    duration = 0.0
+    for ts, te in time_blocks(dt.shape[0], chunk):
+        if debug:
+            print 'Time steps ' + str(ts) + ' to ' + str(te) + '...'
+        u = np.asarray(read_speed(ts, te), dtype=np.float64)
+        u = u.reshape(te - ts, -1)
+        valid = ~np.isnan(u)
+        w = np.where(valid, dt[ts:te, np.newaxis], 0.0)
+        u = np.where(valid, u, 0.0)
+        pd = 0.5*1025.0*(u**3.0)
+        block = {'time': w, 'speed': w*u, 'power_density': w*pd}
+        if not curves==[]:
+            block['power'] = power_assessment(u, curves)
+            if len(curves) > 1:
+                block['power'] = block['power'] * w[:, np.newaxis]
+            else:
+                block['power'] = block['power'] * w
+        for key in block:
+            sums[key] = sums.get(key, 0.0) + block[key].sum(axis=0)
+        duration = duration + _duration_histogram(np.where(valid, u, np.nan),
+                                                  Ranges, dt[ts:te])
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats = {}
+        stats['mean_speed'] = sums['speed'] / sums['time']
+        stats['mean_power_density'] = sums['power_density'] / sums['time']
+        stats['percentiles'] = percentiles
+        stats['thresholds'] = thresholds
+
+        #Cumulated fraction of time at or below each bin
+        cdf = np.cumsum(duration, axis=0)[:-1] / sums['time']
+        stats['exceedance'] = 100.0 * (1.0 - cdf[np.searchsorted(Ranges, thresholds)])
+        speed = _histogram_percentiles(cdf, Ranges, percentiles)
+        stats['speed_percentiles'] = speed
+        stats['power_density_percentiles'] = 0.5*1025.0*(speed**3.0)
+
+        if not curves==[]:
+            rated = rated_power(curves)
+            if len(curves) > 1:
+                rated = rated[:, np.newaxis]
+            else:
+                rated = rated[0]
+            stats['mean_power'] = sums['power'] / sums['time']
+            stats['capacity_factor'] = stats['mean_power'] / rated
+
+    return stats
+
+def streaming_statistics(read_block, time, percentiles=[95],
+                         bins=np.append(0.0, np.logspace(-4, 1, 501)),
+                         chunk=[], debug=False):
+    """
+    Time averages, maxima and percentiles, per point, in a single pass
+    over blocks of time steps.
+
+    Inputs:
+      - read_block = function returning the samples between time indices
+                     ts and te, read_block(ts, te), 2D array (te-ts, n) or
+                     3D array (te-ts, k, n) for k samples per time step
+                     (e.g. sigma levels)
+      - time = sampling times, 1D array (time), can be irregular
+    Keywords:
+      - percentiles = percentiles to compute, list of floats in [0, 100]
+      - bins = amplitudes on which the distribution is tallied, 1D array.
+               Sets the resolution of the percentiles
+      - chunk = number of time steps processed at once, integer.
+                By default all time steps at once
+    Output: dictionary of
+      - 'mean' = time average, 1D array (n)
+      - 'max' = maximum, 1D array (n)
+      - 'percentiles' = as given, 1D array
+      - 'percentile_values' = percentiles, 2D array (npercentile, n)
+    Notes:
+      - memory use scales with chunk and the number of bins, not with
+        the number of time steps
+      - percentiles are linearly interpolated between bins and capped at
+        the last bin
+      - samples are weighted by their duration, NaNs are left out
+    """
+    Ranges = np.sort(np.asarray(bins, dtype=np.float64))
+    dt = _sample_durations(time)
+    total = 0.0
+    weighted = 0.0
+    maximum = -np.inf
+    duration = 0.0
+    for ts, te in time_blocks(dt.shape[0], chunk):
+        if debug:
+            print 'Time steps ' + str(ts) + ' to ' + str(te) + '...'
+        block = np.asarray(read_block(ts, te), dtype=np.float64)
+        n = block.shape[-1]
+        block = block.reshape(te - ts, -1, n)
+        w = np.repeat(dt[ts:te], block.shape[1])
+        block = block.reshape(-1, n)
+        valid = ~np.isnan(block)
+        total = total + np.where(valid, w[:, np.newaxis], 0.0).sum(axis=0)
+        weighted = weighted + np.where(valid, block * w[:, np.newaxis], 0.0).sum(axis=0)
+        maximum = np.maximum(maximum, np.where(valid, block, -np.inf).max(axis=0))
+        duration = duration + _duration_histogram(block, Ranges, w)
+
+    stats = {}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats['mean'] = weighted / total
+        cdf = np.cumsum(duration, axis=0)[:-1] / total
+    stats['max'] = np.where(np.isinf(maximum), np.nan, maximum)
+    stats['percentiles'] = np.atleast_1d(np.asarray(percentiles, dtype=np.float64))
+    stats['percentile_values'] = _histogram_percentiles(cdf, Ranges,
+                                                        stats['percentiles'])
+
+    return stats
+
 def mattime_to_datetime(mattime, debug=False):
     """Convert matlab time to datetime64[us] """
     l = []
@@ -156,12 +666,12 @@ def findFiles(filename, name):
 
     return sorted(matches)
 
-def _load_nc(filename):
-    """Loads data from *.nc returns Data"""
+def _load_nc(filename, cache=False):
+    """Loads data from *.nc returns Data, see open_url_cached for cache"""
     if filename.startswith('http'):
         #Look for file through OpenDAP server
         print "Retrieving data through OpenDap server..."
-        Data = open_url(filename)
+        Data = open_url_cached(filename, cache=cache)
         #Create fake attribut to be consistent with the rest of the code
         Data.variables = Data
     else:
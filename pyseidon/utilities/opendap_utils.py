@@ -0,0 +1,359 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+
+from __future__ import division
+import os
+import time
+import hashlib
+import numpy as np
+from itertools import imap
+from threading import Lock, Event, current_thread
+from multiprocessing.pool import ThreadPool
+from pydap.client import open_url
+from pydap.model import BaseType, StructureType
+from pydap.exceptions import ServerError
+try:
+    from pydap.net import HTTPError
+except ImportError:
+    #Older pydap versions report HTTP errors as ServerError
+    HTTPError = ServerError
+
+#Default maximum number of unused indices read to merge two index runs
+TOLERANCE = 50
+#Default number of concurrent requests
+NTHREADS = 4
+#Default number of retries and delay (s) before the first retry
+RETRIES = 3
+BACKOFF = 0.5
+#Directory and maximum size (bytes) of the cache of OpenDap slices,
+#a size of 0 disables the cache
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.pyseidon', 'opendap')
+CACHE_SIZE = 2 * 1024**3
+#Fraction of CACHE_SIZE kept after an eviction
+CACHE_LOW = 0.8
+
+#Running size (bytes) of the cache, per cache directory
+_cache_total = {}
+_cache_lock = Lock()
+
+def open_url_cached(url, cache=False, debug=False):
+    """
+    Opens an OpenDap url, like pydap.client.open_url. If cache is True,
+    the slices read from its variables are kept in a local on-disk cache,
+    so that repeated analyses of the same remote run are served from disk.
+
+    Inputs:
+      - url = OpenDap url, string
+    Keywords:
+      - cache = if True, slices are kept in CACHE_DIR. Off by default.
+    Outputs:
+      - data = pydap dataset
+
+    Notes:
+    -----
+      - cached slices are keyed by url, variable and slice
+      - the least recently used slices are removed when the cache
+        exceeds CACHE_SIZE bytes, down to CACHE_LOW * CACHE_SIZE
+    """
+    data = open_url(url)
+    if cache and CACHE_SIZE > 0:
+        _wrap_proxies(data, url, debug=debug)
+
+    return data
+
+def clear_cache():
+    """Removes all the cached OpenDap slices"""
+    with _cache_lock:
+        for filename in _cache_files():
+            try:
+                os.remove(filename)
+            except OSError:
+                continue
+        _cache_total.pop(CACHE_DIR, None)
+
+class CachedProxy(object):
+    """
+    Wraps an OpenDap array proxy so that the slices read from it are
+    kept in the local on-disk cache, see open_url_cached.
+    """
+    def __init__(self, proxy, url, name):
+        self._proxy = proxy
+        self._id = url + '#' + name
+        self.shape = proxy.shape
+        self.dtype = proxy.dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self):
+        return self[...]
+
+    def __getitem__(self, index):
+        key = _slice_key(index, self.shape)
+        if key==[] or CACHE_SIZE <= 0:
+            return self._proxy[index]
+        filename = os.path.join(CACHE_DIR,
+                                hashlib.md5(self._id + key).hexdigest() + '.npy')
+        if os.path.exists(filename):
+            try:
+                out = np.load(filename)
+                #Refresh for LRU eviction
+                os.utime(filename, None)
+                return out
+            except (IOError, OSError, ValueError):
+                pass
+        out = np.asarray(self._proxy[index])
+        _cache_save(filename, out)
+
+        return out
+
+def _wrap_proxies(var, url, debug=False):
+    """Wraps the array proxies of a pydap dataset in CachedProxy"""
+    if isinstance(var, StructureType):
+        for child in var.values():
+            _wrap_proxies(child, url, debug=debug)
+    elif isinstance(var, BaseType) and not isinstance(var.data, np.ndarray):
+        if debug:
+            print 'Caching ' + var.id + '...'
+        var.data = CachedProxy(var.data, url, var.id)
+
+def _slice_key(index, shape):
+    """
+    Returns a normalised representation of a slice, [] if the slice
+    cannot be cached (ex: index arrays)
+    """
+    if not type(index)==tuple:
+        index = (index,)
+    key = []
+    for i, ind in enumerate(index):
+        if ind is Ellipsis:
+            fill = len(shape) - (len(index) - 1)
+            key.extend([(0, n, 1) for n in shape[len(key):len(key) + fill]])
+        elif isinstance(ind, slice):
+            key.append(ind.indices(shape[len(key)]))
+        elif isinstance(ind, (int, long, np.integer)):
+            key.append(int(ind) % shape[len(key)])
+        else:
+            return []
+    key.extend([(0, n, 1) for n in shape[len(key):]])
+
+    return repr(key)
+
+def _cache_files():
+    """Returns the cached slices"""
+    if not os.path.exists(CACHE_DIR):
+        return []
+    return [os.path.join(CACHE_DIR, f) for f in os.listdir(CACHE_DIR)
+            if f.endswith('.npy')]
+
+def _cache_save(filename, out):
+    """
+    Saves a slice in the cache and evicts the least recently used ones.
+
+    The cache size is kept as a running total, the cache directory is
+    only listed the first time and when the total exceeds CACHE_SIZE.
+    """
+    try:
+        if not os.path.exists(CACHE_DIR):
+            os.makedirs(CACHE_DIR)
+        try:
+            previous = os.path.getsize(filename)
+        except OSError:
+            previous = 0
+        #Write then rename so that concurrent reads never see partial files
+        tmp = filename + '.' + str(os.getpid()) + '.' + current_thread().name
+        f = open(tmp, "wb")
+        np.save(f, out)
+        f.close()
+        os.rename(tmp, filename)
+        size = os.path.getsize(filename)
+    except (IOError, OSError):
+        return
+    with _cache_lock:
+        if CACHE_DIR in _cache_total:
+            _cache_total[CACHE_DIR] += size - previous
+        else:
+            _cache_total[CACHE_DIR] = sum(f[1] for f in _cache_stats())
+        if _cache_total[CACHE_DIR] <= CACHE_SIZE:
+            return
+        #LRU eviction, rescanning to account for other processes
+        files = _cache_stats()
+        total = sum(f[1] for f in files)
+        for mtime, size, name in sorted(files):
+            if total <= CACHE_LOW * CACHE_SIZE:
+                break
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+            total -= size
+        _cache_total[CACHE_DIR] = total
+
+def _cache_stats():
+    """Returns (mtime, size, filename) of the cached slices"""
+    files = []
+    for name in _cache_files():
+        try:
+            files.append((os.path.getmtime(name), os.path.getsize(name), name))
+        except OSError:
+            continue
+
+    return files
+
+def read_plan(index, tolerance=TOLERANCE):
+    """
+    Groups sorted indices into the ranges to request from an OpenDap
+    server, merging consecutive runs separated by at most 'tolerance'
+    unused indices.
+
+    Inputs:
+      - index = sorted node or element indices, 1D array of integers
+    Keywords:
+      - tolerance = maximum number of unused indices read to merge
+                    two runs, integer
+    Outputs:
+      - plan = list of (start, stop, first, last), where
+               var[..., start:stop] contains index[first:last]
+    """
+    index = np.asarray(index)
+    if index.shape[0]==0:
+        return []
+    cut = np.where(np.diff(index) > (tolerance + 1))[0] + 1
+    first = np.r_[0, cut]
+    last = np.r_[cut, index.shape[0]]
+
+    return [(int(a), int(b), int(c), int(d)) for a, b, c, d in
+            zip(index[first], index[last - 1] + 1, first, last)]
+
+def opendap_take(var, index, lead=(), tolerance=TOLERANCE,
+                 nthreads=NTHREADS, stats=None, debug=False):
+    """
+    Reads var[lead + (:, ..., index)] from an OpenDap variable.
+
+    OpenDap array proxies do not support index arrays, hence the indices
+    are grouped in ranges (see read_plan), the ranges are requested
+    concurrently and assembled into a preallocated array.
+
+    Inputs:
+      - var = OpenDap variable data, array proxy
+      - index = indices along the last dimension, 1D array of integers
+    Keywords:
+      - lead = slices of the leading dimensions, tuple,
+               ex: (slice(ts, te),) for a time window
+      - tolerance = maximum number of unused indices read to merge
+                    two runs, integer
+      - nthreads = maximum number of concurrent requests, integer
+      - stats = request counters, dictionary, see opendap_take_many
+    Outputs:
+      - out = var[lead + (:, ..., index)], numpy array
+    """
+    out = opendap_take_many({'var': (var, index, lead)}, tolerance=tolerance,
+                            nthreads=nthreads, stats=stats, debug=debug)
+
+    return out['var']
+
+def opendap_take_many(requests, tolerance=TOLERANCE, nthreads=NTHREADS,
+                      retries=RETRIES, backoff=BACKOFF, stats=None,
+                      debug=False):
+    """
+    Reads several OpenDap variables at once, the ranges of all of them
+    being requested concurrently through a single bounded thread pool.
+
+    Inputs:
+      - requests = variables to read, dictionary of
+                   name: (var, index, lead), see opendap_take
+    Keywords:
+      - tolerance = maximum number of unused indices read to merge
+                    two runs, integer
+      - nthreads = maximum number of concurrent requests, integer
+      - retries = number of retries of a failed request, integer
+      - backoff = delay before the first retry in seconds, doubled at
+                  each retry, float
+      - stats = request counters, dictionary updated with the number of
+                'requests' issued and of 'bytes' received
+    Outputs:
+      - out = read variables, dictionary of name: numpy array
+    """
+    if stats is None:
+        stats = {}
+    stats.setdefault('requests', 0)
+    stats.setdefault('bytes', 0)
+    lock = Lock()
+    #Set when a request failed for good, the pending ones are dropped
+    abort = Event()
+
+    #Planning
+    tasks = []
+    plans = {}
+    for name, (var, index, lead) in requests.items():
+        index = np.asarray(index, dtype=int)
+        #Unsorted indices are read in order then re-ordered
+        inverse = None
+        if np.any(np.diff(index) <= 0):
+            index, inverse = np.unique(index, return_inverse=True)
+        mid = (slice(None),) * (len(var.shape) - len(lead) - 1)
+        plan = read_plan(index, tolerance=tolerance)
+        plans[name] = (index, inverse, plan)
+        if plan==[]:
+            #Nothing to read but the shape
+            plan = [(0, 0, 0, 0)]
+        tasks.extend([(name, var, lead + mid, p) for p in plan])
+    if debug:
+        print str(len(tasks)) + ' request(s) for ' + str(len(requests)) +\
+              ' variable(s)...'
+
+    def fetch(task):
+        name, var, key, (start, stop, first, last) = task
+        for attempt in range(retries + 1):
+            if abort.is_set():
+                raise IOError('OpenDap read aborted')
+            try:
+                block = np.asarray(var[key + (slice(start, stop),)])
+                break
+            except (IOError, ServerError, HTTPError), e:
+                if attempt==retries or abort.is_set():
+                    abort.set()
+                    raise
+                if debug:
+                    print 'Request failed (' + str(e) + '), retrying...'
+                time.sleep(backoff * 2**attempt)
+        with lock:
+            stats['requests'] += 1
+            stats['bytes'] += block.nbytes
+        if not (stop - start)==(last - first):
+            index = plans[name][0]
+            block = np.take(block, index[first:last] - start, axis=-1)
+        return name, (first, last), block
+
+    if nthreads > 1 and len(tasks) > 1:
+        pool = ThreadPool(min(nthreads, len(tasks)))
+        blocks = pool.imap_unordered(fetch, tasks)
+    else:
+        pool = None
+        blocks = imap(fetch, tasks)
+
+    #Assembling
+    out = {}
+    try:
+        for name, (first, last), block in blocks:
+            if not name in out:
+                size = plans[name][0].shape[0]
+                out[name] = np.empty(block.shape[:-1] + (size,),
+                                     dtype=block.dtype)
+            out[name][..., first:last] = block
+    except:
+        #No request issued once the call has failed
+        abort.set()
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        raise
+    if pool is not None:
+        pool.close()
+        pool.join()
+    for name in out.keys():
+        inverse = plans[name][1]
+        if inverse is not None:
+            out[name] = np.take(out[name], inverse, axis=-1)
+
+    return out
@@ -1,25 +1,117 @@
 from __future__ import division
+import os
+import sys
+import ast
+import ConfigParser
+import hashlib
+import cPickle as pkl
 import numpy as np
-from bisect import bisect_left, bisect_right
 import matplotlib.pyplot as plt
 import matplotlib.tri as Tri
+from matplotlib.path import Path
 #quick fix
 #import netCDF4 as nc
 import scipy.io.netcdf as nc
+#Local import
+from miscellaneous import mesh_fingerprint
+
+#Directory where re-indexed regions are cached, see regioner
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.pyseidon', 'regions')
+#Format of the cached regions, to be increased whenever regioner's
+#output changes so that stale regions are not re-used
+CACHE_VERSION = 1
 
 def node_region(ax, lon, lat):
+    """
+    Returns the indices of the nodes within a region, i.e. a box,
+    a list of boxes or a polygon.
+    """
+    kind = region_type(ax)
+    if kind=='polygon':
+        path = Path(np.asarray(ax, dtype=float))
+        inside = path.contains_points(np.column_stack((lon, lat)))
+    else:
+        if kind=='box':
+            ax = [ax]
+        inside = np.zeros(lon.shape[0], bool)
+        for box in ax:
+            inside |= ((lon >= box[0]) & (lon <= box[1]) &
+                       (lat >= box[2]) & (lat <= box[3]))
 
-    region_n = np.argwhere((lon >= ax[0]) &
-                            (lon <= ax[1]) &
-                            (lat >= ax[2]) &
-                            (lat <= ax[3]))
+    return np.where(inside)[0]
 
-    region_n = region_n.flatten()
+def region_type(ax):
+    """
+    Returns the type of region defined by ax, i.e. 'box' for
+    [lon1, lon2, lat1, lat2], 'boxes' for a list of such boxes
+    and 'polygon' for a list of [lon, lat] vertices.
+    """
+    if len(ax)==4 and all(np.isscalar(a) for a in ax):
+        return 'box'
+    sizes = set(len(a) for a in ax)
+    if sizes==set([4]):
+        return 'boxes'
+    elif sizes==set([2]) and len(ax)>=3:
+        return 'polygon'
+    else:
+        print "---Region badly defined, see FVCOM documentation---"
+        sys.exit()
 
-    return region_n
+def region_bounds(ax):
+    """
+    Returns the bounding box, [lon1, lon2, lat1, lat2], of any region
+    """
+    kind = region_type(ax)
+    if kind=='box':
+        return list(ax)
+    elif kind=='boxes':
+        boxes = np.asarray(ax, dtype=float)
+        return [boxes[:,0].min(), boxes[:,1].max(),
+                boxes[:,2].min(), boxes[:,3].max()]
+    else:
+        vertices = np.asarray(ax, dtype=float)
+        return [vertices[:,0].min(), vertices[:,0].max(),
+                vertices[:,1].min(), vertices[:,1].max()]
 
+def element_region(ax, lon, lat, nv):
+    """
+    Returns the indices of the elements with at least one node within
+    a region, i.e. a box, a list of boxes or a polygon, see node_region.
+    """
+    node_in = np.zeros(lon.shape[0], bool)
+    node_in[node_region(ax, lon, lat)] = True
 
-def regioner(gridVar, ax, debug=False):
+    return np.where(node_in[nv].any(axis=1))[0]
+
+def load_regions(filename, debug=False):
+    """
+    Adds the named regions defined in a config file to REGIONS,
+    see pyseidon/utilities/regions.cfg for the file format.
+
+    Inputs:
+      - filename = path to config file, string
+    Output:
+      - REGIONS = named regions, dictionary
+    """
+    if debug:
+        print 'Loading regions from ' + filename + '...'
+    config = ConfigParser.SafeConfigParser()
+    if config.read(filename)==[]:
+        print "---Region file " + filename + " not found---"
+        return REGIONS
+    for name in config.sections():
+        REGIONS[name] = ast.literal_eval(config.get(name, 'ax'))
+        if debug:
+            print name + ': ' + str(REGIONS[name])
+
+    return REGIONS
+
+#Pre-defined regions
+REGIONS = {}
+load_regions(os.path.join(os.path.dirname(__file__), 'regions.cfg'))
+
+
+def regioner(gridVar, ax, cache=False, debug=False):
     """
 Takes as input a region (given by a four elemenTakes as input a region
 (given by a four element NumPy array),
@@ -35,6 +127,9 @@ in the region array
 region box. Entires should be in the following form:
 [long1, long2, lat1, lat2] with the following property:
 abs(long1) < abs(long2), etc.
+Alternatively, a list of such boxes or a polygon, i.e. a list of
+[long, lat] vertices. In all cases, the elements with at least one node
+within the region are kept.
 
 **data** -- standard python data dictionary for these files
 
@@ -45,13 +140,26 @@ none, i.e. the data will not be saved, only returned.
 
 **dim = {'2D', '3D'}** the dimension of the data to use regioner
 on. Default is 2D.
+
+**cache** -- if True, the re-indexed region is saved in CACHE_DIR,
+keyed by CACHE_VERSION, the fingerprint of the mesh and the region, and
+re-used by later calls on any file sharing the same mesh. Default is
+False.
 """
     if debug:
         print 'Reindexing...'
     lon = gridVar.lon[:]
     lat = gridVar.lat[:]
-    nbe = gridVar.triele[:]
     nv = gridVar.trinodes[:]
+
+    #Checking for previously re-indexed region
+    if cache:
+        filename = region_cache_file(lon, lat, nv, ax)
+        data = _load_cached_region(filename, debug=debug)
+        if not data==[]:
+            return data
+
+    nbe = gridVar.triele[:]
     a1u = gridVar.a1u[:]
     a2u = gridVar.a2u[:]
     aw0 = gridVar.aw0[:]
@@ -64,67 +172,23 @@ on. Default is 2D.
     lonc = gridVar.lonc[:]
     latc = gridVar.latc[:]
 
-    l = nv.shape[0]
-
-    idx = node_region(ax, lon, lat)
-
     #first, reindex elements in the region
-    element_index_tmp = np.zeros(l, int)
-    nv_rs = nv.reshape(l*3, order='F')
-    #find indices that sort nv_rs
-    nv_sortedind = nv_rs.argsort()
-    #sort the array
-    nv_sortd = nv_rs[nv_sortedind]
-    #pick out the values in the region
     if debug:
         print 'Extracting values from box...'
-    #TR comment: very slow...gonna need optimisation down the line
-    for i in xrange(len(idx)):
-        i1 = bisect_left(nv_sortd, idx[i])
-        i2 = bisect_right(nv_sortd, idx[i])
-        inds = nv_sortedind[i1:i2]
-        element_index_tmp[inds % l] = 1
-        element_index = np.where(element_index_tmp == 1)[0]
-        node_index = np.unique(nv[element_index,:])
-        #create new linkage arrays
-        nv_tmp = nv[element_index,:]
-        L = len(nv_tmp[:,0])
-        #nv_tmp2 = np.empty((1, L*3.0))
-        nv_tmp2 = np.empty((1, L*3))
+    #elements with at least one node in the region
+    element_index = element_region(ax, lon, lat, nv)
+    node_index = np.unique(nv[element_index,:])
 
     #make a new array of the node labellings for the tri's in the region
     if debug:
         print 'Re-labelling elements and nodes...'
-    nv2 = nv_tmp.reshape(L * 3, order='F')
-    nv2_sortedind = nv2.argsort()
-    nv2_sortd = nv2[nv2_sortedind]
-
-    for i in xrange(len(node_index)):
-        i1 = bisect_left(nv2_sortd, node_index[i])
-        i2 = bisect_right(nv2_sortd, node_index[i])
-        inds = nv2_sortedind[i1:i2]
-        nv_tmp2[0, inds] = i
-
-    nv_new = np.reshape(nv_tmp2, (L, 3), 'F')
+    #node_index is sorted, hence new label = position in node_index
+    nv_new = np.searchsorted(node_index, nv[element_index,:])
     #now do the same for nbe
-    nbe_index = np.unique(nbe[element_index, :])
     nbe_tmp = nbe[element_index,:]
-    lnbe = len(nbe_tmp[:,0])
-    nbe_tmp2 = np.empty((1, lnbe*3))
-
-    nbe2 = nbe_tmp.reshape(lnbe*3, order='F')
-    nbe_sortedind = nbe2.argsort()
-    nbe_sortd = nbe2[nbe_sortedind]
-
-    for i in xrange(len(nbe_index)):
-        i1 = bisect_left(nbe_sortd, nbe_index[i])
-        i2 = bisect_right(nbe_sortd, nbe_index[i])
-        inds = nbe_sortedind[i1:i2]
-        nbe_tmp2[0, inds] = i
-
-    nbe_new = np.reshape(nbe_tmp2, (lnbe,3), 'F')
-    #nbe_new[nbe_new > len(nv_new[:,0]), :] = 0
-    nbe_new[nbe_new > len(nv_new[:,0])] = 0
+    nbe_index = np.unique(nbe_tmp)
+    nbe_new = np.searchsorted(nbe_index, nbe_tmp)
+    nbe_new[nbe_new > nv_new.shape[0]] = 0
 
     #create new variables for the region
 
@@ -150,8 +214,56 @@ on. Default is 2D.
     data['lonc'] = lonc[element_index]
     data['latc'] = latc[element_index]
 
+    if cache:
+        _save_cached_region(filename, data, debug=debug)
+
     data['triangle'] = Tri.Triangulation(data['lon'], data['lat'], \
                                         data['nv'])
 
     return data
 
+def region_cache_file(lon, lat, trinodes, ax):
+    """
+    Returns the cache file of a region, named after the cache format,
+    the fingerprint of the mesh and the region itself.
+    """
+    mesh = mesh_fingerprint(lon, lat, trinodes)
+    region = hashlib.md5(repr(np.asarray(ax, dtype=float).tolist()))
+    return os.path.join(CACHE_DIR, 'region_v' + str(CACHE_VERSION) + '_'
+                        + mesh + '_' + region.hexdigest() + '.p')
+
+def _load_cached_region(filename, debug=False):
+    """Loads a cached region, returns [] if not cached"""
+    if not os.path.exists(filename):
+        return []
+    if debug:
+        print 'Loading re-indexed region from ' + filename + '...'
+    try:
+        f = open(filename, "rb")
+        data = pkl.load(f)
+        f.close()
+    except (IOError, EOFError, pkl.UnpicklingError):
+        print "---Corrupted region cache " + filename + ", re-indexing---"
+        return []
+    data['triangle'] = Tri.Triangulation(data['lon'], data['lat'], \
+                                        data['nv'])
+
+    return data
+
+def _save_cached_region(filename, data, debug=False):
+    """Saves a re-indexed region, skipped if the cache is not writable"""
+    if debug:
+        print 'Saving re-indexed region in ' + filename + '...'
+    try:
+        if not os.path.exists(CACHE_DIR):
+            os.makedirs(CACHE_DIR)
+        #Write then rename so that concurrent loads never see partial files
+        tmp = filename + '.' + str(os.getpid())
+        f = open(tmp, "wb")
+        pkl.dump(data, f, protocol=pkl.HIGHEST_PROTOCOL)
+        f.close()
+        os.rename(tmp, filename)
+    except (IOError, OSError):
+        if debug:
+            print "---Region cache not writable---"
+
@@ -1,20 +1,60 @@
 #from __future__ import division
 #import netCDF4 as nc
 import numpy as np
-import scipy.spatial
-import networkx as nx
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
 import matplotlib.pyplot as plt
 import matplotlib.tri as Tri
 import matplotlib.ticker as ticker
 import seaborn
+from miscellaneous import element_neighbours
+
+def element_graph(lonc, latc, triele):
+    """
+    Builds the element adjacency graph of the mesh, i.e. element centres
+    linked to the elements sharing an edge with them.
+
+    Inputs:
+      - lonc = element centre longitudes, 1D array (nele)
+      - latc = element centre latitudes, 1D array (nele)
+      - triele = FVCOM nbe, surrounding element indices (1-based,
+                 0 if none), 2D array (nele, 3)
+    Output: edge lengths between element centres, in decimal degrees,
+            symmetric sparse matrix (nele, nele)
+    """
+    lonc = np.asarray(lonc, dtype=np.float64)
+    latc = np.asarray(latc, dtype=np.float64)
+    triele = np.asarray(triele, dtype=np.int64) - 1
+    nele = lonc.shape[0]
+    rows = np.repeat(np.arange(nele), 3)
+    cols = triele.ravel()
+    #Neighbours out of the domain, i.e. boundaries or regioned meshes
+    valid = (cols >= 0) & (cols < nele)
+    rows = rows[valid]
+    cols = cols[valid]
+    weight = np.hypot(lonc[rows] - lonc[cols], latc[rows] - latc[cols])
+    graph = csr_matrix((weight, (rows, cols)), shape=(nele, nele))
+
+    #Symmetric, in case of one-sided neighbour lists
+    return graph.maximum(graph.T).tocsr()
 
 class shortest_element_path:
-    def __init__(self, lonc, latc, lon, lat, trinodes, h, debug=False):
-
-        #self.data = nc.Dataset(filename,'r')
-
-        #latc = self.data.variables['latc'][:]
-        #lonc = self.data.variables['lonc'][:]
+    def __init__(self, lonc, latc, lon, lat, trinodes, h, triele=[],
+                 graph=[], debug=False):
+        """
+        Shortest paths between elements, along the element adjacency graph
+
+        Inputs:
+          - lonc, latc = element centre coordinates, 1D arrays (nele)
+          - lon, lat = node coordinates, 1D arrays (nnode)
+          - trinodes = surrounding node indices, 2D array (nele, 3)
+          - h = bathymetry, 1D array (nnode)
+        Keywords:
+          - triele = FVCOM nbe (1-based, 0 if none), 2D array (nele, 3),
+                     computed from trinodes if not given
+          - graph = adjacency graph from element_graph, i.e. to reuse
+                    a cached one
+        """
         self.lonc = lonc[:]
         self.latc = latc[:]
         self.lat = lat[:]
@@ -22,105 +62,66 @@ class shortest_element_path:
         self.trinodes = trinodes[:]
         self.h = h[:]
 
-        #z = np.vstack((latc,lonc)).T
-        z = np.vstack((lonc,latc)).T
-        #z = np.vstack((xc, yc)).T
-
-        self.points = map(tuple,z)
-
-        if debug : print 'File Loaded'
-
-        # make a Delaunay triangulation of the point data
-        self.delTri = scipy.spatial.Delaunay(self.points)
-        if debug : print 'Delaunay Triangulation Done'
-
-        # create a set for edges that are indexes of the points
-        self.edges = []
-        self.weight = []
-        # for each Delaunay triangle
-        for n in xrange(self.delTri.nsimplex):
-            # for each edge of the triangle
-            # sort the vertices
-            # (sorting avoids duplicated edges being added to the set)
-            # and add to the edges set
-
-            self.edge = sorted([self.delTri.vertices[n,0], self.delTri.vertices[n,1]])
-            a = self.points[self.edge[0]]
-            b = self.points[self.edge[1]]
-            self.weight = (np.sqrt((a[0]-b[0])**2+(a[1]-b[1])**2))
-            self.edges.append((self.edge[0], self.edge[1],{'weight':self.weight}))
-
-            self.edge = sorted([self.delTri.vertices[n,0], self.delTri.vertices[n,2]])
-            a = self.points[self.edge[0]]
-            b = self.points[self.edge[1]]
-            self.weight = (np.sqrt((a[0]-b[0])**2+(a[1]-b[1])**2))
-            self.edges.append((self.edge[0], self.edge[1],{'weight':self.weight}))
-
-
-            self.edge = sorted([self.delTri.vertices[n,1], self.delTri.vertices[n,2]])
-            a = self.points[self.edge[0]]
-            b = self.points[self.edge[1]]
-            self.weight = (np.sqrt((a[0]-b[0])**2+(a[1]-b[1])**2))
-            self.edges.append((self.edge[0], self.edge[1],{'weight':self.weight}))
-
-        if debug : print 'Edges and Weighting Done'
-
-        # make a graph based on the Delaunay triangulation edges
-        self.graph = nx.Graph(self.edges)
-        #print(graph.edges())
+        if type(graph)==list:
+            if np.size(triele)==0:
+                triele = element_neighbours(self.trinodes) + 1
+            graph = element_graph(self.lonc, self.latc, triele[:])
+        self.graph = graph
 
         if debug : print 'Graph Constructed'
 
-        self.pointIDXY = dict(zip(range(len(self.points)), self.points))
-
     def getTargets(self, source_target, coords=False):
+        """
+        Finds the shortest paths between pairs of elements, all sources
+        at once.
+
+        Inputs:
+          - source_target = list of [source, target] element indices,
+                            or of [(lon, lat), (lon, lat)] if coords
+        Outputs:
+          - elements = list of element index paths, one per pair
+          - coordinates = list of (lonc, latc) along paths, one per pair
+        Notes:
+          - path lengths are kept in self.distances
+        """
+        source_target = list(source_target)
+        if coords:
+            pairs = []
+            for source, target in source_target:
+                pair = []
+                for pt in [source, target]:
+                    key = np.where((self.lonc==pt[0]) & (self.latc==pt[1]))[0]
+                    pair.append(key[0])
+                pairs.append(pair)
+            source_target = pairs
+        pairs = np.asarray(source_target, dtype=np.int64).reshape(-1, 2)
+
+        #One search per distinct source
+        sources, row = np.unique(pairs[:,0], return_inverse=True)
+        dist, pred = dijkstra(self.graph, directed=False, indices=sources,
+                              return_predecessors=True)
 
         self.elements = []
         self.coordinates = []
         self.maxcoordinates = []
         self.mincoordinates = []
-        for i in source_target:
-            source = i[0]
-            target = i[1]
-
-#            print '\n'
-#            print 'Source'
-#            print source
-            s = source
-#
-#            print 'Target'
-#            print target
-            t = target
-
-            if coords:
-                for key, value in self.pointIDXY.items():
-                    if value==source:
-                        print 'Source'
-                        print key
-                        s = key
-
-                    if value==target:
-                        print 'Target'
-                        print key
-                        t = key
-
-            #print s,t
-            shortest = nx.shortest_path(self.graph,source=s,target=t,weight='weight')
-#            dist = nx.shortest_path_length(self.graph,source=s,target=t,weight='weight')
-
-#            print 'Shortest Path (by elements)'
-#            print shortest
+        self.distances = dist[row, pairs[:,1]]
+        for (s, t), r in zip(pairs, row):
+            if np.isinf(dist[r, t]):
+                raise ValueError('No path between elements ' + str(s) +
+                                 ' and ' + str(t))
+            shortest = [t]
+            while shortest[-1] != s:
+                shortest.append(pred[r, shortest[-1]])
+            shortest = [int(i) for i in shortest[::-1]]
 
             self.elements.append(shortest)
 
-            coords = [self.pointIDXY[i] for i in shortest]
+            coords = zip(self.lonc[shortest], self.latc[shortest])
             self.coordinates.append(coords)
             self.maxcoordinates.append(np.max(np.array(coords),axis=0))
             self.mincoordinates.append(np.min(np.array(coords),axis=0))
 
-#            print 'Shortest Distance (by coordinates)'
-#            print dist
-
         return self.elements, self.coordinates
 
     def graphGrid(self,narrowGrid=False, plot=False):
@@ -167,8 +168,8 @@ class shortest_element_path:
 
         zz = len(self.elements)
         for i,v in enumerate(self.elements):
-            source = self.pointIDXY[v[0]]
-            target = self.pointIDXY[v[-1]]
+            source = (self.lonc[v[0]], self.latc[v[0]])
+            target = (self.lonc[v[-1]], self.latc[v[-1]])
             lab = '({:.6},{:.6})-({:.6},{:.6})'.format(source[0], source[1],
                                                        target[0], target[1])
 
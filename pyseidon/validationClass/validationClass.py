@@ -391,8 +391,8 @@ class Validation:
             #TR: Force caching Variables otherwise error during loading
             #    with 'netcdf4.Variable' type (see above)
             for key in data['Variables']:
-                listkeys=['Variable', 'ArrayProxy', 'BaseType'] 
-                if any([type(data['Variables'][key]).__name__==x for x in listkeys]):
+                if hasattr(data['Variables'][key], '__array__') and \
+                   not isinstance(data['Variables'][key], np.ndarray):
                     if debug:
                         print "Force caching for " + key
                     data['Variables'][key] = data['Variables'][key][:]
@@ -423,8 +423,8 @@ class Validation:
             #TR: Force caching Variables otherwise error during loading
             #    with 'netcdf4.Variable' type (see above)
             for key in Var:
-                listkeys=['Variable', 'ArrayProxy', 'BaseType'] 
-                if any([type(Var[key]).__name__==x for x in listkeys]):
+                if hasattr(Var[key], '__array__') and \
+                   not isinstance(Var[key], np.ndarray):
                     if debug:
                         print "Force caching for " + key
                     Var[key] = Var[key][:]
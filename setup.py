@@ -23,6 +23,7 @@ if option=='n':
       license='GNU Affero GPL v3.0',
       packages=find_packages(),
       package_dir={'PySeidon' :'pyseidon'},
+      package_data={'pyseidon.utilities': ['regions.cfg']},
       zip_safe=False)
 else:
     setup(name='PySeidon',
@@ -37,8 +38,9 @@ else:
       license='GNU Affero GPL v3.0',
       packages=find_packages(),
       package_dir={'PySeidon' :'pyseidon'},
+      package_data={'pyseidon.utilities': ['regions.cfg']},
       install_requires=['setuptools', 'utide', 'numpy', 'pandas', 'pydap', 'pydap',
-                        'networkx', 'seaborn', 'scipy','matplotlib', 'h5py', 'numexpr',
+                        'seaborn', 'scipy','matplotlib', 'h5py', 'numexpr',
                         'datetime', 'netCDF4'],
       zip_safe=False)
 
@@ -0,0 +1,55 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+"""
+Benchmark of interp_at_point (barycentric weights applied once to the
+whole series) against the former loop building a LinearTriInterpolator
+per time step and level.
+
+Usage: python test/benchmark_interp_at_point.py [ntime]
+"""
+from __future__ import division
+import os
+import sys
+import time
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.tri as Tri
+
+local = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(local)
+sys.path.append(os.path.join(local, '..', 'pyseidon', 'utilities'))
+from synthetic import mesh
+from interpolation_utils import interp_at_point
+
+def loop_interp(var, pt_lon, pt_lat, lon, lat, index, trinodes):
+    """Former interp_at_point, one interpolator per time step and level"""
+    triIndex = trinodes[index]
+    tri = Tri.Triangulation(lon[triIndex], lat[triIndex], np.array([[0,1,2]]))
+    triVar = var[..., triIndex]
+    varInterp = np.ones(triVar.shape[:-1])
+    for i in np.ndindex(*triVar.shape[:-1]):
+        inter = Tri.LinearTriInterpolator(tri, triVar[i])
+        varInterp[i] = inter(pt_lon, pt_lat)
+    return varInterp
+
+if __name__ == '__main__':
+    ntime = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    g = mesh(nx=12, ny=9)
+    rng = np.random.RandomState(0)
+    index = 40
+    w = rng.dirichlet(np.ones(3))
+    pt_lon = (g['lon'][g['trinodes'][index]] * w).sum()
+    pt_lat = (g['lat'][g['trinodes'][index]] * w).sum()
+    nnode = g['lon'].shape[0]
+    for var in [rng.randn(ntime, nnode), rng.randn(ntime // 10, 10, nnode)]:
+        start = time.time()
+        old = loop_interp(var, pt_lon, pt_lat, g['lon'], g['lat'],
+                          index, g['trinodes'])
+        tOld = time.time() - start
+        start = time.time()
+        new = interp_at_point(var, pt_lon, pt_lat, g['lon'], g['lat'],
+                              index=index, trinodes=g['trinodes'])
+        tNew = time.time() - start
+        print 'var', var.shape, ': loop %.3f s, weights %.5f s, max diff %.1e' \
+              % (tOld, tNew, np.abs(old - new).max())
@@ -0,0 +1,59 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+"""
+Benchmark of the bulk time-window reader of _load_var against the former
+per-time-step copy loop, on a synthetic FVCOM file.
+
+Usage: python test/benchmark_load_var.py [nx ny ntime nlevel]
+"""
+from __future__ import division
+import os
+import sys
+import shutil
+import tempfile
+import time
+import numpy as np
+from scipy.io import netcdf
+
+local = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(local)
+sys.path.append(os.path.join(local, '..', 'pyseidon', 'fvcomClass'))
+sys.path.append(os.path.join(local, '..', 'pyseidon', 'utilities'))
+from synthetic import write_fvcom
+from variablesFvcom import _bulk_load
+
+def loop_load(var, index):
+    """Former _load_var loop, one time step at a time"""
+    out = np.zeros((var.shape[0], var.shape[1], len(index)))
+    for i in range(var.shape[0]):
+        out[i,:,:] = np.transpose(var[i,:,index])
+    return out
+
+if __name__ == '__main__':
+    nx, ny, ntime, nlevel = [int(a) for a in sys.argv[1:5]] or [150, 100, 400, 10]
+    tmp = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmp, 'synthetic.nc')
+        write_fvcom(filename, nx=nx, ny=ny, ntime=ntime, nlevel=nlevel)
+        data = netcdf.netcdf_file(filename, 'r', mmap=True)
+        u = data.variables['u'].data
+        index = np.arange(0, u.shape[-1], 3)
+        print 'u', u.shape, ', one element in three'
+
+        start = time.time()
+        old = loop_load(u, index)
+        tOld = time.time() - start
+        start = time.time()
+        new = _bulk_load(u, 0, u.shape[0], index=index)
+        tNew = time.time() - start
+        start = time.time()
+        newC = _bulk_load(u, 0, u.shape[0], index=index, chunk=37)
+        tChunk = time.time() - start
+
+        print 'loop:           %.3f s' % tOld
+        print 'bulk:           %.3f s' % tNew
+        print 'bulk, chunk=37: %.3f s' % tChunk
+        print 'identical:', np.array_equal(old, new) and np.array_equal(old, newC)
+        del u, data
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,35 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+"""
+Benchmark of the vectorized regioner against the former per-node bisect
+loops, on synthetic meshes.
+
+Usage: python test/benchmark_regioner.py
+"""
+from __future__ import division
+import os
+import sys
+import time
+import numpy as np
+
+local = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(local)
+sys.path.append(os.path.join(local, '..', 'pyseidon', 'utilities'))
+from synthetic import Grid
+from regioner_baseline import baseline_regioner
+from regioner import regioner
+
+if __name__ == '__main__':
+    for n, box in [(60, [10, 50, 20, 60]), (150, [0, 100, 0, 100]),
+                   (150, [20, 70, 10, 90])]:
+        g = Grid(nx=n, ny=n, nlevel=1)
+        ax = list(np.percentile(g.lon, box[:2])) + list(np.percentile(g.lat, box[2:]))
+        start = time.time()
+        ref = baseline_regioner(g, ax)
+        tOld = time.time() - start
+        start = time.time()
+        new = regioner(g, ax, cache=False)
+        tNew = time.time() - start
+        same = all(np.array_equal(ref[k], new[k]) for k in ref if not k=='triangle')
+        print '%6d elements, %6d in box: loop %.2f s, vectorized %.3f s, identical %s' \
+              % (g.nele, new['element_index'].shape[0], tOld, tNew, same)
@@ -0,0 +1,80 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+"""
+Benchmark of vorticity_over_period (sparse gradient operators applied to
+whole blocks of time) against the former loop over time steps.
+
+Usage: python test/benchmark_vorticity.py [ntime]
+"""
+from __future__ import division
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+
+local = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(local)
+sys.path.append(os.path.join(local, '..'))
+from synthetic import write_fvcom
+from pyseidon import FVCOM
+
+def loop_vorticity(ua, va, a1u, a2u, triele, t):
+    """Former vorticity_over_period, one time step at a time"""
+    n = np.array(triele, int) - 1
+    #Missing neighbours do not contribute
+    valid = n >= 0
+    n[~valid] = 0
+    mask = np.vstack((np.ones(n.shape[0], bool), valid.T))
+    a1u = a1u * mask
+    a2u = a2u * mask
+    n1, n2, n3 = n[:, 0], n[:, 1], n[:, 2]
+    dvdx = np.zeros((t.shape[0], n.shape[0]))
+    dudy = np.zeros((t.shape[0], n.shape[0]))
+    for j, i in enumerate(t):
+        dvdx[j, :] = np.multiply(a1u[0, :], va[i, :]) \
+                   + np.multiply(a1u[1, :], va[i, n1]) \
+                   + np.multiply(a1u[2, :], va[i, n2]) \
+                   + np.multiply(a1u[3, :], va[i, n3])
+        dudy[j, :] = np.multiply(a2u[0, :], ua[i, :]) \
+                   + np.multiply(a2u[1, :], ua[i, n1]) \
+                   + np.multiply(a2u[2, :], ua[i, n2]) \
+                   + np.multiply(a2u[3, :], ua[i, n3])
+    return dvdx - dudy
+
+if __name__ == '__main__':
+    ntime = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    tmp = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmp, 'synthetic.nc')
+        write_fvcom(filename, nx=150, ny=100, ntime=ntime, nlevel=2)
+        model = FVCOM(filename)
+        ua = np.array(model.Variables.ua)
+        va = np.array(model.Variables.va)
+        model.Variables.ua = ua
+        model.Variables.va = va
+        g = model.Grid
+        a1u = np.array(g.a1u)
+        a2u = np.array(g.a2u)
+        #Warm up the cached operators
+        model.Util2D.vorticity_over_period(time_ind=[0])
+        for t in [np.arange(ntime), np.arange(0, ntime, 3)]:
+            start = time.time()
+            old = loop_vorticity(ua, va, a1u, a2u, g.triele, t)
+            tOld = time.time() - start
+            start = time.time()
+            new = model.Util2D.vorticity_over_period(time_ind=t)
+            tNew = time.time() - start
+            start = time.time()
+            chunked = model.Util2D.vorticity_over_period(time_ind=t, chunk=50)
+            tChunk = time.time() - start
+            print str(t.shape[0]) + ' steps, ' + str(g.nele) + \
+                  ' elements: loop %.3f s, sparse %.3f s, chunk=50 %.3f s,' \
+                  ' max diff %.1e' % (tOld, tNew, tChunk,
+                                      max(np.abs(old - new).max(),
+                                          np.abs(old - chunked).max()))
+    finally:
+        shutil.rmtree(tmp)
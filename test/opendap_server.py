@@ -0,0 +1,87 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+"""
+Local stand-in OpenDap server for tests: serves the variables of a
+netcdf file through pydap over HTTP, counts the data requests and can
+fail some of them.
+"""
+from __future__ import division
+import os
+import threading
+import numpy as np
+from wsgiref.simple_server import make_server, WSGIRequestHandler, WSGIServer
+from SocketServer import ThreadingMixIn
+from scipy.io import netcdf
+from pydap.handlers.lib import BaseHandler
+from pydap.model import DatasetType, BaseType
+
+class _Variable(object):
+    """Netcdf variable read on request, in native byte order"""
+    def __init__(self, var):
+        self.var = var
+        self.shape = var.shape
+        self.dtype = np.dtype(var.data.dtype.str.replace('>', '<'))
+        self.ndim = len(self.shape)
+        self.size = int(np.prod(self.shape))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self):
+        return self[...]
+
+    def __getitem__(self, key):
+        return np.asarray(self.var.data[key]).astype(self.dtype)
+
+class _Handler(BaseHandler):
+    def __init__(self, filename):
+        BaseHandler.__init__(self)
+        self.source = netcdf.netcdf_file(filename, 'r', mmap=False)
+        self.dataset = DatasetType(os.path.split(filename)[1])
+        for name, var in self.source.variables.items():
+            self.dataset[name] = BaseType(name, _Variable(var), var.dimensions)
+
+class _Quiet(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+class _Server(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+class StandInServer(object):
+    """
+    Serves filename on http://127.0.0.1:<port>/<basename>, see url.
+
+    Attributes:
+      - requests = number of data requests (GET) received, integer
+      - fail = set of data request numbers (1-based) answered with an
+               HTTP 500 error
+    """
+    def __init__(self, filename):
+        self.requests = 0
+        self.fail = set()
+        self._lock = threading.Lock()
+        handler = _Handler(filename)
+        def app(environ, start_response):
+            #pydap sends a HEAD before each GET
+            if ('.dods' in environ.get('PATH_INFO', '') and
+                environ.get('REQUEST_METHOD')=='GET'):
+                with self._lock:
+                    self.requests += 1
+                    failed = self.requests in self.fail
+                if failed:
+                    start_response('500 Internal Server Error',
+                                   [('Content-Type', 'text/plain')])
+                    return ['simulated failure']
+            return handler(environ, start_response)
+        self._server = make_server('127.0.0.1', 0, app, server_class=_Server,
+                                   handler_class=_Quiet)
+        self.url = 'http://127.0.0.1:' + str(self._server.server_port) + \
+                   '/' + os.path.basename(filename)
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,152 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+"""
+Synthetic FVCOM meshes and output files for tests and benchmarks
+"""
+from __future__ import division
+import numpy as np
+from scipy.io import netcdf
+
+def mesh(nx=30, ny=20, nlevel=5, seed=0):
+    """
+    Regular triangulated mesh over 3 x 2 km with jittered nodes.
+
+    Outputs: dictionary of FVCOM grid variables, trinodes 0-based (nele, 3),
+             nbe 1-based with 0 for missing neighbours (nele, 3)
+    """
+    rng = np.random.RandomState(seed)
+    X, Y = np.meshgrid(np.linspace(0, 3000., nx), np.linspace(0, 2000., ny))
+    x = X.ravel() + rng.uniform(-20, 20, X.size)
+    y = Y.ravel() + rng.uniform(-20, 20, Y.size)
+    lon = -66.35 + x / 80000.
+    lat = 44.25 + y / 111000.
+    tris = []
+    for j in range(ny - 1):
+        for i in range(nx - 1):
+            a = j * nx + i
+            tris.append([a, a + 1, a + nx + 1])
+            tris.append([a, a + nx + 1, a + nx])
+    nv = np.array(tris)
+    nele = nv.shape[0]
+    xc = x[nv].mean(1)
+    yc = y[nv].mean(1)
+
+    #Neighbour k shares the edge opposite to node k, as FVCOM nbe
+    edges = {}
+    for e, t in enumerate(nv):
+        for k in range(3):
+            edges.setdefault(tuple(sorted((t[(k + 1) % 3], t[(k + 2) % 3]))), []).append(e)
+    nbe = np.zeros((nele, 3), int)
+    for e, t in enumerate(nv):
+        for k in range(3):
+            other = [o for o in edges[tuple(sorted((t[(k + 1) % 3], t[(k + 2) % 3])))]
+                     if o != e]
+            if other:
+                nbe[e, k] = other[0] + 1
+
+    #Linear interpolation coefficients within elements
+    aw0 = np.zeros((3, nele))
+    awx = np.zeros((3, nele))
+    awy = np.zeros((3, nele))
+    for e, t in enumerate(nv):
+        Minv = np.linalg.inv(np.column_stack([np.ones(3), x[t] - xc[e], y[t] - yc[e]]))
+        aw0[:, e] = Minv[0]
+        awx[:, e] = Minv[1]
+        awy[:, e] = Minv[2]
+    #Least-squares gradient over the surrounding elements
+    a1u = np.zeros((4, nele))
+    a2u = np.zeros((4, nele))
+    for e in range(nele):
+        nb = nbe[e] - 1
+        D = np.zeros((3, 2))
+        for k in range(3):
+            if nb[k] >= 0:
+                D[k] = [xc[nb[k]] - xc[e], yc[nb[k]] - yc[e]]
+        P = np.linalg.pinv(D)
+        a1u[1:, e] = P[0]
+        a2u[1:, e] = P[1]
+        a1u[0, e] = -P[0].sum()
+        a2u[0, e] = -P[1].sum()
+
+    siglev = -np.linspace(0, 1, nlevel + 1)[:, None] * np.ones(x.size)[None, :]
+    grid = {}
+    grid['lon'] = lon
+    grid['lat'] = lat
+    grid['x'] = x
+    grid['y'] = y
+    grid['lonc'] = lon[nv].mean(1)
+    grid['latc'] = lat[nv].mean(1)
+    grid['xc'] = xc
+    grid['yc'] = yc
+    grid['trinodes'] = nv
+    grid['nbe'] = nbe
+    grid['aw0'] = aw0
+    grid['awx'] = awx
+    grid['awy'] = awy
+    grid['a1u'] = a1u
+    grid['a2u'] = a2u
+    grid['h'] = 20. + 30. * (x / x.max()) + rng.uniform(0, 2, x.size)
+    grid['siglev'] = siglev
+    grid['siglay'] = 0.5 * (siglev[1:] + siglev[:-1])
+
+    return grid
+
+def write_fvcom(filename, nx=30, ny=20, ntime=48, nlevel=5, seed=0):
+    """
+    Writes a FVCOM-like 3D output file on mesh(nx, ny, nlevel), with
+    hourly tidal elevation and currents.
+
+    Outputs: grid dictionary, see mesh
+    """
+    rng = np.random.RandomState(seed)
+    g = mesh(nx, ny, nlevel, seed)
+    nnode = g['x'].shape[0]
+    nele = g['xc'].shape[0]
+    t = np.arange(ntime)[:, None]
+    zeta = 2. * np.sin(2 * np.pi * t / 12.42 + g['x'][None, :] / 5000.)
+    ua = 1.5 * np.cos(2 * np.pi * t / 12.42 + g['xc'][None, :] / 4000.) \
+       + 0.1 * rng.randn(ntime, nele)
+    va = 0.8 * np.sin(2 * np.pi * t / 12.42 + g['yc'][None, :] / 3000.) \
+       + 0.1 * rng.randn(ntime, nele)
+    prof = np.linspace(1.0, 0.4, nlevel)[None, :, None]
+
+    f = netcdf.netcdf_file(filename, 'w')
+    f.createDimension('time', None)
+    f.createDimension('node', nnode)
+    f.createDimension('nele', nele)
+    f.createDimension('three', 3)
+    f.createDimension('four', 4)
+    f.createDimension('siglay', nlevel)
+    f.createDimension('siglev', nlevel + 1)
+    def var(name, dtype, dims, value):
+        f.createVariable(name, dtype, dims)[:] = value
+    var('time', 'f4', ('time',), 56000. + np.arange(ntime) / 24.)
+    for name in ['lon', 'lat', 'x', 'y', 'h']:
+        var(name, 'f4', ('node',), g[name])
+    for name in ['lonc', 'latc', 'xc', 'yc']:
+        var(name, 'f4', ('nele',), g[name])
+    for name in ['a1u', 'a2u']:
+        var(name, 'f4', ('four', 'nele'), g[name])
+    for name in ['aw0', 'awx', 'awy']:
+        var(name, 'f4', ('three', 'nele'), g[name])
+    var('nv', 'i4', ('three', 'nele'), g['trinodes'].T + 1)
+    var('nbe', 'i4', ('three', 'nele'), g['nbe'].T)
+    var('siglay', 'f4', ('siglay', 'node'), g['siglay'])
+    var('siglev', 'f4', ('siglev', 'node'), g['siglev'])
+    var('zeta', 'f4', ('time', 'node'), zeta)
+    var('ua', 'f4', ('time', 'nele'), ua)
+    var('va', 'f4', ('time', 'nele'), va)
+    var('u', 'f4', ('time', 'siglay', 'nele'), ua[:, None, :] * prof)
+    var('v', 'f4', ('time', 'siglay', 'nele'), va[:, None, :] * prof)
+    var('ww', 'f4', ('time', 'siglay', 'nele'), 0.01 * rng.randn(ntime, nlevel, nele))
+    f.close()
+
+    return g
+
+class Grid(object):
+    """FVCOM.Grid-like container of mesh(...) variables, triele = nbe"""
+    def __init__(self, **kwargs):
+        self.__dict__.update(mesh(**kwargs))
+        self.triele = self.nbe
+        self.nnode = self.lon.shape[0]
+        self.nele = self.lonc.shape[0]
@@ -0,0 +1,98 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+from __future__ import division
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+
+local = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(local)
+sys.path.append(os.path.join(local, '..'))
+sys.path.append(os.path.join(local, '..', 'pyseidon', 'utilities'))
+from synthetic import write_fvcom
+from pyseidon import FVCOM
+from miscellaneous import power_curves, power_assessment, rated_power, \
+                          resource_statistics
+
+power_mat = np.array([[0.0, 1.0, 2.0, 3.0, 4.0, 5.0],
+                      [0.0, 0.2, 0.4, 0.45, 0.4, 0.3]])
+
+class TestPowerAssessment(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        filename = os.path.join(cls.tmp, 'synthetic.nc')
+        write_fvcom(filename, nx=12, ny=9, ntime=10, nlevel=4)
+        cls.model = FVCOM(filename)
+        cls.depth = -10.0
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def tearDown(self):
+        for name in ['velo_norm', 'power_density']:
+            if hasattr(self.model.Variables, name):
+                delattr(self.model.Variables, name)
+
+    def speed_at_depth(self):
+        """Former computation, full velocity norm then interp_at_depth"""
+        self.model.Util3D.velo_norm()
+        u, ind = self.model.Util3D.interp_at_depth(self.model.Variables.velo_norm,
+                                                   self.depth)
+        del self.model.Variables.velo_norm
+        return u
+
+    def test_power_assessment_at_depth(self):
+        util = self.model.Util3D
+        u = self.speed_at_depth()
+        curves = power_curves(power_mat, cut_in=0.5, cut_out=3.5)
+        ref = np.ma.masked_invalid(power_assessment(np.ma.filled(u, np.nan),
+                                                    curves))
+        for chunk in [[], 3]:
+            pa = util.power_assessment_at_depth(power_mat, self.depth,
+                                                cut_in=0.5, cut_out=3.5,
+                                                chunk=chunk)
+            self.assertFalse(hasattr(self.model.Variables, 'velo_norm'))
+            np.testing.assert_array_equal(pa.mask, ref.mask)
+            np.testing.assert_allclose(pa.filled(0.0), ref.filled(0.0),
+                                       rtol=1e-6)
+
+    def test_resource_assessment_at_depth(self):
+        util = self.model.Util3D
+        u = np.ma.filled(self.speed_at_depth(), np.nan)
+        time = self.model.Variables.julianTime[:]
+        ref = resource_statistics(lambda ts, te: u[ts:te], time,
+                                  power_mat=power_mat)
+        stats = util.resource_assessment_at_depth(self.depth,
+                                                  power_mat=power_mat, chunk=3)
+        self.assertFalse(hasattr(self.model.Variables, 'velo_norm'))
+        for key in ref:
+            np.testing.assert_allclose(stats[key], ref[key], rtol=1e-6)
+
+    def test_capacity_factor_weighted(self):
+        var = self.model.Variables
+        time = np.array(var.julianTime[:])
+        #Irregular sampling
+        var.julianTime = time[0] + np.cumsum(np.linspace(0.5, 1.5, time.shape[0]))
+        try:
+            self.model.Util2D.depth_averaged_power_assessment(power_mat,
+                                                              chunk=4)
+            pa = np.asarray(var.depth_av_power_assessment)
+            dt = np.diff(var.julianTime)
+            dt = np.append(dt, dt[-1])
+            mean = (pa * dt[:, None]).sum(axis=0) / dt.sum()
+            np.testing.assert_allclose(var.depth_av_mean_power, mean)
+            rated = rated_power(power_curves(power_mat))[0]
+            np.testing.assert_allclose(var.depth_av_capacity_factor,
+                                       mean / rated)
+        finally:
+            var.julianTime = time
+
+if __name__ == '__main__':
+    unittest.main()
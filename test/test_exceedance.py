@@ -0,0 +1,111 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+from __future__ import division
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+
+local = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(local)
+sys.path.append(os.path.join(local, '..'))
+sys.path.append(os.path.join(local, '..', 'pyseidon', 'utilities'))
+from synthetic import write_fvcom
+from pyseidon import FVCOM
+from miscellaneous import exceedance_curve
+
+def reference(signal, time, Ranges):
+    """% of time strictly above each amplitude, one sample at a time"""
+    dt = np.diff(time)
+    dt = np.append(dt, dt[-1])
+    valid = ~np.isnan(signal)
+    total = dt[valid].sum()
+    return np.array([100.0 * dt[valid & (signal > r)].sum() / total
+                     for r in Ranges])
+
+class TestExceedanceCurve(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.time = np.cumsum(rng.uniform(0.5, 2.0, 200))
+        self.signal = np.abs(rng.randn(200, 7)) * np.linspace(1, 3, 7)
+
+    def test_irregular_time(self):
+        s = self.signal[:, 0]
+        Exceedance, Ranges = exceedance_curve(s, self.time, bins=20)
+        np.testing.assert_allclose(Ranges, np.linspace(0, s.max(), 21))
+        np.testing.assert_allclose(Exceedance, reference(s, self.time, Ranges))
+        #The last sample counts
+        self.assertTrue(Exceedance[0] > 0.0)
+        self.assertEqual(Exceedance[-1], 0.0)
+
+    def test_explicit_bins(self):
+        s = self.signal[:, 1]
+        bins = [2.0, 0.5, 1.0, 0.0]
+        Exceedance, Ranges = exceedance_curve(s, self.time, bins=bins)
+        np.testing.assert_array_equal(Ranges, np.sort(bins))
+        np.testing.assert_allclose(Exceedance, reference(s, self.time, Ranges))
+
+    def test_2D_chunk(self):
+        bins = np.linspace(0.0, 6.0, 25)
+        ref, Ranges = exceedance_curve(self.signal, self.time, bins=bins)
+        self.assertEqual(ref.shape, (25, 7))
+        for j in range(7):
+            np.testing.assert_allclose(ref[:, j],
+                reference(self.signal[:, j], self.time, Ranges))
+        Exceedance, Ranges = exceedance_curve(self.signal, self.time, bins=bins,
+                                              chunk=13)
+        np.testing.assert_allclose(Exceedance, ref)
+        #Default bins, maximum over all blocks
+        Exceedance, Ranges = exceedance_curve(self.signal, self.time, chunk=13)
+        self.assertEqual(Ranges[-1], self.signal.max())
+
+    def test_nan(self):
+        s = self.signal[:, 2].copy()
+        s[[3, 50, 51, 199]] = np.nan
+        Exceedance, Ranges = exceedance_curve(s, self.time, bins=10, chunk=40)
+        np.testing.assert_allclose(Exceedance, reference(s, self.time, Ranges))
+        self.assertEqual(Ranges[-1], np.nanmax(s))
+
+    def test_length_mismatch(self):
+        self.assertRaises(ValueError, exceedance_curve, self.signal[:50],
+                          self.time)
+
+class TestExceedance(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        filename = os.path.join(cls.tmp, 'synthetic.nc')
+        write_fvcom(filename, nx=12, ny=9, ntime=48, nlevel=2)
+        cls.model = FVCOM(filename)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def test_domain(self):
+        util = self.model.Util2D
+        ua = np.asarray(self.model.Variables.ua[:], dtype=np.float64)
+        time = self.model.Variables.julianTime[:]
+        Exceedance, Ranges = util.exceedance(ua, bins=10, chunk=7, graph=False)
+        self.assertEqual(Exceedance.shape, (11, self.model.Grid.nele))
+        np.testing.assert_allclose(Exceedance[:, 5],
+                                   reference(ua[:, 5], time, Ranges))
+
+    def test_time_ind(self):
+        util = self.model.Util2D
+        time = self.model.Variables.julianTime[:]
+        t = np.array([0, 1, 2, 5, 9, 10, 20, 40])
+        s = np.asarray(self.model.Variables.ua[:, 3], dtype=np.float64)[t]
+        Exceedance, Ranges = util.exceedance(s, time_ind=t, graph=False)
+        np.testing.assert_allclose(Exceedance, reference(s, time[t], Ranges))
+        #Without time_ind, samples are equally weighted
+        Exceedance, Ranges = util.exceedance(s, graph=False)
+        np.testing.assert_allclose(Exceedance,
+                                   reference(s, np.arange(t.shape[0]), Ranges))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+from __future__ import division
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+
+local = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(local)
+sys.path.append(os.path.join(local, '..'))
+sys.path.append(os.path.join(local, '..', 'pyseidon', 'utilities'))
+from synthetic import mesh, write_fvcom
+from pyseidon import FVCOM
+from interpolation_utils import interpE_weights, interpN_weights, \
+                                interp_with_weights
+from miscellaneous import element_neighbours
+
+def linear(x, y):
+    return 2.0 + 0.003 * x - 0.002 * y
+
+class TestInterpolationWeights(unittest.TestCase):
+    def setUp(self):
+        self.g = mesh(nx=12, ny=9)
+        rng = np.random.RandomState(3)
+        #Random locations within every element with at least 2 neighbours,
+        #where the least-squares gradient of a linear field is exact
+        nbe = element_neighbours(self.g['trinodes'])
+        self.index = np.where((nbe >= 0).sum(axis=1) >= 2)[0]
+        w = rng.dirichlet(np.ones(3), self.index.shape[0])
+        nodes = self.g['trinodes'][self.index]
+        self.pt_x = (self.g['x'][nodes] * w).sum(axis=1)
+        self.pt_y = (self.g['y'][nodes] * w).sum(axis=1)
+
+    def test_element_linear_field(self):
+        g = self.g
+        var = linear(g['xc'], g['yc'])
+        elements, weights = interpE_weights(self.pt_x, self.pt_y, g['xc'], g['yc'],
+                                            self.index, g['trinodes'],
+                                            g['a1u'], g['a2u'])
+        np.testing.assert_allclose(interp_with_weights(var, elements, weights),
+                                   linear(self.pt_x, self.pt_y), rtol=0, atol=1e-9)
+
+    def test_element_missing_neighbours(self):
+        g = self.g
+        elements, weights = interpE_weights(self.pt_x, self.pt_y, g['xc'], g['yc'],
+                                            self.index, g['trinodes'],
+                                            g['a1u'], g['a2u'])
+        missing = (g['nbe'][self.index] == 0)
+        self.assertTrue(missing.any())
+        self.assertTrue(np.all(weights[:,1:][missing] == 0.0))
+        self.assertTrue(np.all(elements[:,1:][missing] ==
+                               np.repeat(self.index[:,None], 3, axis=1)[missing]))
+        np.testing.assert_array_equal(elements[:,1:][~missing],
+                                      g['nbe'][self.index][~missing] - 1)
+
+    def test_node_linear_field(self):
+        g = self.g
+        var = linear(g['x'], g['y'])
+        nodes, weights = interpN_weights(self.pt_x, self.pt_y, g['xc'], g['yc'],
+                                         self.index, g['trinodes'],
+                                         g['aw0'], g['awx'], g['awy'])
+        np.testing.assert_allclose(interp_with_weights(var, nodes, weights),
+                                   linear(self.pt_x, self.pt_y), rtol=0, atol=1e-9)
+
+class TestInterpolationAtPoint(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        filename = os.path.join(cls.tmp, 'synthetic.nc')
+        write_fvcom(filename, nx=12, ny=9, ntime=6, nlevel=3)
+        cls.model = FVCOM(filename)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def setUp(self):
+        g = self.model.Grid
+        rng = np.random.RandomState(5)
+        #Elements with their three neighbours
+        nbe = element_neighbours(g.trinodes[:])
+        index = rng.permutation(np.where((nbe >= 0).all(axis=1))[0])[:10]
+        w = rng.dirichlet(np.ones(3), index.shape[0])
+        nodes = g.trinodes[index]
+        self.index = index
+        self.pts = zip((g.lon[nodes] * w).sum(axis=1), (g.lat[nodes] * w).sum(axis=1))
+
+    def test_cached_weights_match_point_path(self):
+        m = self.model
+        for var in [m.Grid.h, m.Variables.el, m.Variables.ua, m.Variables.u]:
+            for pt_lon, pt_lat in self.pts:
+                index = m.Util2D.containing_element([pt_lon], [pt_lat])[0]
+                a = m.Util2D.interpolation_at_point(var, pt_lon, pt_lat)
+                b = m.Util2D.interpolation_at_point(var, pt_lon, pt_lat, index=index)
+                np.testing.assert_allclose(a, b, rtol=1e-5, atol=1e-5)
+
+    def test_element_point_path(self):
+        #FVCOM formula with the 1-based nbe of the file
+        m = self.model
+        g = m.Grid
+        ua = np.asarray(m.Variables.ua, dtype=np.float64)
+        for i, (pt_lon, pt_lat) in zip(self.index, self.pts):
+            pt_x = m.Util2D.interpolation_at_point(g.x, pt_lon, pt_lat, index=i)
+            pt_y = m.Util2D.interpolation_at_point(g.y, pt_lon, pt_lat, index=i)
+            stencil = np.append(i, np.asarray(g.triele[i], dtype=int) - 1)
+            dudx = (g.a1u[:,i] * ua[:,stencil]).sum(axis=1)
+            dudy = (g.a2u[:,i] * ua[:,stencil]).sum(axis=1)
+            ref = ua[:,i] + dudx * (pt_x - g.xc[i]) + dudy * (pt_y - g.yc[i])
+            np.testing.assert_allclose(m.Util2D.interpolation_at_point(ua, pt_lon, pt_lat),
+                                       ref, rtol=1e-5, atol=1e-5)
+
+if __name__ == '__main__':
+    unittest.main()
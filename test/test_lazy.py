@@ -0,0 +1,89 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+from __future__ import division
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import cPickle as pkl
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+
+local = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(local)
+sys.path.append(os.path.join(local, '..'))
+from synthetic import write_fvcom
+from pyseidon import FVCOM
+
+names = ['el', 'ua', 'va', 'u', 'v', 'w']
+
+class TestLazyLoading(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.filename = os.path.join(cls.tmp, 'synthetic.nc')
+        g = write_fvcom(cls.filename, nx=12, ny=9, ntime=24, nlevel=3)
+        lon0, lon1 = np.percentile(g['lon'], [20, 70])
+        lat0, lat1 = np.percentile(g['lat'], [30, 80])
+        cls.ax = [lon0, lon1, lat0, lat1]
+        #Time 0 is 2012-03-14T00:00:00, hourly steps
+        cls.tx = ['2012-03-14T05:00:00', '2012-03-14T15:00:00']
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def assertSameVariables(self, **kwargs):
+        eager = FVCOM(self.filename, **kwargs)
+        lazy = FVCOM(self.filename, lazy=True, **kwargs)
+        for name in names:
+            np.testing.assert_array_equal(getattr(lazy.Variables, name)[:],
+                                          getattr(eager.Variables, name)[:],
+                                          err_msg=name)
+        return lazy
+
+    def test_plain(self):
+        self.assertSameVariables()
+
+    def test_ax(self):
+        model = FVCOM(self.filename, ax=self.ax, lazy=True)
+        #Nothing read at construction
+        for name in names:
+            self.assertTrue(name in model.Variables._lazy, msg=name)
+            self.assertFalse(name in model.Variables.__dict__, msg=name)
+        model.Variables.ua
+        self.assertFalse('ua' in model.Variables._lazy)
+        self.assertTrue('ua' in model.Variables.__dict__)
+        self.assertTrue('va' in model.Variables._lazy)
+        lazy = self.assertSameVariables(ax=self.ax)
+        self.assertEqual(lazy.Variables.ua.shape[-1], lazy.Grid.nele)
+
+    def test_tx(self):
+        model = FVCOM(self.filename, tx=self.tx, lazy=True)
+        for name in names:
+            self.assertTrue(name in model.Variables._lazy, msg=name)
+        lazy = self.assertSameVariables(tx=self.tx)
+        self.assertEqual(lazy.Variables.ua.shape[0],
+                         lazy.Variables.julianTime.shape[0])
+        self.assertTrue(lazy.Variables.ua.shape[0] < 24)
+        self.assertSameVariables(ax=self.ax, tx=self.tx)
+
+    def test_save_as(self):
+        model = FVCOM(self.filename, ax=self.ax, lazy=True)
+        eager = FVCOM(self.filename, ax=self.ax)
+        model.Variables.ua
+        filename = os.path.join(self.tmp, 'lazy')
+        model.Save_as(filename)
+        self.assertEqual(model.Variables._lazy, {})
+        f = open(filename + '.p', 'rb')
+        data = pkl.load(f)
+        f.close()
+        for name in names:
+            np.testing.assert_array_equal(data['Variables'][name],
+                                          getattr(eager.Variables, name)[:],
+                                          err_msg=name)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+from __future__ import division
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+
+local = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(local)
+sys.path.append(os.path.join(local, '..'))
+from synthetic import write_fvcom
+from pyseidon import FVCOM
+
+def brute_closest(pt_lon, pt_lat, lon, lat):
+    """Former closest_point, dense distance matrix and argmin"""
+    dist = (lon[None, :] - pt_lon[:, None])**2 + (lat[None, :] - pt_lat[:, None])**2
+    return np.argmin(dist, axis=1), np.argsort(dist, axis=1)
+
+class MeshTestCase(unittest.TestCase):
+    """Full and regioned FVCOM on the synthetic mesh, random points"""
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        filename = os.path.join(cls.tmp, 'synthetic.nc')
+        g = write_fvcom(filename, nx=20, ny=15, ntime=2, nlevel=2)
+        cls.full = FVCOM(filename)
+        lon0, lon1 = np.percentile(g['lon'], [20, 70])
+        lat0, lat1 = np.percentile(g['lat'], [30, 80])
+        cls.region = FVCOM(filename, ax=[lon0, lon1, lat0, lat1])
+        rng = np.random.RandomState(0)
+        cls.pt_lon = rng.uniform(g['lon'].min() - 0.005, g['lon'].max() + 0.005, 300)
+        cls.pt_lat = rng.uniform(g['lat'].min() - 0.005, g['lat'].max() + 0.005, 300)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+class TestClosest(MeshTestCase):
+    def assertSameClosest(self, model):
+        g = model.Grid
+        for find, lon, lat in [(model.Util2D.closest_element, g.lonc[:], g.latc[:]),
+                               (model.Util2D.closest_node, g.lon[:], g.lat[:])]:
+            ref, order = brute_closest(self.pt_lon, self.pt_lat,
+                                       np.asarray(lon, dtype=np.float64),
+                                       np.asarray(lat, dtype=np.float64))
+            np.testing.assert_array_equal(find(self.pt_lon, self.pt_lat), ref)
+            np.testing.assert_array_equal(find(self.pt_lon, self.pt_lat, k=3),
+                                          order[:, :3])
+            #Single point
+            self.assertEqual(find([self.pt_lon[0]], [self.pt_lat[0]])[0], ref[0])
+
+    def test_full_mesh(self):
+        self.assertSameClosest(self.full)
+        self.assertTrue(hasattr(self.full.Grid, 'ele_tree'))
+        self.assertTrue(hasattr(self.full.Grid, 'node_tree'))
+
+    def test_regioned_mesh(self):
+        self.assertSameClosest(self.region)
+        self.assertEqual(self.region.Grid.ele_tree.n, self.region.Grid.nele)
+
+class TestContainingElement(MeshTestCase):
+    def interior_points(self, model, n=200, seed=1):
+        g = model.Grid
+        rng = np.random.RandomState(seed)
+        index = rng.randint(0, g.nele, n)
+        w = rng.dirichlet(np.ones(3) * 5, n)
+        nodes = g.trinodes[:][index]
+        lon = (np.asarray(g.lon[:], dtype=np.float64)[nodes] * w).sum(axis=1)
+        lat = (np.asarray(g.lat[:], dtype=np.float64)[nodes] * w).sum(axis=1)
+        return index, lon, lat
+
+    def test_in_mesh(self):
+        for model in [self.full, self.region]:
+            index, lon, lat = self.interior_points(model)
+            np.testing.assert_array_equal(
+                model.Util2D.containing_element(lon, lat), index)
+        self.assertTrue(hasattr(self.full.Grid, 'triangle'))
+
+    def test_out_of_mesh(self):
+        g = self.full.Grid
+        lon = np.array([g.lon[:].min() - 0.01, g.lon[:].max() + 0.02,
+                        g.lon[:].mean()])
+        lat = np.array([g.lat[:].mean(), g.lat[:].min() - 0.01,
+                        g.lat[:].max() + 0.005])
+        ref, order = brute_closest(lon, lat,
+                                   np.asarray(g.lonc[:], dtype=np.float64),
+                                   np.asarray(g.latc[:], dtype=np.float64))
+        np.testing.assert_array_equal(
+            self.full.Util2D.containing_element(lon, lat), ref)
+
+    def test_mixed(self):
+        index, lon, lat = self.interior_points(self.region, n=20)
+        g = self.region.Grid
+        #Outside the region, within the full mesh
+        out_lon = np.array([g.lon[:].max() + 0.005])
+        out_lat = np.array([g.lat[:].mean()])
+        ref, order = brute_closest(out_lon, out_lat,
+                                   np.asarray(g.lonc[:], dtype=np.float64),
+                                   np.asarray(g.latc[:], dtype=np.float64))
+        found = self.region.Util2D.containing_element(np.append(lon, out_lon),
+                                                      np.append(lat, out_lat))
+        np.testing.assert_array_equal(found, np.append(index, ref))
+
+if __name__ == '__main__':
+    unittest.main()
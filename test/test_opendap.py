@@ -0,0 +1,193 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+from __future__ import division
+import os
+import sys
+import shutil
+import tempfile
+import time
+import threading
+import unittest
+import numpy as np
+from scipy.io import netcdf
+
+local = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(local)
+sys.path.append(os.path.join(local, '..', 'pyseidon', 'utilities'))
+from synthetic import write_fvcom
+from opendap_server import StandInServer
+from pydap.client import open_url
+from pydap.exceptions import ServerError
+import cPickle as pkl
+import opendap_utils
+from opendap_utils import read_plan, opendap_take, opendap_take_many, HTTPError, \
+                          open_url_cached, CachedProxy
+
+class TestReadPlan(unittest.TestCase):
+    def test_merge_within_tolerance(self):
+        index = np.array([0, 1, 2, 5, 6, 20, 21, 60])
+        self.assertEqual(read_plan(index, tolerance=2),
+                         [(0, 7, 0, 5), (20, 22, 5, 7), (60, 61, 7, 8)])
+        self.assertEqual(read_plan(index, tolerance=100), [(0, 61, 0, 8)])
+        self.assertEqual(read_plan(index, tolerance=0),
+                         [(0, 3, 0, 3), (5, 7, 3, 5), (20, 22, 5, 7), (60, 61, 7, 8)])
+        self.assertEqual(read_plan([]), [])
+
+class TestOpendapTake(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        filename = os.path.join(cls.tmp, 'synthetic.nc')
+        write_fvcom(filename, nx=12, ny=9, ntime=6, nlevel=3)
+        cls.local = netcdf.netcdf_file(filename, 'r', mmap=False)
+        cls.server = StandInServer(filename)
+        cls.remote = open_url(cls.server.url)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+        cls.local.close()
+        shutil.rmtree(cls.tmp)
+
+    def setUp(self):
+        self.server.requests = 0
+        self.server.fail = set()
+        rng = np.random.RandomState(0)
+        nele = self.local.variables['ua'].shape[-1]
+        #Fragmented region: a few runs of consecutive elements
+        self.index = np.unique(np.concatenate([np.arange(s, s + 5) for s in
+                               rng.choice(nele - 5, 8, replace=False)]))
+
+    def test_plan_merging(self):
+        for tolerance in [0, 10, 1000]:
+            self.server.requests = 0
+            stats = {}
+            out = opendap_take(self.remote['u'].data, self.index,
+                               lead=(slice(1, 4),), tolerance=tolerance,
+                               stats=stats)
+            np.testing.assert_array_equal(out,
+                self.local.variables['u'].data[1:4][..., self.index])
+            nplan = len(read_plan(self.index, tolerance=tolerance))
+            self.assertEqual(self.server.requests, nplan)
+            self.assertEqual(stats['requests'], nplan)
+        self.assertEqual(nplan, 1)
+
+    def test_unsorted_index(self):
+        index = self.index[::-1].copy()
+        out = opendap_take(self.remote['ua'].data, index, tolerance=3)
+        np.testing.assert_array_equal(out, self.local.variables['ua'].data[:, index])
+
+    def test_many_variables(self):
+        requests = dict((name, (self.remote[name].data, self.index, (slice(0, 6),)))
+                        for name in ['ua', 'va', 'u', 'v'])
+        out = opendap_take_many(requests, tolerance=3, nthreads=4)
+        for name in requests:
+            np.testing.assert_array_equal(out[name],
+                self.local.variables[name].data[..., self.index])
+
+    def test_retries(self):
+        nplan = len(read_plan(self.index, tolerance=3))
+        self.server.fail = set([1, 2])
+        stats = {}
+        out = opendap_take_many({'ua': (self.remote['ua'].data, self.index, ())},
+                                tolerance=3, nthreads=1, retries=2,
+                                backoff=0.0, stats=stats)
+        np.testing.assert_array_equal(out['ua'],
+                                      self.local.variables['ua'].data[:, self.index])
+        self.assertEqual(stats['requests'], nplan)
+        self.assertEqual(self.server.requests, nplan + 2)
+
+    def test_retries_exhausted(self):
+        self.server.fail = set([1, 2, 3])
+        self.assertRaises((IOError, ServerError, HTTPError), opendap_take_many,
+                          {'ua': (self.remote['ua'].data, self.index, ())},
+                          tolerance=3, nthreads=1, retries=2, backoff=0.0)
+
+    def test_no_request_after_failure(self):
+        requests = dict((name, (self.remote[name].data, self.index, ()))
+                        for name in ['ua', 'va', 'u', 'v'])
+        ntask = 4 * len(read_plan(self.index, tolerance=0))
+        nthread = threading.active_count()
+        self.server.fail = set([1])
+        self.assertRaises((IOError, ServerError, HTTPError), opendap_take_many,
+                          requests, tolerance=0, nthreads=2, retries=0)
+        #All workers joined
+        self.assertEqual(threading.active_count(), nthread)
+        issued = self.server.requests
+        time.sleep(0.2)
+        self.assertEqual(self.server.requests, issued)
+        self.assertTrue(issued < ntask)
+
+class TestOpendapCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.filename = os.path.join(cls.tmp, 'synthetic.nc')
+        write_fvcom(cls.filename, nx=12, ny=9, ntime=6, nlevel=3)
+        cls.local = netcdf.netcdf_file(cls.filename, 'r', mmap=False)
+        cls.server = StandInServer(cls.filename)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+        cls.local.close()
+        shutil.rmtree(cls.tmp)
+
+    def setUp(self):
+        self.server.requests = 0
+        self.server.fail = set()
+        self.cache_dir = opendap_utils.CACHE_DIR
+        self.cache_size = opendap_utils.CACHE_SIZE
+        opendap_utils.CACHE_DIR = os.path.join(tempfile.mkdtemp(dir=self.tmp),
+                                               'opendap')
+
+    def tearDown(self):
+        opendap_utils.CACHE_DIR = self.cache_dir
+        opendap_utils.CACHE_SIZE = self.cache_size
+
+    def test_off_by_default(self):
+        remote = open_url_cached(self.server.url)
+        self.assertFalse(isinstance(remote['ua'].data, CachedProxy))
+        remote['ua'][0:2]
+        self.assertFalse(os.path.exists(opendap_utils.CACHE_DIR))
+
+    def test_served_from_disk(self):
+        remote = open_url_cached(self.server.url, cache=True)
+        out = remote['ua'].data[0:2]
+        self.assertEqual(self.server.requests, 1)
+        np.testing.assert_array_equal(remote['ua'].data[0:2], out)
+        np.testing.assert_array_equal(out, self.local.variables['ua'].data[0:2])
+        self.assertEqual(self.server.requests, 1)
+
+    def test_eviction(self):
+        remote = open_url_cached(self.server.url, cache=True)
+        nbytes = np.asarray(remote['u'].data[0]).nbytes
+        opendap_utils.CACHE_SIZE = 3 * nbytes
+        for t in range(6):
+            remote['u'].data[t]
+        sizes = [os.path.getsize(f) for f in opendap_utils._cache_files()]
+        self.assertTrue(sum(sizes) <= opendap_utils.CACHE_SIZE)
+        self.assertTrue(len(sizes) < 6)
+        self.assertEqual(opendap_utils._cache_total[opendap_utils.CACHE_DIR],
+                         sum(sizes))
+        #Most recent slice kept
+        self.server.requests = 0
+        remote['u'].data[5]
+        self.assertEqual(self.server.requests, 0)
+
+    def test_save_as_pickle(self):
+        from pyseidon import FVCOM
+        model = FVCOM(self.filename)
+        remote = open_url_cached(self.server.url, cache=True)
+        model.Variables.ua = remote['ua'].data
+        saved = os.path.join(self.tmp, 'saved')
+        model.Save_as(saved)
+        f = open(saved + '.p', 'rb')
+        data = pkl.load(f)
+        f.close()
+        self.assertTrue(isinstance(data['Variables']['ua'], np.ndarray))
+        np.testing.assert_array_equal(data['Variables']['ua'],
+                                      self.local.variables['ua'].data)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+from __future__ import division
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+from scipy.io import netcdf
+
+local = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(local)
+sys.path.append(os.path.join(local, '..'))
+sys.path.append(os.path.join(local, '..', 'pyseidon', 'utilities'))
+from synthetic import write_fvcom
+from pyseidon import FVCOM
+from miscellaneous import output_array, flush_output, time_blocks
+
+class TestOutputArray(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.output = os.path.join(self.tmp, 'out.nc')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, value, dtype=np.float64, chunk=3):
+        out = output_array(value.shape, ('time', 'nele'), output=self.output,
+                           name=name, dtype=dtype)
+        for ts, te in time_blocks(value.shape[0], chunk):
+            out[ts:te] = value[ts:te]
+        return flush_output(out)
+
+    def test_variables_in_same_file(self):
+        rng = np.random.RandomState(0)
+        a = rng.randn(7, 5)
+        b = rng.randn(7, 5)
+        outa = self.write('a', a)
+        outb = self.write('b', b)
+        np.testing.assert_array_equal(outa[:], a)
+        np.testing.assert_array_equal(outb[2:4, 1], b[2:4, 1])
+        np.testing.assert_array_equal(np.asarray(outb), b)
+        self.assertEqual(outa.shape, (7, 5))
+        #Overwritten with the same shape and data type
+        outa = self.write('a', 2 * a)
+        np.testing.assert_array_equal(outa[:], 2 * a)
+        f = netcdf.netcdf_file(self.output, 'r', mmap=False)
+        np.testing.assert_array_equal(f.variables['b'].data, b)
+        f.close()
+
+    def test_mismatch(self):
+        self.write('a', np.zeros((7, 5)))
+        self.assertRaises(ValueError, self.write, 'a', np.zeros((7, 5)),
+                          dtype=np.float32)
+        self.assertRaises(ValueError, self.write, 'b', np.zeros((6, 5)))
+        #The file is left usable
+        out = self.write('b', np.ones((7, 5)))
+        np.testing.assert_array_equal(out[:], 1.0)
+
+class TestOutputFvcom(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        filename = os.path.join(cls.tmp, 'synthetic.nc')
+        write_fvcom(filename, nx=12, ny=9, ntime=6, nlevel=3)
+        cls.model = FVCOM(filename)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def test_hori_velo_norm(self):
+        util = self.model.Util2D
+        util.hori_velo_norm()
+        ref = np.array(self.model.Variables.hori_velo_norm)
+        output = os.path.join(self.tmp, 'norm.nc')
+        util.hori_velo_norm(chunk=4, output=output)
+        util.flow_dir(chunk=4, output=output)
+        np.testing.assert_allclose(self.model.Variables.hori_velo_norm[:], ref)
+        del self.model.Variables.hori_velo_norm
+        del self.model.Variables.depth_av_flow_dir
+
+    def test_power_density_by_blocks(self):
+        util = self.model.Util2D
+        var = self.model.Variables
+        ua = np.asarray(var.ua[:], dtype=np.float64)
+        va = np.asarray(var.va[:], dtype=np.float64)
+        ref = 0.5 * 1025.0 * np.hypot(ua, va)**3
+        util.depth_averaged_power_density(chunk=4)
+        #The velocity norm is computed per block, not kept
+        self.assertFalse(hasattr(var, 'hori_velo_norm'))
+        np.testing.assert_allclose(var.depth_av_power_density, ref, rtol=1e-5)
+        del var.depth_av_power_density
+        util.depth_averaged_power_density()
+        self.assertTrue(hasattr(var, 'hori_velo_norm'))
+        np.testing.assert_allclose(var.depth_av_power_density, ref, rtol=1e-5)
+        del var.depth_av_power_density
+        del var.hori_velo_norm
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+from __future__ import division
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+
+local = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(local)
+sys.path.append(os.path.join(local, '..'))
+sys.path.append(os.path.join(local, '..', 'pyseidon', 'utilities'))
+from synthetic import Grid, write_fvcom
+from regioner_baseline import baseline_regioner
+import regioner as regioner_module
+from regioner import regioner, load_regions, REGIONS
+
+class TestRegioner(unittest.TestCase):
+    def setUp(self):
+        self.grid = Grid(nx=40, ny=30)
+
+    def assertSameRegion(self, ax):
+        ref = baseline_regioner(self.grid, ax)
+        new = regioner(self.grid, ax, cache=False)
+        self.assertEqual(sorted(ref.keys()), sorted(new.keys()))
+        for key in ref:
+            if key=='triangle':
+                np.testing.assert_array_equal(ref[key].triangles, new[key].triangles)
+                continue
+            np.testing.assert_array_equal(ref[key], new[key], err_msg=key)
+            self.assertEqual(ref[key].dtype, new[key].dtype, msg=key)
+
+    def test_box(self):
+        g = self.grid
+        lon0, lon1 = np.percentile(g.lon, [20, 60])
+        lat0, lat1 = np.percentile(g.lat, [30, 80])
+        self.assertSameRegion([lon0, lon1, lat0, lat1])
+
+    def test_whole_domain(self):
+        g = self.grid
+        self.assertSameRegion([g.lon.min(), g.lon.max(), g.lat.min(), g.lat.max()])
+
+    def test_corner(self):
+        g = self.grid
+        self.assertSameRegion([g.lon.min(), np.percentile(g.lon, 10),
+                               g.lat.min(), np.percentile(g.lat, 10)])
+
+class TestRegionKinds(unittest.TestCase):
+    def setUp(self):
+        self.grid = Grid(nx=30, ny=20)
+        g = self.grid
+        self.box = list(np.percentile(g.lon, [20, 60])) + \
+                   list(np.percentile(g.lat, [30, 80]))
+
+    def expected(self, inside):
+        """Elements with at least one node for which inside is True"""
+        return np.where(inside[self.grid.trinodes].any(axis=1))[0]
+
+    def test_same_rule(self):
+        lon0, lon1, lat0, lat1 = self.box
+        polygon = [[lon0, lat0], [lon1, lat0], [lon1, lat1], [lon0, lat1]]
+        ref = regioner(self.grid, self.box)
+        for ax in [[self.box], polygon]:
+            new = regioner(self.grid, ax)
+            np.testing.assert_array_equal(new['element_index'],
+                                          ref['element_index'])
+            np.testing.assert_array_equal(new['nv'], ref['nv'])
+
+    def test_polygon(self):
+        g = self.grid
+        lon0, lon1 = g.lon.min(), g.lon.max()
+        lat0, lat1 = g.lat.min(), g.lat.max()
+        #Triangle over the lower left half of the domain
+        polygon = [[lon0, lat0], [lon1, lat0], [lon0, lat1]]
+        inside = ((g.lon - lon0) / (lon1 - lon0) +
+                  (g.lat - lat0) / (lat1 - lat0)) < 1.0
+        data = regioner(g, polygon)
+        np.testing.assert_array_equal(data['element_index'], self.expected(inside))
+        np.testing.assert_array_equal(data['lonc'],
+                                      g.lonc[data['element_index']])
+
+    def test_boxes(self):
+        g = self.grid
+        boxes = [self.box, [g.lon.min(), np.percentile(g.lon, 10),
+                            g.lat.min(), np.percentile(g.lat, 10)]]
+        inside = np.zeros(g.lon.shape[0], bool)
+        for box in boxes:
+            inside |= ((g.lon >= box[0]) & (g.lon <= box[1]) &
+                       (g.lat >= box[2]) & (g.lat <= box[3]))
+        data = regioner(g, boxes)
+        np.testing.assert_array_equal(data['element_index'], self.expected(inside))
+        #Re-labelled nodes point at the same coordinates
+        np.testing.assert_array_equal(data['lon'][data['nv']],
+                                      g.lon[g.trinodes[data['element_index']]])
+
+class TestNamedRegions(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        REGIONS.pop('TESTBOX', None)
+        REGIONS.pop('TESTPOLY', None)
+        shutil.rmtree(self.tmp)
+
+    def test_load_regions(self):
+        from pyseidon import FVCOM
+        filename = os.path.join(self.tmp, 'synthetic.nc')
+        g = write_fvcom(filename, nx=12, ny=9, ntime=2, nlevel=2)
+        box = [float(np.percentile(g['lon'], 20)), float(np.percentile(g['lon'], 70)),
+               float(np.percentile(g['lat'], 30)), float(np.percentile(g['lat'], 80))]
+        polygon = [[box[0], box[2]], [box[1], box[2]], [box[0], box[3]]]
+        cfg = os.path.join(self.tmp, 'regions.cfg')
+        f = open(cfg, 'w')
+        f.write('[TESTBOX]\nax = ' + repr(box) + '\n\n'
+                '[TESTPOLY]\nax = ' + repr(polygon) + '\n')
+        f.close()
+        regions = load_regions(cfg)
+        self.assertEqual(regions['TESTBOX'], box)
+        self.assertEqual(regions['TESTPOLY'], polygon)
+        #Pre-defined regions are kept
+        self.assertTrue('GP' in regions)
+        for name, ax in [('TESTBOX', box), ('TESTPOLY', polygon)]:
+            named = FVCOM(filename, ax=name)
+            plain = FVCOM(filename, ax=ax)
+            np.testing.assert_array_equal(named.Grid._element_index,
+                                          plain.Grid._element_index)
+            np.testing.assert_array_equal(named.Variables.ua[:],
+                                          plain.Variables.ua[:])
+        self.assertEqual(named.Grid._region, polygon)
+
+class TestRegionCache(unittest.TestCase):
+    def setUp(self):
+        self.grid = Grid(nx=20, ny=15)
+        self.cacheDir = regioner_module.CACHE_DIR
+        regioner_module.CACHE_DIR = tempfile.mkdtemp()
+        g = self.grid
+        self.ax = list(np.percentile(g.lon, [20, 60])) + \
+                  list(np.percentile(g.lat, [30, 80]))
+
+    def tearDown(self):
+        shutil.rmtree(regioner_module.CACHE_DIR)
+        regioner_module.CACHE_DIR = self.cacheDir
+
+    def test_off_by_default(self):
+        regioner(self.grid, self.ax)
+        self.assertEqual(os.listdir(regioner_module.CACHE_DIR), [])
+
+    def test_versioned_key(self):
+        g = self.grid
+        ref = regioner(g, self.ax, cache=True)
+        filename = regioner_module.region_cache_file(g.lon, g.lat, g.trinodes, self.ax)
+        self.assertTrue(os.path.exists(filename))
+        self.assertTrue(os.path.basename(filename).startswith(
+                        'region_v' + str(regioner_module.CACHE_VERSION) + '_'))
+        cached = regioner(g, self.ax, cache=True)
+        np.testing.assert_array_equal(ref['nv'], cached['nv'])
+        #A new format never re-uses previous files
+        version = regioner_module.CACHE_VERSION
+        try:
+            regioner_module.CACHE_VERSION = version + 1
+            self.assertNotEqual(filename, regioner_module.region_cache_file(
+                                g.lon, g.lat, g.trinodes, self.ax))
+        finally:
+            regioner_module.CACHE_VERSION = version
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+from __future__ import division
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+
+local = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(local)
+sys.path.append(os.path.join(local, '..'))
+from synthetic import write_fvcom
+from pyseidon import FVCOM
+
+class TestShortestPaths(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        filename = os.path.join(cls.tmp, 'synthetic.nc')
+        write_fvcom(filename, nx=30, ny=20, ntime=2, nlevel=2)
+        cls.full = FVCOM(filename)
+        lon, lat = cls.full.Grid.lon[:], cls.full.Grid.lat[:]
+        cls.ax = [np.percentile(lon, 10), np.percentile(lon, 90),
+                  np.percentile(lat, 10), np.percentile(lat, 90)]
+        cls.region = FVCOM(filename, ax=cls.ax)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def test_regioned_mesh(self):
+        ax = self.ax
+        wlon, wlat = ax[1] - ax[0], ax[3] - ax[2]
+        start = [[ax[0] + 0.2 * wlon, ax[2] + 0.2 * wlat],
+                 [ax[0] + 0.3 * wlon, ax[2] + 0.8 * wlat]]
+        end = [[ax[0] + 0.8 * wlon, ax[2] + 0.7 * wlat],
+               [ax[0] + 0.7 * wlon, ax[2] + 0.25 * wlat]]
+        paths, dist = self.full.Util2D.shortest_paths(start, end)
+        rpaths, rdist = self.region.Util2D.shortest_paths(start, end)
+        index = np.asarray(self.region.Grid._element_index)
+        for path, rpath in zip(paths, rpaths):
+            #Full mesh paths lie within the region, hence should be found
+            self.assertTrue(np.all(np.in1d(path, index)))
+            np.testing.assert_array_equal(index[rpath], path)
+        np.testing.assert_allclose(rdist, dist, rtol=1e-6)
+
+if __name__ == '__main__':
+    unittest.main()
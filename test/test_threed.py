@@ -0,0 +1,307 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+from __future__ import division
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+
+local = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(local)
+sys.path.append(os.path.join(local, '..'))
+from synthetic import write_fvcom
+from pyseidon import FVCOM
+
+def column_interp(var, dep, target):
+    """
+    np.interp along each water column, var and dep (time, level, element),
+    target (time, ndepth, element), masked outside the sigma levels
+    """
+    ntime, nlevel, nele = var.shape
+    out = np.empty(target.shape)
+    for t in range(ntime):
+        for e in range(nele):
+            #Depth decreases downwards, np.interp needs increasing abscissae
+            out[t, :, e] = np.interp(target[t, :, e], dep[t, ::-1, e],
+                                     var[t, ::-1, e])
+    outside = (target > dep[:, :1, :]) | (target < dep[:, -1:, :])
+    return np.ma.masked_array(out, mask=outside)
+
+class ThreeDTestCase(unittest.TestCase):
+    """FVCOM on the synthetic 3D file, depth (m) computed directly"""
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        filename = os.path.join(cls.tmp, 'synthetic.nc')
+        write_fvcom(filename, nx=12, ny=9, ntime=7, nlevel=4)
+        cls.model = FVCOM(filename)
+        g = cls.model.Grid
+        trinodes = g.trinodes[:]
+        el = np.asarray(cls.model.Variables.el[:], dtype=np.float64)
+        h = np.asarray(g.h[:], dtype=np.float64)
+        siglay = np.asarray(g.siglay[:], dtype=np.float64)
+        #Water column height and depth at elements, mean of their nodes
+        cls.column = el[:, trinodes].mean(axis=-1) + h[trinodes].mean(axis=-1)
+        cls.depth = cls.column[:, None, :] * siglay[:, trinodes].mean(axis=-1)[None]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def tearDown(self):
+        if hasattr(self.model.Grid, 'depth'):
+            del self.model.Grid.depth
+
+    def assertSameMasked(self, actual, expected):
+        np.testing.assert_array_equal(np.ma.getmaskarray(actual),
+                                      np.ma.getmaskarray(expected))
+        np.testing.assert_allclose(actual.compressed(), expected.compressed(),
+                                   rtol=1e-6)
+
+class TestDepth(ThreeDTestCase):
+    def test_in_memory(self):
+        util = self.model.Util3D
+        for chunk in [[], 3]:
+            util.depth(chunk=chunk)
+            self.assertEqual(self.model.Grid.depth.shape, self.depth.shape)
+            np.testing.assert_allclose(self.model.Grid.depth, self.depth,
+                                       rtol=1e-6)
+            del self.model.Grid.depth
+
+    def test_output(self):
+        util = self.model.Util3D
+        output = os.path.join(self.tmp, 'depth.nc')
+        util.depth(chunk=2, output=output)
+        np.testing.assert_allclose(self.model.Grid.depth[:], self.depth,
+                                   rtol=1e-6)
+        np.testing.assert_allclose(self.model.Grid.depth[3:5, 1], self.depth[3:5, 1],
+                                   rtol=1e-6)
+        del self.model.Grid.depth
+        util.depth(chunk=4, dtype=np.float32)
+        self.assertEqual(self.model.Grid.depth.dtype, np.float32)
+        np.testing.assert_allclose(self.model.Grid.depth, self.depth, rtol=1e-5)
+
+class TestInterpAtDepth(ThreeDTestCase):
+    def test_depths(self):
+        util = self.model.Util3D
+        u = np.asarray(self.model.Variables.u[:], dtype=np.float64)
+        #Within every column, across the bottom of the shallow ones,
+        #above the first and below the last sigma level
+        depths = [-5.0, -12.3, -30.0, -0.01, -100.0]
+        target = np.empty((u.shape[0], len(depths), u.shape[2]))
+        target[:] = np.array(depths)[None, :, None]
+        ref = column_interp(u, self.depth, target)
+        self.assertTrue(ref[:, 2].mask.any() and not ref[:, 2].mask.all())
+        self.assertTrue(ref[:, 3:].mask.all())
+        for chunk in [[], 3]:
+            interp, ind = util.interp_at_depth(u, depths, chunk=chunk)
+            self.assertEqual(interp.shape, target.shape)
+            self.assertSameMasked(interp, ref)
+            #Indexes reused
+            interp, ind = util.interp_at_depth(u, depths, ind=ind, chunk=chunk)
+            self.assertSameMasked(interp, ref)
+        #Single depth, 2D
+        interp, ind = util.interp_at_depth(u, -12.3)
+        self.assertEqual(interp.shape, (u.shape[0], u.shape[2]))
+        self.assertEqual(ind.shape, (u.shape[0], u.shape[2]))
+        self.assertSameMasked(interp, ref[:, 1])
+        #From the computed depth
+        util.depth()
+        interp, ind = util.interp_at_depth(u, -100.0)
+        self.assertTrue(interp.mask.all())
+        interp, ind = util.interp_at_depth(u, depths, chunk=2)
+        self.assertSameMasked(interp, ref)
+
+class TestHorizontalSlices(ThreeDTestCase):
+    def slices(self, var, depths, bed):
+        target = np.where(np.array(bed)[None, :, None],
+                          np.array(depths)[None, :, None] - self.column[:, None, :],
+                          -np.array(depths)[None, :, None])
+        return column_interp(var, self.depth, target)
+
+    def test_depths(self):
+        util = self.model.Util3D
+        u = np.asarray(self.model.Variables.u[:], dtype=np.float64)
+        v = np.asarray(self.model.Variables.v[:], dtype=np.float64)
+        #Within every column, too close to the reference or past the
+        #opposite end of the shallow columns
+        depths = [5.0, 12.3, 0.1, 30.0]
+        for reference in ['surface', 'bed']:
+            ref = self.slices(u, depths, [reference=='bed'] * 4)
+            self.assertTrue(ref[:, 2].mask.all())
+            self.assertTrue(ref[:, 3].mask.any() and not ref[:, 3].mask.all())
+            for chunk in [[], 3]:
+                slices = util.horizontal_slices(['u', v], depths,
+                                                reference=reference, chunk=chunk)
+                self.assertEqual(len(slices), 2)
+                self.assertSameMasked(slices[0], ref)
+                self.assertSameMasked(slices[1],
+                                      self.slices(v, depths, [reference=='bed'] * 4))
+
+    def test_mixed_references(self):
+        util = self.model.Util3D
+        u = np.asarray(self.model.Variables.u[:], dtype=np.float64)
+        depths = [5.0, 5.0, 12.3]
+        reference = ['surface', 'bed', 'bed']
+        ref = self.slices(u, depths, [False, True, True])
+        slices = util.horizontal_slices([u], depths, reference=reference, chunk=2)
+        self.assertSameMasked(slices[0], ref)
+        #Each depth as from its own reference
+        surface = util.horizontal_slices([u], [5.0], reference='surface')[0]
+        bed = util.horizontal_slices([u], [5.0, 12.3], reference='bed')[0]
+        self.assertSameMasked(slices[0][:, :1], surface)
+        self.assertSameMasked(slices[0][:, 1:], bed)
+
+class TestVertiShear(ThreeDTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super(TestVertiShear, cls).setUpClass()
+        u = np.asarray(cls.model.Variables.u[:], dtype=np.float64)
+        v = np.asarray(cls.model.Variables.v[:], dtype=np.float64)
+        vel = np.hypot(u, v)
+        cls.shear = (vel[:, 1:] - vel[:, :-1]) / (cls.depth[:, 1:] - cls.depth[:, :-1])
+
+    def tearDown(self):
+        super(TestVertiShear, self).tearDown()
+        for name in ['verti_shear', 'verti_shear_stats']:
+            if hasattr(self.model.Variables, name):
+                delattr(self.model.Variables, name)
+
+    def test_by_blocks(self):
+        util = self.model.Util3D
+        for chunk in [[], 2]:
+            util.verti_shear(chunk=chunk)
+            self.assertEqual(self.model.Variables.verti_shear.shape, self.shear.shape)
+            np.testing.assert_allclose(self.model.Variables.verti_shear, self.shear,
+                                       rtol=1e-5)
+            del self.model.Variables.verti_shear
+        output = os.path.join(self.tmp, 'shear.nc')
+        util.verti_shear(chunk=3, output=output)
+        np.testing.assert_allclose(self.model.Variables.verti_shear[:], self.shear,
+                                   rtol=1e-5)
+
+    def assertStats(self, shear, bins):
+        stats = self.model.Variables.verti_shear_stats
+        time = np.asarray(self.model.Variables.julianTime[:], dtype=np.float64)
+        dt = np.append(np.diff(time), time[-1] - time[-2])
+        w = np.repeat(dt, shear.shape[1])[:, None]
+        samples = np.abs(shear).reshape(-1, shear.shape[2])
+        np.testing.assert_allclose(stats['mean'],
+                                   (samples * w).sum(axis=0) / w.sum(), rtol=1e-5)
+        np.testing.assert_allclose(stats['max'], samples.max(axis=0), rtol=1e-5)
+        #Weighted percentile, within the bin resolution
+        order = np.argsort(samples, axis=0)
+        cdf = np.cumsum(np.take_along_axis(np.broadcast_to(w, samples.shape), order,
+                                           axis=0), axis=0) / w.sum()
+        values = np.take_along_axis(samples, order, axis=0)
+        for p, value in zip(stats['percentiles'], stats['percentile_values']):
+            ref = values[np.argmax(cdf >= p / 100.0, axis=0), np.arange(values.shape[1])]
+            np.testing.assert_allclose(value, ref, atol=2 * (bins[1] - bins[0]))
+
+    def test_stats(self):
+        util = self.model.Util3D
+        bins = np.linspace(0.0, 1.1 * np.abs(self.shear).max(), 2001)
+        for chunk in [[], 3]:
+            util.verti_shear_stats(percentiles=[50, 95], bins=bins, chunk=chunk)
+            self.assertStats(self.shear, bins)
+            util.verti_shear_stats(bot_lvl=1, top_lvl=3, percentiles=[50, 95],
+                                   bins=bins, chunk=chunk)
+            self.assertStats(self.shear[:, 1:3], bins)
+        #From the computed shear
+        util.verti_shear()
+        util.verti_shear_stats(bot_lvl=0, top_lvl=2, percentiles=[95], bins=bins)
+        self.assertStats(self.shear[:, 0:2], bins)
+
+    def test_at_point(self):
+        util = self.model.Util3D
+        g = self.model.Grid
+        #At an element centre, the shear of that element
+        index = g.nele // 2 + 3
+        lon = float(g.lonc[index])
+        lat = float(g.latc[index])
+        for reference in ['surface', 'bed']:
+            dveldz = util.verti_shear_at_point(lon, lat, reference=reference,
+                                               graph=False)
+            np.testing.assert_allclose(dveldz, self.shear[:, :, index], rtol=1e-3)
+        dveldz = util.verti_shear_at_point(lon, lat, time_ind=[1, 4], bot_lvl=1,
+                                           reference='bed', graph=False)
+        np.testing.assert_allclose(dveldz, self.shear[[1, 4], 1:, index], rtol=1e-3)
+        util.verti_shear()
+        dveldz = util.verti_shear_at_point(lon, lat, t_start=2, t_end=5,
+                                           graph=False)
+        np.testing.assert_allclose(dveldz, self.shear[2:5, :, index], rtol=1e-3)
+
+class TestTransect(ThreeDTestCase):
+    def samples(self, pt_lon, pt_lat, npts):
+        """Regularly spaced points along the polyline, as transect"""
+        R = 6371000.0
+        x = np.radians(pt_lon) * R * np.cos(np.radians(np.mean(pt_lat)))
+        y = np.radians(pt_lat) * R
+        vertices = np.append(0.0, np.cumsum(np.hypot(np.diff(x), np.diff(y))))
+        dist = np.linspace(0.0, vertices[-1], npts)
+        return dist, np.interp(dist, vertices, pt_lon), np.interp(dist, vertices, pt_lat)
+
+    def setUp(self):
+        g = self.model.Grid
+        lon = np.asarray(g.lon[:], dtype=np.float64)
+        lat = np.asarray(g.lat[:], dtype=np.float64)
+        #Polyline across the mesh, its last leg leaving it
+        self.pt_lon = np.percentile(lon, [10, 50, 80, 100]) + [0, 0, 0, 0.005]
+        self.pt_lat = np.percentile(lat, [20, 80, 40, 50])
+        self.dist, self.lon, self.lat = self.samples(self.pt_lon, self.pt_lat, 60)
+        self.index = self.model.Util3D.containing_element(self.lon, self.lat)
+        self.outside = g.triangle.get_trifinder()(self.lon, self.lat) == -1
+        self.assertTrue(self.outside.any() and not self.outside.all())
+
+    def assertSameSection(self, actual, expected):
+        mask = np.broadcast_to(self.outside, expected.shape)
+        np.testing.assert_array_equal(np.ma.getmaskarray(actual), mask)
+        np.testing.assert_allclose(actual.compressed(),
+                                   np.ma.masked_array(expected, mask=mask).compressed(),
+                                   rtol=1e-6)
+
+    def test_polyline(self):
+        util = self.model.Util3D
+        u = np.asarray(self.model.Variables.u[:], dtype=np.float64)
+        for chunk in [[], 3]:
+            dist, depth, values = util.transect('u', self.pt_lon, self.pt_lat,
+                                                npts=60, chunk=chunk)
+            np.testing.assert_allclose(dist, self.dist)
+            self.assertEqual(values.shape, (u.shape[0], u.shape[1], 60))
+            self.assertSameSection(values, u[:, :, self.index])
+            self.assertSameSection(depth, self.depth[:, :, self.index])
+
+    def test_time(self):
+        util = self.model.Util3D
+        u = np.asarray(self.model.Variables.u[:], dtype=np.float64)
+        t = [1, 2, 5]
+        dist, depth, values = util.transect(u, self.pt_lon, self.pt_lat, npts=60,
+                                            time_ind=t, chunk=2)
+        self.assertSameSection(values, u[t][:, :, self.index])
+        self.assertSameSection(depth, self.depth[t][:, :, self.index])
+        #From the computed depth
+        util.depth()
+        dist, depth, values = util.transect(u, self.pt_lon, self.pt_lat, npts=60,
+                                            t_start=2, t_end=6)
+        self.assertSameSection(values, u[2:6][:, :, self.index])
+        self.assertSameSection(depth, self.depth[2:6][:, :, self.index])
+
+    def test_level_element(self):
+        util = self.model.Util3D
+        var = np.asarray(self.model.Variables.u[3], dtype=np.float64)
+        #Straight line within the mesh
+        dist, lon, lat = self.samples(self.pt_lon[:2], self.pt_lat[:2], 60)
+        index = util.containing_element(lon, lat)
+        dist, depth, values = util.transect(var, self.pt_lon[:2], self.pt_lat[:2],
+                                            npts=60)
+        self.assertEqual(values.shape, var.shape[:1] + (60,))
+        self.assertFalse(np.ma.is_masked(values))
+        np.testing.assert_allclose(values, var[:, index])
+        np.testing.assert_allclose(depth, self.depth[:, :, index], rtol=1e-6)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+from __future__ import division
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+
+local = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(local)
+sys.path.append(os.path.join(local, '..'))
+sys.path.append(os.path.join(local, '..', 'pyseidon', 'utilities'))
+from synthetic import write_fvcom
+from pyseidon import FVCOM
+from miscellaneous import element_neighbours
+
+class TestVorticity(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        filename = os.path.join(cls.tmp, 'synthetic.nc')
+        write_fvcom(filename, nx=12, ny=9, ntime=5, nlevel=3)
+        cls.model = FVCOM(filename)
+        g = cls.model.Grid
+        #Solid body rotation about the domain centre, rate varying with
+        #time and level, plus a uniform current: vorticity = 2 * rate
+        xc = np.asarray(g.xc[:], dtype=np.float64)
+        yc = np.asarray(g.yc[:], dtype=np.float64)
+        rng = np.random.RandomState(0)
+        cls.rate = rng.uniform(-1e-4, 1e-4, (5, 3))
+        omega = cls.rate[:, :, None]
+        cls.model.Variables.u = 0.2 - omega * (yc - yc.mean())[None, None, :]
+        cls.model.Variables.v = -0.1 + omega * (xc - xc.mean())[None, None, :]
+        #Interior elements, where the least-squares gradient is exact
+        cls.interior = np.where((element_neighbours(g.trinodes[:]) >= 0).all(axis=1))[0]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def tearDown(self):
+        if hasattr(self.model.Variables, 'vorticity'):
+            del self.model.Variables.vorticity
+
+    def assertVorticity(self, vort, t=slice(None), level=slice(None)):
+        expected = 2.0 * self.rate[t][:, level]
+        np.testing.assert_allclose(vort[:, :, self.interior],
+            np.repeat(expected[:, :, None], self.interior.shape[0], axis=2),
+            rtol=1e-3, atol=1e-9)
+
+    def test_vorticity(self):
+        util = self.model.Util3D
+        for chunk in [[], 2]:
+            util.vorticity(chunk=chunk)
+            self.assertVorticity(np.asarray(self.model.Variables.vorticity))
+            del self.model.Variables.vorticity
+
+    def test_vorticity_over_period(self):
+        util = self.model.Util3D
+        t = np.array([0, 2, 3])
+        for chunk in [[], 2]:
+            vort = util.vorticity_over_period(time_ind=t, chunk=chunk)
+            self.assertVorticity(vort, t)
+            vort = util.vorticity_over_period(time_ind=t, level=[1, 2],
+                                              chunk=chunk)
+            self.assertVorticity(vort, t, slice(1, 3))
+            vort = util.vorticity_over_period(t_start=1, t_end=4, level=[0, 2],
+                                              chunk=chunk)
+            self.assertVorticity(vort, slice(1, 4), [0, 2])
+        #Already computed
+        util.vorticity()
+        vort = util.vorticity_over_period(time_ind=t, level=[1])
+        self.assertVorticity(vort, t, slice(1, 2))
+
+if __name__ == '__main__':
+    unittest.main()